@@ -1,7 +1,13 @@
-from .models import Group, Event, RSVP, Post
-from django.contrib import admin
+from .models import Group, Event, RSVP, Post, OutboundMessage, WebhookEndpoint, WebhookDelivery, ArchivedEvent
+from django.contrib import admin, messages
 from users.models import GroupRole
-from django.db import transaction
+from django.urls import reverse
+from events import deletion
+
+def report_deletion(model_admin, request, job):
+    if job['status'] != 'done':
+        url = reverse('deletion_status', args=[job['id']])
+        model_admin.message_user(request, f"Deleting {job['label']} in the background; progress: {url}", messages.WARNING)
 
 class GroupRoleInline(admin.TabularInline):
     model = GroupRole
@@ -25,14 +31,12 @@ class EventAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return request.user.is_superuser
     
+    def delete_model(self, request, obj):
+        report_deletion(self, request, deletion.start(Event.objects.filter(pk=obj.pk), f'event "{obj}"', request.user))
+
     def delete_queryset(self, request, queryset):
-        """Override to handle bulk deletion with proper cascade"""
-        with transaction.atomic():
-            for event in queryset:
-                # Delete related RSVPs first
-                event.rsvps.all().delete()
-                # Delete the event
-                event.delete()
+        """Delete in batches (see events.deletion), in the background for big cascades"""
+        report_deletion(self, request, deletion.start(queryset, f'{queryset.count()} events', request.user))
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('name', 'description', 'website', 'contact_email', 'telegram_channel')
@@ -42,18 +46,12 @@ class GroupAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).prefetch_related('events', 'group_roles')
     
+    def delete_model(self, request, obj):
+        report_deletion(self, request, deletion.start(Group.objects.filter(pk=obj.pk), f'group "{obj}"', request.user))
+
     def delete_queryset(self, request, queryset):
-        """Override to handle bulk deletion with proper cascade"""
-        with transaction.atomic():
-            for group in queryset:
-                # Delete related events and their RSVPs
-                for event in group.event_set.all():
-                    event.rsvps.all().delete()
-                    event.delete()
-                # Delete related group roles
-                group.group_roles.all().delete()
-                # Delete the group
-                group.delete()
+        """Delete in batches (see events.deletion), in the background for big cascades"""
+        report_deletion(self, request, deletion.start(queryset, f'{queryset.count()} groups', request.user))
 
 class RSVPAdmin(admin.ModelAdmin):
     list_display = ('user', 'event', 'status', 'timestamp')
@@ -70,8 +68,42 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('title', 'content')
     readonly_fields = ('published',)
 
+class OutboundMessageAdmin(admin.ModelAdmin):
+    list_display = ('chat_id', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('chat_id', 'text')
+    readonly_fields = ('created_at', 'sent_at')
+
+class WebhookEndpointAdmin(admin.ModelAdmin):
+    list_display = ('url', 'group', 'is_active', 'max_concurrency', 'created_by', 'created_at')
+    list_filter = ('is_active',)
+    search_fields = ('url', 'group__name')
+    readonly_fields = ('created_at',)
+
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('endpoint_id', 'event_type', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'event_type')
+    readonly_fields = ('created_at', 'sent_at')
+    raw_id_fields = ('endpoint',)
+
+class ArchivedEventAdmin(admin.ModelAdmin):
+    list_display = ('title', 'group_id', 'date', 'status', 'confirmed_count', 'archived_at')
+    list_filter = ('status',)
+    search_fields = ('title',)
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # Register your models here.
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Event, EventAdmin)
 admin.site.register(RSVP, RSVPAdmin)
 admin.site.register(Post, PostAdmin)
+admin.site.register(OutboundMessage, OutboundMessageAdmin)
+admin.site.register(WebhookEndpoint, WebhookEndpointAdmin)
+admin.site.register(WebhookDelivery, WebhookDeliveryAdmin)
+admin.site.register(ArchivedEvent, ArchivedEventAdmin)
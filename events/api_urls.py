@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .api_views import GroupViewSet, EventViewSet, UserViewSet, CustomAPIRootView
+from .api_views import GroupViewSet, EventViewSet, UserViewSet, ChangesView, CustomAPIRootView
 
 # Create a router and register our viewsets with it
 router = DefaultRouter()
@@ -11,5 +11,6 @@ router.register(r'users', UserViewSet)
 
 # The API URLs are now determined automatically by the router
 urlpatterns = [
+    path('changes/', ChangesView.as_view(), name='api-changes'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
@@ -1,26 +1,95 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from datetime import datetime
-from django.db.models import Q
+from django.db.models import Q, Count
+from collections import defaultdict
 from rest_framework.views import APIView
 from django.shortcuts import render
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.contrib.auth.models import User
 
-from .models import Group, Event, RSVP
+from .caching import cached_api_view
+from .search import search_events
+from .models import Group, Event, RSVP, Change
+from users.models import Profile
 from .serializers import (
-    GroupSerializer, EventSerializer, EventDetailSerializer, RSVPSerializer, UserLookupSerializer
+    GroupSerializer, EventSerializer, EventDetailSerializer, RSVPSerializer, UserLookupSerializer, EventRows
 )
 
 
+# Columns read by the serializers; everything else stays in the database
+GROUP_COLUMNS = (
+    'id', 'name', 'description', 'description_text', 'website', 'contact_email', 'telegram_channel', 'telegram_webhook_channel'
+)
+EVENT_COLUMNS = (
+    'id', 'title', 'group', 'date', 'start_time', 'end_time', 'description', 'description_text', 'address', 'city', 'state',
+    'status', 'age_restriction', 'capacity', 'waitlist_enabled', 'attendee_list_public', 'enable_rsvp_questions',
+    *(f'group__{column}' for column in GROUP_COLUMNS),
+)
+USER_COLUMNS = (
+    'id', 'username', 'profile__id', 'profile__user', 'profile__display_name',
+    'profile__discord_username', 'profile__telegram_username',
+)
+# Most events ?ids= may ask for at once
+MAX_BATCH_IDS = 100
+# Results /events/search/ returns by default and at most
+SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+
+
+def event_queryset():
+    """Active events with their group joined in, loading only serialized columns"""
+    return Event.objects.filter(status='active').select_related('group').only(*EVENT_COLUMNS)
+
+
+def parse_ids(value):
+    """Ids from a comma-separated query parameter"""
+    try:
+        ids = {int(part) for part in value.split(',') if part.strip()}
+    except ValueError:
+        raise ValidationError({'ids': 'Expected a comma-separated list of event ids'})
+    if len(ids) > MAX_BATCH_IDS:
+        raise ValidationError({'ids': f'At most {MAX_BATCH_IDS} ids can be fetched at once'})
+    return ids
+
+
+def paginated(view, queryset, serialize):
+    """Respond with one keyset page of queryset, or all of it if pagination is turned off"""
+    page = view.paginate_queryset(queryset)
+    if page is None:
+        return Response(serialize(queryset))
+    return view.get_paginated_response(serialize(page))
+
+
+def rsvp_visibility(viewer, user):
+    """
+    Which of user's RSVPs viewer may see: all of them for the user themselves
+    and staff, otherwise those for events with a public attendee list or
+    that the viewer organizes.
+    """
+    if viewer.is_authenticated and (viewer.id == user.id or viewer.is_staff):
+        return Q()
+    visible = Q(event__attendee_list_public=True)
+    if viewer.is_authenticated:
+        visible |= Q(event__organizer_id=viewer.id)
+    return visible
+
+
+def rsvp_queryset(event, rsvp_status):
+    return event.rsvps.filter(status=rsvp_status).select_related('user').only(
+        'id', 'event', 'user__id', 'user__username', 'name', 'timestamp', 'status', 'question1', 'question2', 'question3'
+    ).order_by('timestamp')
+
+
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     """API viewset for User model - read-only"""
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('profile').only(*USER_COLUMNS).order_by('id')
     serializer_class = UserLookupSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     
@@ -50,18 +119,17 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
         if telegram_username.startswith('@'):
             telegram_username = telegram_username[1:]
         
-        try:
-            user = User.objects.get(profile__telegram_username__iexact=telegram_username)
-            serializer = UserLookupSerializer(user)
-            return Response({
-                'found': True,
-                'user': serializer.data
-            })
-        except User.DoesNotExist:
+        profile = Profile.find_by_telegram(username=telegram_username)
+        if profile is None:
             return Response({
                 'found': False,
                 'message': f'No user found with Telegram username: {telegram_username}'
             }, status=status.HTTP_404_NOT_FOUND)
+        serializer = UserLookupSerializer(profile.user)
+        return Response({
+            'found': True,
+            'user': serializer.data
+        })
 
     @swagger_auto_schema(
         operation_description="Get events registered by a specific user (respecting privacy settings)",
@@ -86,74 +154,60 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
             )
         
         try:
-            user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
+            user = User.objects.select_related('profile').only(*USER_COLUMNS).get(id=user_id)
+        except (User.DoesNotExist, ValueError):
             return Response({
                 'error': f'User with ID {user_id} not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Get user's RSVPs
-        user_rsvps = RSVP.objects.filter(user=user).select_related('event', 'event__group')
-        
-        # Filter events based on privacy settings
-        visible_events = []
-        for rsvp in user_rsvps:
-            event = rsvp.event
-            
-            # Skip cancelled events
-            if event.status == 'cancelled':
-                continue
-            
-            # Check if event is visible based on privacy settings
-            is_visible = False
-            
-            # Event is visible if:
-            # 1. User is requesting their own events
-            # 2. Event has public attendee list
-            # 3. User is authenticated and is an organizer/admin
-            if (request.user.is_authenticated and 
-                (request.user == user or 
-                 request.user == event.organizer or 
-                 request.user.is_staff)):
-                is_visible = True
-            elif event.attendee_list_public:
-                is_visible = True
-            
-            if is_visible:
-                event_data = {
-                    'event_id': event.id,
-                    'event_title': event.title,
-                    'group_name': event.group.name,
-                    'event_date': event.date,
-                    'rsvp_status': rsvp.status,
-                    'rsvp_timestamp': rsvp.timestamp,
-                    'attendee_list_public': event.attendee_list_public
-                }
-                visible_events.append(event_data)
-        
-        # Sort by event date (most recent first)
-        visible_events.sort(key=lambda x: x['event_date'], reverse=True)
+        # Get user's RSVPs, skipping cancelled events, most recent event first
+        rsvps = RSVP.objects.filter(user=user).exclude(event__status='cancelled').order_by('-event__date')
+        rsvps = rsvps.filter(rsvp_visibility(request.user, user))
+        page = self.paginate_queryset(rsvps.values(
+            'id', 'status', 'timestamp', 'event_id', 'event__title', 'event__group__name', 'event__date', 'event__attendee_list_public'
+        ))
         
+        events = [{
+            'event_id': row['event_id'],
+            'event_title': row['event__title'],
+            'group_name': row['event__group__name'],
+            'event_date': row['event__date'],
+            'rsvp_status': row['status'],
+            'rsvp_timestamp': row['timestamp'],
+            'attendee_list_public': row['event__attendee_list_public']
+        } for row in page]
         return Response({
             'user_id': user_id,
             'username': user.username,
             'display_name': user.profile.get_display_name() if hasattr(user, 'profile') else user.username,
-            'events': visible_events,
-            'count': len(visible_events)
+            'events': events,
+            # Events on this page; counting them all would defeat the keyset pagination
+            'count': len(events),
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
         })
 
 
 class GroupViewSet(viewsets.ReadOnlyModelViewSet):
     """API viewset for Group model - read-only"""
-    queryset = Group.objects.all()
+    queryset = Group.objects.only(*GROUP_COLUMNS).order_by('id')
     serializer_class = GroupSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+
+    @cached_api_view(['groups'])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_api_view(['groups'])
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     @action(detail=True, methods=['get'])
+    @cached_api_view(['groups', 'events'], time_sensitive=True)
     def events(self, request, pk=None):
         """Get all events for a specific group"""
         group = self.get_object()
-        events = Event.objects.filter(group=group, status='active')
+        events = event_queryset().filter(group=group)
         
         # Filter by upcoming/past events
         event_type = request.query_params.get('type', 'all')
@@ -172,13 +226,13 @@ class GroupViewSet(viewsets.ReadOnlyModelViewSet):
         else:
             events = events.order_by('date', 'start_time')
         
-        serializer = EventSerializer(events, many=True)
-        return Response(serializer.data)
+        rows = EventRows.from_request(request)
+        return paginated(self, rows.values(events), rows.serialize)
 
 
 class EventViewSet(viewsets.ReadOnlyModelViewSet):
     """API viewset for Event model - read-only"""
-    queryset = Event.objects.filter(status='active')
+    queryset = event_queryset()
     permission_classes = [IsAuthenticatedOrReadOnly]
     
     def get_serializer_class(self):
@@ -189,8 +243,18 @@ class EventViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         """Filter queryset based on query parameters"""
-        queryset = Event.objects.filter(status='active')
+        queryset = event_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.annotate(
+                attendee_count=Count('rsvps', filter=Q(rsvps__status='confirmed')),
+                waitlist_count=Count('rsvps', filter=Q(rsvps__status='waitlisted')),
+            )
         
+        # Batch fetch
+        ids = self.request.query_params.get('ids', None)
+        if ids is not None:
+            queryset = queryset.filter(id__in=parse_ids(ids))
+
         # Filter by group
         group_id = self.request.query_params.get('group', None)
         if group_id:
@@ -236,8 +300,23 @@ class EventViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(age_restriction=age_restriction)
         
         return queryset.order_by('date', 'start_time')
+
+    @cached_api_view(['events', 'groups'], time_sensitive=True)
+    def list(self, request, *args, **kwargs):
+        # Same output as EventSerializer, built from .values() rows
+        rows = EventRows.from_request(request)
+        values = rows.values(self.filter_queryset(self.get_queryset()))
+        if 'ids' in request.query_params:
+            # A batch is already bounded, so it comes back in one response
+            return Response({'next': None, 'previous': None, 'results': rows.serialize(values)})
+        return paginated(self, values, rows.serialize)
+
+    @cached_api_view(['event:{pk}', 'event:{pk}:rsvps', 'groups'])
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     @action(detail=True, methods=['get'])
+    @cached_api_view(['event:{pk}', 'event:{pk}:rsvps', 'names'])
     def attendees(self, request, pk=None):
         """Get attendees for a specific event"""
         event = self.get_object()
@@ -249,11 +328,11 @@ class EventViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        rsvps = event.rsvps.filter(status='confirmed').order_by('timestamp')
-        serializer = RSVPSerializer(rsvps, many=True)
-        return Response(serializer.data)
+        rsvps = rsvp_queryset(event, 'confirmed')
+        return paginated(self, rsvps, lambda page: RSVPSerializer(page, many=True).data)
     
     @action(detail=True, methods=['get'])
+    @cached_api_view(['event:{pk}', 'event:{pk}:rsvps', 'names'])
     def waitlist(self, request, pk=None):
         """Get waitlist for a specific event"""
         event = self.get_object()
@@ -265,11 +344,11 @@ class EventViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        rsvps = event.rsvps.filter(status='waitlisted').order_by('timestamp')
-        serializer = RSVPSerializer(rsvps, many=True)
-        return Response(serializer.data)
+        rsvps = rsvp_queryset(event, 'waitlisted')
+        return paginated(self, rsvps, lambda page: RSVPSerializer(page, many=True).data)
 
     @action(detail=False, methods=['get'])
+    @cached_api_view(['events', 'groups'], time_sensitive=True)
     def upcoming(self, request):
         """Get upcoming events"""
         now = timezone.now()
@@ -278,17 +357,122 @@ class EventViewSet(viewsets.ReadOnlyModelViewSet):
             (Q(date=now.date()) & Q(end_time__gt=now.time()))
         ).order_by('date', 'start_time')
         
-        serializer = self.get_serializer(events, many=True)
-        return Response(serializer.data)
+        rows = EventRows.from_request(request)
+        return paginated(self, rows.values(events), rows.serialize)
     
+    @swagger_auto_schema(
+        operation_description="Search upcoming events by title, group, city, state and description. "
+                              "Every word matches as a prefix, so partial input works for type-ahead; "
+                              "the best matches come first.",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, description="Search words", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('limit', openapi.IN_QUERY, description=f"Number of results (default {SEARCH_LIMIT}, max {MAX_SEARCH_LIMIT})", type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            200: openapi.Response('Success - Matching events'),
+            400: 'Bad Request - Missing q or invalid limit'
+        }
+    )
     @action(detail=False, methods=['get'])
+    @cached_api_view(['events', 'groups'], time_sensitive=True)
+    def search(self, request):
+        """Upcoming events matching ?q=, best match first"""
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            raise ValidationError({'q': 'A search term is required'})
+        try:
+            limit = int(request.query_params.get('limit', SEARCH_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': 'Expected a number'})
+        limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+        now = timezone.now()
+        events = self.get_queryset().filter(
+            Q(date__gt=now.date()) |
+            (Q(date=now.date()) & Q(end_time__gt=now.time()))
+        )
+        rows = EventRows.from_request(request)
+        values = rows.values(search_events(events, term, ranked=True))[:limit]
+        return Response({'results': rows.serialize(values)})
+
+    @action(detail=False, methods=['get'])
+    @cached_api_view(['events', 'groups'], time_sensitive=True)
     def today(self, request):
         """Get events happening today"""
         today = timezone.now().date()
         events = self.get_queryset().filter(date=today).order_by('start_time')
         
-        serializer = self.get_serializer(events, many=True)
-        return Response(serializer.data)
+        rows = EventRows.from_request(request)
+        return paginated(self, rows.values(events), rows.serialize)
+
+
+class ChangesView(APIView):
+    """
+    Groups, events and RSVPs changed since a cursor, oldest change first.
+    Deleted objects and cancelled events come back as tombstones without
+    data. Each object appears once, in its latest state.
+    """
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    default_limit = 500
+    max_limit = 1000
+
+    @swagger_auto_schema(
+        operation_description="Get groups, events and RSVPs changed since a cursor",
+        manual_parameters=[
+            openapi.Parameter('since', openapi.IN_QUERY, description="Cursor from the previous response; omit to start from the beginning", type=openapi.TYPE_STRING),
+            openapi.Parameter('limit', openapi.IN_QUERY, description="Most changes to return (max 1000)", type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            200: openapi.Response('Success - Changes retrieved'),
+            400: 'Bad Request - Invalid cursor or limit',
+        }
+    )
+    def get(self, request):
+        try:
+            since = int(request.query_params.get('since') or 0)
+            limit = min(int(request.query_params.get('limit') or self.default_limit), self.max_limit)
+        except ValueError:
+            return Response({'error': '"since" and "limit" must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if since < 0 or limit < 1:
+            return Response({'error': '"since" and "limit" must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = list(Change.objects.filter(id__gt=since).order_by('id')[:limit + 1])
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        # One query per kind for the current state of everything still live
+        live = defaultdict(list)
+        for entry in entries:
+            if not entry.deleted:
+                live[entry.kind].append(entry.object_id)
+        data = {kind: self.load(kind, ids, request) for kind, ids in live.items()}
+
+        changes = []
+        for entry in entries:
+            item = data.get(entry.kind, {}).get(entry.object_id)
+            change = {'type': entry.kind, 'id': entry.object_id, 'updated_at': entry.changed_at, 'deleted': item is None}
+            if item is not None:
+                change['data'] = item
+            changes.append(change)
+        return Response({
+            'changes': changes,
+            'cursor': str(entries[-1].id if entries else since),
+            'has_more': has_more,
+        })
+
+    def load(self, kind, ids, request):
+        """Current representation of each visible object, by id"""
+        if kind == 'group':
+            return {group.id: GroupSerializer(group).data for group in Group.objects.only(*GROUP_COLUMNS).filter(id__in=ids)}
+        if kind == 'event':
+            rows = EventRows()
+            return {row['id']: rows.to_representation(row) for row in rows.values(event_queryset().filter(id__in=ids))}
+        rsvps = RSVP.objects.filter(id__in=ids).select_related('user').only(
+            'id', 'event', 'user__id', 'user__username', 'name', 'timestamp', 'status', 'question1', 'question2', 'question3'
+        )
+        # Same rule as the attendees endpoint; hidden RSVPs read as tombstones
+        if not request.user.is_authenticated:
+            rsvps = rsvps.filter(event__attendee_list_public=True)
+        return {rsvp.id: {**RSVPSerializer(rsvp).data, 'event': rsvp.event_id} for rsvp in rsvps}
 
 
 class CustomAPIRootView(APIView):
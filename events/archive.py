@@ -0,0 +1,105 @@
+"""
+Archive tier for past events. Some time after an event ends it is copied,
+with its RSVPs, into the ArchivedEvent/ArchivedRSVP tables in the archive
+database and removed from the hot Event/RSVP tables, which therefore only
+hold current and recently ended events. History stays readable through
+past_events() and user_history().
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from events import deletion
+from events.models import ArchivedEvent, ArchivedRSVP, Event, RSVP
+
+EVENT_COLUMNS = [
+    'id', 'group_id', 'organizer_id', 'title', 'date', 'start_time', 'end_time', 'description_text',
+    'address', 'city', 'state', 'status', 'age_restriction', 'capacity',
+    'question1_text', 'question2_text', 'question3_text',
+]
+RSVP_COLUMNS = ['id', 'event_id', 'user_id', 'name', 'status', 'timestamp', 'question1', 'question2', 'question3']
+
+
+def due_events(now=None):
+    """Events that ended more than ARCHIVE_AFTER_HOURS ago; those without an end time end with their day"""
+    threshold = timezone.localtime((now or timezone.now()) - timedelta(hours=settings.ARCHIVE_AFTER_HOURS))
+    return Event.objects.filter(
+        Q(date__lt=threshold.date())
+        | Q(date=threshold.date(), end_time__isnull=False, end_time__lt=threshold.time())
+    )
+
+
+def archive_events(ids):
+    """
+    Copy the events and their RSVPs into the archive, then remove them from
+    the hot tables. Copies are idempotent, so a run cut short is finished by
+    the next one.
+    Returns:
+        int: Events archived
+    """
+    events = list(Event.objects.filter(pk__in=ids).values(*EVENT_COLUMNS))
+    if not events:
+        return 0
+    dates = {event['id']: event['date'] for event in events}
+    confirmed = dict(
+        RSVP.objects.filter(event_id__in=dates, status='confirmed')
+        .values_list('event_id').annotate(total=Count('id')).order_by()
+    )
+    rsvps = list(RSVP.objects.filter(event_id__in=dates).values(*RSVP_COLUMNS))
+
+    with transaction.atomic(using=router.db_for_write(ArchivedEvent)):
+        ArchivedEvent.objects.bulk_create(
+            [ArchivedEvent(**event, confirmed_count=confirmed.get(event['id'], 0)) for event in events],
+            ignore_conflicts=True,
+        )
+        ArchivedRSVP.objects.bulk_create(
+            [ArchivedRSVP(**rsvp, event_date=dates[rsvp['event_id']]) for rsvp in rsvps],
+            batch_size=500, ignore_conflicts=True,
+        )
+    # Removed as dependents rather than one by one: in batches, with the
+    # change feed and caches updated in bulk
+    deletion.purge(Event.objects.filter(pk__in=dates), root=False)
+    return len(events)
+
+
+def archive_old_events(now=None):
+    """
+    Archive every event that is due, ARCHIVE_BATCH_SIZE events at a time.
+    Runs from the django-q scheduler.
+    Returns:
+        int: Events archived
+    """
+    archived = 0
+    for ids in deletion.batches(due_events(now), settings.ARCHIVE_BATCH_SIZE):
+        archived += archive_events(ids)
+    return archived
+
+
+def past_events(group, limit=None):
+    """
+    A group's ended active events, newest first: those still in the hot
+    table followed by the archived ones.
+    Returns:
+        list: Event and ArchivedEvent instances
+    """
+    now = timezone.localtime()
+    recent = list(group.event_set.filter(
+        Q(date__lt=now.date()) | Q(date=now.date(), end_time__lt=now.time()),
+        status='active',
+    ).order_by('-date', '-start_time')[:limit])
+    if limit is not None and len(recent) >= limit:
+        return recent
+    older = ArchivedEvent.objects.filter(group_id=group.pk, status='active').order_by('-date', '-start_time')
+    return recent + list(older[:limit - len(recent)] if limit is not None else older)
+
+
+def user_history(user, limit=20):
+    """
+    The user's RSVPs to archived events, newest event first.
+    Returns:
+        list: ArchivedRSVP instances with their event loaded
+    """
+    return list(ArchivedRSVP.objects.filter(user_id=user.pk).select_related('event').order_by('-event_date')[:limit])
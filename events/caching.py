@@ -0,0 +1,134 @@
+"""
+Version-stamped caching. Cached values are keyed by the current stamps of
+the data they were built from; bumping a stamp makes every dependent entry
+unreachable at once, without having to know which keys exist. The same
+stamps give API responses their ETag and Last-Modified headers.
+
+Stamps live in the 'state' cache, apart from the entries built on them, so
+culling the bulk 'default' cache never drops a stamp.
+"""
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+from django.utils.connection import ConnectionProxy
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+DEFAULT_TIMEOUT = 600
+
+# The 'state' cache, for small keys that must outlive culling of the bulk
+# cache: version stamps, locks, dedupe markers and counters
+state_cache = ConnectionProxy(caches, 'state')
+
+
+def _stamp_key(name):
+    return f'version:{name}'
+
+
+def get_versions(*names):
+    """
+    Current stamps for the named data sets, created on first use.
+    Returns:
+        list: One stamp per name, in order
+    """
+    keys = [_stamp_key(name) for name in names]
+    found = state_cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        for key, stamp in missing.items():
+            if not state_cache.add(key, stamp, None):
+                # Someone else created it first; use theirs
+                missing[key] = state_cache.get(key, stamp)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump_version(*names):
+    """Invalidate everything cached against these data sets"""
+    stamp = time.time_ns()
+    state_cache.set_many({_stamp_key(name): stamp for name in names}, None)
+
+
+def cached(key, depends_on, build, timeout=DEFAULT_TIMEOUT):
+    """
+    Return the cached value for key, building it with build() when any of the
+    data sets in depends_on has changed since it was stored.
+    """
+    versioned_key = ':'.join([key, *(str(stamp) for stamp in get_versions(*depends_on))])
+    value = cache.get(versioned_key)
+    if value is None:
+        value = build()
+        cache.set(versioned_key, value, timeout)
+    return value
+
+
+def revalidate(request, etag, last_modified):
+    """
+    Check a request's conditional headers against the current validators.
+    Returns:
+        HttpResponse: A 304 if the client's copy is current, otherwise an empty
+            200 carrying the headers for validators_to() to copy onto the real one
+    """
+    validators = HttpResponse()
+    validators['ETag'] = etag
+    validators['Last-Modified'] = http_date(last_modified)
+    # no-cache: clients may keep the body but must revalidate it
+    patch_cache_control(validators, no_cache=True)
+    return get_conditional_response(request, etag=etag, last_modified=last_modified, response=validators)
+
+
+def validators_to(response, validators):
+    """Copy the headers set by revalidate() onto the real response"""
+    for header in ('ETag', 'Last-Modified', 'Cache-Control'):
+        response[header] = validators[header]
+    return response
+
+
+def cached_api_view(depends_on, time_sensitive=False, timeout=DEFAULT_TIMEOUT):
+    """
+    Decorate a DRF view method with ETag/Last-Modified handling and a shared
+    response cache.
+    Args:
+        depends_on (list): Version stamp names the response is built from;
+            '{pk}'-style placeholders are filled from the URL kwargs.
+        time_sensitive (bool): The response also depends on the current time
+            (e.g. "upcoming"), so it is only reused within the same minute.
+        timeout (int): Seconds a rendered response stays in the cache.
+    Clients presenting a current ETag get a 304 without the view running;
+    anyone else asking for the same normalized URL gets the cached bytes.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            stamps = get_versions(*(name.format(**kwargs) for name in depends_on))
+            last_modified = max(stamps) // 10 ** 9
+            params = urlencode(sorted(request.query_params.lists()), doseq=True)
+            variant = [request.path, params, 'user' if request.user.is_authenticated else 'anon']
+            if time_sensitive:
+                minute = int(time.time()) // 60 * 60
+                variant.append(str(minute))
+                last_modified = max(last_modified, minute)
+            etag = '"%s"' % hashlib.md5(':'.join([*variant, *map(str, stamps)]).encode()).hexdigest()
+
+            validators = revalidate(request, etag, last_modified)
+            if validators.status_code == 304:
+                return validators
+
+            key = f'api_response:{etag}'
+            cached_response = cache.get(key)
+            if cached_response is not None:
+                content, content_type = cached_response
+                response = HttpResponse(content, content_type=content_type)
+            else:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                response = self.finalize_response(request, response, *args, **kwargs)
+                response.render()
+                cache.set(key, (response.content, response['Content-Type']), timeout)
+            return validators_to(response, validators)
+        return wrapper
+    return decorator
@@ -0,0 +1,233 @@
+"""
+Chunked cascade deletion. Deleting a group, an event or an account cascades
+to every RSVP, role and notification below it; Django's Collector does that
+in one transaction, which holds the SQLite write lock for the whole cascade.
+purge() removes the dependents first, bottom-up, DELETION_BATCH_SIZE rows at
+a time and each batch in its own short transaction, then deletes the objects
+themselves the ordinary way, so their own signals still run.
+
+Dependents without delete signals are removed with raw bulk DELETEs. Those
+whose signals matter have a bulk hook here that does the same work for a
+whole batch at once; any other model with receivers is deleted normally,
+one batch at a time.
+
+Cascades larger than DELETION_INLINE_LIMIT rows run as a django-q job, whose
+progress is kept in the state cache (see get_job()).
+"""
+import logging
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models, router, transaction
+from django.db.models import signals
+from django.db.models.deletion import get_candidate_relations_to_delete
+from django_q.tasks import async_task
+
+from events import search, webhooks
+from events.caching import bump_version, state_cache
+from events.models import ArchivedEvent, Change, Event, RSVP
+from users.models import AuditLog, Profile
+
+logger = logging.getLogger(__name__)
+
+JOB_TASK = 'events.deletion.run_job'
+JOB_TIMEOUT = 24 * 3600
+# How many levels of the cascade estimate() counts
+ESTIMATE_DEPTH = 3
+
+# model -> (extra columns the hook needs, hook(rows)); rows are dicts with
+# 'id' and those columns, read just before the batch was deleted
+BULK_HOOKS = {}
+
+
+def bulk_hook(model, *fields):
+    """Register what a raw batch delete of model must do instead of its delete signals"""
+    def decorator(hook):
+        BULK_HOOKS[model] = (fields, hook)
+        return hook
+    return decorator
+
+
+@bulk_hook(RSVP, *webhooks.RSVP_ROW_FIELDS)
+def rsvps_deleted(rows):
+    Change.record_many('rsvp', [row['id'] for row in rows], deleted=True)
+    webhooks.rsvps_deleted(rows)
+    bump_version(
+        *{f"event:{row['event_id']}:rsvps" for row in rows},
+        *{f"user:{row['user_id']}:rsvps" for row in rows if row['user_id']},
+    )
+
+
+@bulk_hook(Event)
+def events_deleted(rows):
+    ids = [row['id'] for row in rows]
+    Change.record_many('event', ids, deleted=True)
+    bump_version('events', *(f'event:{pk}' for pk in ids))
+    search.remove_events(ids)
+    # Events moved to the archive keep their id, so entries about them still resolve
+    archived = set(ArchivedEvent.objects.filter(id__in=ids).values_list('id', flat=True))
+    AuditLog.objects.filter(event_id__in=set(ids) - archived).update(event=None)
+
+
+@bulk_hook(Profile)
+def profiles_deleted(rows):
+    bump_version('names')
+
+
+def has_delete_receivers(model):
+    return signals.pre_delete.has_listeners(model) or signals.post_delete.has_listeners(model)
+
+
+def batches(queryset, size=None):
+    """Primary keys of queryset in ascending batches, each read when the previous one is done with"""
+    size = size or settings.DELETION_BATCH_SIZE
+    queryset = queryset.order_by('pk').values_list('pk', flat=True)
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(pk__gt=last)
+        ids = list(page[:size])
+        if not ids:
+            return
+        last = ids[-1]
+        yield ids
+
+
+def purge(queryset, progress=None, root=True):
+    """
+    Delete the queryset's rows and everything that cascades from them.
+    Args:
+        progress (callable, optional): Called with the number of rows removed
+            after each batch, dependents' batches included.
+        root (bool): Delete the rows themselves with QuerySet.delete(), so
+            their signals run; dependents are removed in bulk.
+    Returns:
+        int: Rows deleted, dependents included
+    """
+    model = queryset.model
+    deleted = 0
+    for ids in batches(queryset):
+        deleted += clear_dependents(model, ids, progress)
+        count = delete_rows(model, ids, root)
+        if progress:
+            progress(count)
+        deleted += count
+    return deleted
+
+
+def clear_dependents(model, ids, progress):
+    """Remove or detach the rows that point at ids, as their on_delete says"""
+    deleted = 0
+    for relation in get_candidate_relations_to_delete(model._meta):
+        field = relation.field
+        on_delete = field.remote_field.on_delete
+        related = relation.related_model._base_manager.filter(**{f'{field.name}__in': ids})
+        if on_delete is models.CASCADE:
+            deleted += purge(related, progress, root=False)
+        elif on_delete is models.SET_NULL:
+            for batch in batches(related):
+                with transaction.atomic(using=router.db_for_write(related.model)):
+                    related.model._base_manager.filter(pk__in=batch).update(**{field.name: None})
+        # DO_NOTHING references (other databases) are cleaned up by signals;
+        # PROTECT and the rest are left for the final delete to enforce
+    return deleted
+
+
+def delete_rows(model, ids, root):
+    using = router.db_for_write(model)
+    rows = model._base_manager.using(using).filter(pk__in=ids)
+    hook = BULK_HOOKS.get(model)
+    if root or (hook is None and has_delete_receivers(model)):
+        with transaction.atomic(using=using):
+            return rows.delete()[0]
+    if hook:
+        fields, run_hook = hook
+        before = list(rows.values('id', *fields))
+    with transaction.atomic(using=using):
+        deleted = rows._raw_delete(using)
+    if hook:
+        run_hook(before)
+    return deleted
+
+
+def estimate(queryset, depth=ESTIMATE_DEPTH):
+    """Rough size of queryset's cascade: its rows plus the cascaded rows a few levels down"""
+    total = queryset.count()
+    if depth and total:
+        for relation in get_candidate_relations_to_delete(queryset.model._meta):
+            field = relation.field
+            if field.remote_field.on_delete is models.CASCADE:
+                parents = queryset.values('pk')
+                if router.db_for_read(relation.related_model) != queryset.db:
+                    parents = list(parents.values_list('pk', flat=True))
+                related = relation.related_model._base_manager.filter(**{f'{field.name}__in': parents})
+                total += estimate(related, depth - 1)
+    return total
+
+
+def job_key(job_id):
+    return f'deletion:job:{job_id}'
+
+
+def get_job(job_id):
+    """
+    Returns:
+        dict: 'id', 'label', 'status' (queued, running, done or failed),
+            'deleted' (rows so far), 'requested_by' (user id) and 'error';
+            None if unknown or expired
+    """
+    return state_cache.get(job_key(job_id))
+
+
+def save_job(job):
+    state_cache.set(job_key(job['id']), job, JOB_TIMEOUT)
+
+
+def start(queryset, label, requested_by=None):
+    """
+    Delete the queryset's objects with their cascade: straight away if it is
+    small, otherwise in a background job.
+    Args:
+        label (str): What is being deleted, for progress reports.
+        requested_by (User, optional): Who may follow the job's progress.
+    Returns:
+        dict: The job (see get_job()); its status is 'done' if it ran inline
+    """
+    job = {
+        'id': uuid.uuid4().hex, 'label': label, 'status': 'queued', 'deleted': 0,
+        'requested_by': requested_by.pk if requested_by else None, 'error': '',
+    }
+    pks = list(queryset.values_list('pk', flat=True))
+    model_label = queryset.model._meta.label
+    if estimate(queryset) <= settings.DELETION_INLINE_LIMIT:
+        run(job, model_label, pks)
+        return job
+    save_job(job)
+    async_task(JOB_TASK, job['id'], model_label, pks)
+    return job
+
+
+def run_job(job_id, model_label, pks):
+    """django-q entry point for start()"""
+    job = get_job(job_id) or {'id': job_id, 'label': model_label, 'deleted': 0, 'requested_by': None, 'error': ''}
+    run(job, model_label, pks)
+    return job['deleted']
+
+
+def run(job, model_label, pks):
+    model = apps.get_model(model_label)
+    job['status'] = 'running'
+    save_job(job)
+
+    def progress(count):
+        job['deleted'] += count
+        save_job(job)
+    try:
+        purge(model._base_manager.filter(pk__in=pks), progress)
+    except Exception as e:
+        logger.exception('Deleting %s failed', job['label'])
+        job.update(status='failed', error=str(e))
+        save_job(job)
+        raise
+    job['status'] = 'done'
+    save_job(job)
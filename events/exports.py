@@ -0,0 +1,252 @@
+"""
+Streaming CSV and JSON-lines exports: an event's RSVPs, a group's events and
+the audit log. Rows are read with chunked .iterator() queries and written
+out as they arrive, so an export of any size holds only one chunk in memory
+and the response starts before the last row has been read.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from events.models import ArchivedEvent, ArchivedRSVP, Event, Group, RSVP
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+}
+# Spreadsheet apps run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    """File-like object whose write() hands the line back, for csv.writer"""
+    def write(self, value):
+        return value
+
+
+def csv_cell(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_lines(columns, rows, labels):
+    writer = csv.writer(Echo())
+    yield '\ufeff' + writer.writerow([labels.get(column, column) for column in columns])  # BOM, so Excel reads UTF-8
+    for row in rows:
+        yield writer.writerow([csv_cell(row[column]) for column in columns])
+
+
+def jsonl_lines(columns, rows):
+    for row in rows:
+        yield json.dumps({column: row[column] for column in columns}, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def export_format(request):
+    """The format asked for with ?format=, csv by default; None if unknown"""
+    fmt = request.GET.get('format', 'csv')
+    return fmt if fmt in FORMATS else None
+
+
+def stream(fmt, filename, columns, rows, labels=None):
+    """
+    Args:
+        fmt (str): 'csv' or 'jsonl'.
+        filename (str): Download name, without the extension.
+        columns (list): Keys of each row, in output order.
+        rows (iterable): Dicts, produced lazily.
+        labels (dict, optional): CSV header text for columns, where it isn't the key.
+    """
+    content_type, extension = FORMATS[fmt]
+    lines = csv_lines(columns, rows, labels or {}) if fmt == 'csv' else jsonl_lines(columns, rows)
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    # Tell nginx to pass chunks on instead of buffering the whole export
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def chunks(iterable, size=CHUNK_SIZE):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def local(moment):
+    return timezone.localtime(moment) if moment else None
+
+
+RSVP_COLUMNS = ['name', 'username', 'telegram', 'status', 'rsvp_at', 'answer1', 'answer2', 'answer3']
+
+
+def rsvp_rows(event):
+    """An event's RSVPs with the answers to its questions, in RSVP order"""
+    if isinstance(event, ArchivedEvent):
+        yield from archived_rsvp_rows(event)
+        return
+    rsvps = (
+        RSVP.objects.filter(event=event).order_by('timestamp', 'id')
+        .values_list(
+            'name', 'user__username', 'user__profile__display_name', 'user__profile__telegram_username',
+            'status', 'timestamp', 'question1', 'question2', 'question3',
+        )
+    )
+    statuses = dict(RSVP._meta.get_field('status').choices)
+    for name, username, display_name, telegram, status, timestamp, *answers in rsvps.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            'name': display_name or username or name,
+            'username': username,
+            'telegram': telegram,
+            'status': statuses.get(status, status),
+            'rsvp_at': local(timestamp),
+            **{f'answer{i}': answer for i, answer in enumerate(answers, 1)},
+        }
+
+
+def archived_rsvp_rows(event):
+    """rsvp_rows() for an archived event; the users are in another database, so they are looked up per chunk"""
+    rsvps = (
+        ArchivedRSVP.objects.filter(event_id=event.pk).order_by('timestamp', 'id')
+        .values_list('name', 'user_id', 'status', 'timestamp', 'question1', 'question2', 'question3')
+    )
+    statuses = dict(ArchivedRSVP._meta.get_field('status').choices)
+    for chunk in chunks(rsvps.iterator(chunk_size=CHUNK_SIZE)):
+        users = {
+            user_id: rest for user_id, *rest in User.objects.filter(id__in={row[1] for row in chunk} - {None})
+            .values_list('id', 'username', 'profile__display_name', 'profile__telegram_username')
+        }
+        for name, user_id, status, timestamp, *answers in chunk:
+            username, display_name, telegram = users.get(user_id, (None, None, None))
+            yield {
+                'name': display_name or username or name,
+                'username': username,
+                'telegram': telegram,
+                'status': statuses.get(status, status),
+                'rsvp_at': local(timestamp),
+                **{f'answer{i}': answer for i, answer in enumerate(answers, 1)},
+            }
+
+
+def rsvp_columns(event):
+    """RSVP_COLUMNS with the answer columns named after the event's questions"""
+    # Archived events don't keep the switch; their question texts are enough
+    enabled = getattr(event, 'enable_rsvp_questions', True)
+    questions = [event.question1_text, event.question2_text, event.question3_text] if enabled else []
+    labels = {f'answer{i}': text for i, text in enumerate(questions, 1) if text}
+    return [column for column in RSVP_COLUMNS if not column.startswith('answer') or column in labels], labels
+
+
+GROUP_EVENT_COLUMNS = [
+    'id', 'title', 'date', 'start_time', 'end_time', 'status', 'organizer', 'address', 'city', 'state',
+    'capacity', 'confirmed', 'waitlisted', 'url',
+]
+
+
+def group_event_rows(group):
+    """Every event of a group, newest first, with its RSVP counts; archived events follow the rest"""
+    yield from current_group_event_rows(group)
+    yield from archived_group_event_rows(group)
+
+
+def current_group_event_rows(group):
+    site_url = settings.SITE_URL.rstrip('/')
+    events = (
+        Event.objects.filter(group=group).order_by('-date', '-start_time', '-id')
+        .values_list(
+            'id', 'title', 'date', 'start_time', 'end_time', 'status', 'organizer__username',
+            'address', 'city', 'state', 'capacity',
+        )
+    )
+    for chunk in chunks(events.iterator(chunk_size=CHUNK_SIZE)):
+        # One counting query per chunk instead of two per event
+        counts = {}
+        for event_id, status, total in (
+            RSVP.objects.filter(event_id__in=[row[0] for row in chunk], status__in=['confirmed', 'waitlisted'])
+            .values_list('event_id', 'status').annotate(total=Count('id')).order_by()
+        ):
+            counts[event_id, status] = total
+        for event_id, *values in chunk:
+            row = dict(zip(GROUP_EVENT_COLUMNS[1:11], values))
+            yield {
+                'id': event_id, **row,
+                'confirmed': counts.get((event_id, 'confirmed'), 0),
+                'waitlisted': counts.get((event_id, 'waitlisted'), 0),
+                'url': site_url + reverse('event_detail', args=[event_id]),
+            }
+
+
+def archived_group_event_rows(group):
+    site_url = settings.SITE_URL.rstrip('/')
+    events = (
+        ArchivedEvent.objects.filter(group_id=group.pk).order_by('-date', '-start_time', '-id')
+        .values_list(
+            'id', 'title', 'date', 'start_time', 'end_time', 'status', 'organizer_id',
+            'address', 'city', 'state', 'capacity', 'confirmed_count',
+        )
+    )
+    for chunk in chunks(events.iterator(chunk_size=CHUNK_SIZE)):
+        # The confirmed count was stored when the event was archived
+        waitlisted = dict(
+            ArchivedRSVP.objects.filter(event_id__in=[row[0] for row in chunk], status='waitlisted')
+            .values_list('event_id').annotate(total=Count('id')).order_by()
+        )
+        organizers = dict(User.objects.filter(id__in={row[6] for row in chunk} - {None}).values_list('id', 'username'))
+        for event_id, *values, confirmed in chunk:
+            row = dict(zip(GROUP_EVENT_COLUMNS[1:11], values))
+            yield {
+                'id': event_id, **row,
+                'organizer': organizers.get(row['organizer']),
+                'confirmed': confirmed,
+                'waitlisted': waitlisted.get(event_id, 0),
+                'url': site_url + reverse('event_detail', args=[event_id]),
+            }
+
+
+AUDIT_COLUMNS = ['timestamp', 'action', 'user', 'target_user', 'group', 'event', 'description', 'ip_address', 'additional_data']
+
+
+def audit_rows(queryset):
+    """
+    Audit log entries from queryset. The entries live in their own database,
+    so the names they point at are looked up in bulk, one chunk at a time.
+    """
+    rows = queryset.order_by('-timestamp', '-id').values(
+        'timestamp', 'action', 'user_id', 'target_user_id', 'group_id', 'event_id',
+        'description', 'ip_address', 'additional_data',
+    )
+    actions = dict(queryset.model.ACTION_CHOICES)
+    for chunk in chunks(rows.iterator(chunk_size=CHUNK_SIZE)):
+        user_ids = {row[key] for row in chunk for key in ('user_id', 'target_user_id')} - {None}
+        users = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+        groups = dict(Group.objects.filter(id__in={row['group_id'] for row in chunk} - {None}).values_list('id', 'name'))
+        event_ids = {row['event_id'] for row in chunk} - {None}
+        events = dict(Event.objects.filter(id__in=event_ids).values_list('id', 'title'))
+        if event_ids - events.keys():
+            events.update(ArchivedEvent.objects.filter(id__in=event_ids - events.keys()).values_list('id', 'title'))
+        for row in chunk:
+            yield {
+                'timestamp': local(row['timestamp']),
+                'action': actions.get(row['action'], row['action']),
+                'user': users.get(row['user_id']),
+                'target_user': users.get(row['target_user_id']),
+                'group': groups.get(row['group_id']),
+                'event': events.get(row['event_id']),
+                'description': row['description'],
+                'ip_address': row['ip_address'],
+                'additional_data': row['additional_data'],
+            }
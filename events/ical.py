@@ -0,0 +1,182 @@
+"""
+iCalendar (.ics) feeds for calendar apps: site-wide, per group and per user.
+Feeds are stored fully rendered in the cache and only rebuilt when a version
+stamp they depend on changes. Each event's VEVENT block is cached on its own
+as well, so a rebuild only renders the events that actually changed.
+"""
+import hashlib
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+
+from events.caching import DEFAULT_TIMEOUT, cached, get_versions
+from events.models import Event, Group
+
+EVENT_COLUMNS = [
+    'id', 'title', 'date', 'start_time', 'end_time', 'description_text',
+    'address', 'city', 'state', 'updated_at', 'group__name',
+]
+# RSVP statuses that put an event on the attendee's own calendar
+CALENDAR_STATUSES = ['confirmed', 'maybe', 'waitlisted']
+# Clients poll hourly; the stamps decide freshness, this only bounds memory
+FEED_TIMEOUT = 24 * 3600
+TOKEN_SALT = 'events.ical.user'
+
+
+def escape(text):
+    """Escape a TEXT property value"""
+    return (
+        (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """Split a content line into lines of at most 75 octets, as RFC 5545 requires"""
+    encoded = line.encode()
+    pieces = []
+    while len(encoded) > 75:
+        # Continuation lines start with a space, which counts towards their 75
+        cut = 75 if not pieces else 74
+        while (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1  # Don't split a UTF-8 sequence
+        pieces.append(encoded[:cut])
+        encoded = encoded[cut:]
+    pieces.append(encoded)
+    return b'\r\n '.join(pieces).decode()
+
+
+def utc_stamp(moment):
+    return moment.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def render_event(row):
+    """The VEVENT block for one EVENT_COLUMNS row, with CRLF line endings"""
+    tz = timezone.get_current_timezone()
+    host = urlparse(settings.SITE_URL).hostname or 'fursvp'
+    url = settings.SITE_URL.rstrip('/') + reverse('event_detail', args=[str(row['id'])])
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:event-{row['id']}@{host}",
+        f"DTSTAMP:{utc_stamp(row['updated_at'])}",
+        f"LAST-MODIFIED:{utc_stamp(row['updated_at'])}",
+    ]
+    if row['start_time'] is None:
+        lines += [
+            f"DTSTART;VALUE=DATE:{row['date']:%Y%m%d}",
+            f"DTEND;VALUE=DATE:{row['date'] + timedelta(days=1):%Y%m%d}",
+        ]
+    else:
+        start = timezone.make_aware(datetime.combine(row['date'], row['start_time']), tz)
+        lines.append(f'DTSTART:{utc_stamp(start)}')
+        if row['end_time'] is not None:
+            end = timezone.make_aware(datetime.combine(row['date'], row['end_time']), tz)
+            if end < start:
+                end += timedelta(days=1)  # Runs past midnight
+            if end > start:
+                lines.append(f'DTEND:{utc_stamp(end)}')
+    location = ', '.join(part for part in (row['address'], row['city'], row['state']) if part)
+    description = '\n\n'.join(part for part in (row['group__name'], row['description_text'], url) if part)
+    lines += [
+        f"SUMMARY:{escape(row['title'])}",
+        f'DESCRIPTION:{escape(description)}',
+        f'URL:{url}',
+        'STATUS:CONFIRMED',
+    ]
+    if location:
+        lines.append(f'LOCATION:{escape(location)}')
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) + '\r\n' for line in lines)
+
+
+def event_blocks(rows):
+    """VEVENT blocks for rows, rendering only those missing from the cache"""
+    groups, *stamps = get_versions('groups', *(f"event:{row['id']}" for row in rows))
+    keys = [f"ical:event:{row['id']}:{groups}:{stamp}" for row, stamp in zip(rows, stamps)]
+    found = cache.get_many(keys)
+    rendered = {key: render_event(row) for key, row in zip(keys, rows) if key not in found}
+    if rendered:
+        cache.set_many(rendered, DEFAULT_TIMEOUT)
+    found.update(rendered)
+    return [found[key] for key in keys]
+
+
+def render_calendar(name, rows):
+    header = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//FURsvp//Events//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape(name)}',
+        'REFRESH-INTERVAL;VALUE=DURATION:PT1H',
+        'X-PUBLISHED-TTL:PT1H',
+    ]
+    return ''.join(fold(line) + '\r\n' for line in header) + ''.join(event_blocks(rows)) + 'END:VCALENDAR\r\n'
+
+
+def build_feed(key, depends_on, source):
+    """
+    The stored feed for key, rebuilt when any of depends_on has changed.
+    Args:
+        source (callable): Returns (calendar name, Event queryset), or None if
+            the feed doesn't exist.
+    Returns:
+        dict: 'body', 'etag' and 'last_modified' (epoch seconds), or None
+    """
+    def build():
+        found = source()
+        if found is None:
+            return None
+        name, events = found
+        body = render_calendar(name, list(events.order_by('date', 'start_time', 'id').values(*EVENT_COLUMNS)))
+        return {'body': body, 'etag': '"%s"' % hashlib.md5(body.encode()).hexdigest(), 'last_modified': int(time.time())}
+    # Past events drop off once a day
+    return cached(f'{key}:{timezone.localdate().isoformat()}', depends_on, build, FEED_TIMEOUT)
+
+
+def site_feed():
+    """Every upcoming active event"""
+    def source():
+        return 'FURsvp Events', Event.objects.filter(status='active', date__gte=timezone.localdate())
+    return build_feed('ical:site', ['events', 'groups'], source)
+
+
+def group_feed(group_id):
+    """A group's upcoming events, as listed by Group.get_upcoming_events()"""
+    def source():
+        group = Group.objects.filter(pk=group_id).only('id', 'name').first()
+        if group is None:
+            return None
+        return f'{group.name} (FURsvp)', group.get_upcoming_events()
+    return build_feed(f'ical:group:{group_id}', ['events', 'groups'], source)
+
+
+def user_feed(user_id):
+    """Upcoming events the user has RSVP'd to, other than as not attending"""
+    def source():
+        events = Event.objects.filter(
+            status='active', date__gte=timezone.localdate(),
+            rsvps__user_id=user_id, rsvps__status__in=CALENDAR_STATUSES,
+        )
+        return 'My FURsvp Events', events
+    return build_feed(f'ical:user:{user_id}', ['events', 'groups', f'user:{user_id}:rsvps'], source)
+
+
+def user_feed_token(user):
+    """Unguessable token for the user's feed URL; calendar apps can't log in"""
+    return signing.Signer(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def user_from_feed_token(token):
+    """The user id a token was issued for, or None if it isn't valid"""
+    try:
+        return int(signing.Signer(salt=TOKEN_SALT).unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
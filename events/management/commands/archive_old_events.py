@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from events.archive import archive_old_events
+
+
+class Command(BaseCommand):
+    help = 'Moves events that ended more than ARCHIVE_AFTER_HOURS ago, with their RSVPs, into the archive database.'
+
+    def handle(self, *args, **options):
+        archived = archive_old_events()
+        self.stdout.write(self.style.SUCCESS(f'Successfully archived {archived} old events.'))
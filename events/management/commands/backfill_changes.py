@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from events.models import Change, Event, Group, RSVP
+
+
+class Command(BaseCommand):
+    help = 'Adds /api/changes/ feed entries for groups, events and RSVPs saved before the feed existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Entries inserted per batch')
+
+    def handle(self, *args, **options):
+        # Parents first, so a client replaying the feed sees a group before its events
+        for kind, model in (('group', Group), ('event', Event), ('rsvp', RSVP)):
+            known = Change.objects.filter(kind=kind).values_list('object_id', flat=True)
+            rows = model.objects.exclude(pk__in=known).order_by('pk')
+            rows = rows.values_list('pk', 'status') if model is Event else rows.values_list('pk')
+            batch = []
+            added = 0
+            for row in rows.iterator(chunk_size=options['batch_size']):
+                deleted = model is Event and row[1] != 'active'
+                batch.append(Change(kind=kind, object_id=row[0], deleted=deleted))
+                if len(batch) >= options['batch_size']:
+                    added += len(Change.objects.bulk_create(batch, ignore_conflicts=True))
+                    batch = []
+            if batch:
+                added += len(Change.objects.bulk_create(batch, ignore_conflicts=True))
+            self.stdout.write(f'  {model._meta.verbose_name_plural}: {added} entries')
+        self.stdout.write(self.style.SUCCESS('Changes feed is up to date.'))
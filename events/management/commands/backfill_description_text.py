@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from events.models import Event, Group
+from events.utils import html_to_text
+
+
+class Command(BaseCommand):
+    help = 'Fills the stored plain-text descriptions of events and groups saved before the column existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows written per UPDATE batch')
+        parser.add_argument('--all', action='store_true', help='Recompute every row, not just empty ones')
+
+    def handle(self, *args, **options):
+        for model in (Group, Event):
+            rows = model.objects.exclude(description='').only('id', 'description').order_by('pk')
+            if not options['all']:
+                rows = rows.filter(description_text='')
+            batch = []
+            updated = 0
+            for row in rows.iterator(chunk_size=options['batch_size']):
+                row.description_text = html_to_text(row.description)
+                batch.append(row)
+                if len(batch) >= options['batch_size']:
+                    updated += model.objects.bulk_update(batch, ['description_text'])
+                    batch = []
+            if batch:
+                updated += model.objects.bulk_update(batch, ['description_text'])
+            self.stdout.write(f'  {model._meta.verbose_name_plural}: {updated} rows')
+        self.stdout.write(self.style.SUCCESS('Plain-text descriptions are up to date.'))
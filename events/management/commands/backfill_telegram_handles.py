@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Fills Profile.telegram_handle from telegram_username for rows saved before the column existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows written per UPDATE batch')
+
+    def handle(self, *args, **options):
+        # Telegram-verified profiles (with a telegram_id) claim their handle
+        # first; among the rest the oldest profile wins.
+        profiles = Profile.objects.exclude(telegram_username__isnull=True).exclude(telegram_username='').order_by(
+            F('telegram_id').asc(nulls_last=True), 'pk'
+        ).only('pk', 'telegram_username', 'telegram_id')
+
+        claimed = set()
+        updates = []
+        conflicts = []
+        for profile in profiles.iterator(chunk_size=options['batch_size']):
+            handle = Profile.normalize_telegram_handle(profile.telegram_username)
+            if handle in claimed:
+                conflicts.append(profile)
+                continue
+            claimed.add(handle)
+            profile.telegram_handle = handle
+            updates.append(profile)
+
+        with transaction.atomic():
+            # Clear first so reassigning a handle never trips the unique index
+            Profile.objects.exclude(telegram_handle__isnull=True).update(telegram_handle=None)
+            Profile.objects.bulk_update(updates, ['telegram_handle'], batch_size=options['batch_size'])
+
+        for profile in conflicts:
+            self.stdout.write(self.style.WARNING(
+                f'  Profile {profile.pk}: "{profile.telegram_username}" is already claimed by another profile, left unset'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {len(updates)} Telegram handles ({len(conflicts)} conflicts).'))
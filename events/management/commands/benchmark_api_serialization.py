@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta, time as dt_time
+from rest_framework.renderers import JSONRenderer
+import time
+from events.models import Event, Group
+from events.renderers import ORJSONRenderer
+from events.serializers import EventSerializer, EventRows
+from events.utils import html_to_text
+
+
+class Command(BaseCommand):
+    help = 'Measures events serialized per second by the model serializer path and the values/orjson fast path.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=2000, help='Synthetic events to serialize')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per path; the best one is reported')
+
+    def handle(self, *args, **options):
+        # Seed inside a transaction that is rolled back, so the benchmark
+        # leaves the database as it found it
+        with transaction.atomic():
+            events = self.seed(options['events'])
+            results = [
+                ('serializer', lambda: JSONRenderer().render(EventSerializer(events.select_related('group'), many=True).data)),
+                ('fast path', lambda: ORJSONRenderer().render(EventRows().serialize(EventRows().values(events)))),
+            ]
+            timings = []
+            for name, run in results:
+                best = min(self.timed(run) for _ in range(options['repeat']))
+                timings.append((name, options['events'] / best))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{'path':<12}{'events/s':>14}")
+        for name, rate in timings:
+            self.stdout.write(f'{name:<12}{rate:>14.0f}')
+        self.stdout.write(self.style.SUCCESS(f'Fast path is {timings[1][1] / timings[0][1]:.1f}x the serializer path.'))
+
+    def timed(self, run):
+        start = time.perf_counter()
+        run()
+        return time.perf_counter() - start
+
+    def seed(self, count):
+        organizer = User.objects.create(username='benchmark_organizer')
+        description = '<p>Bring snacks&nbsp;and <strong>friends</strong>!</p>' * 5
+        group = Group.objects.create(name='Benchmark Group', description=description)
+        today = timezone.now().date()
+        # bulk_create skips save(), so fill the stored text here
+        Event.objects.bulk_create([
+            Event(
+                group=group, organizer=organizer, title=f'Benchmark Event {i}',
+                date=today + timedelta(days=i % 365), start_time=dt_time(18, 0), end_time=dt_time(22, 0),
+                description=description, description_text=html_to_text(description),
+                city='Somewhere', state='NY',
+            )
+            for i in range(count)
+        ], batch_size=500)
+        return Event.objects.filter(group=group).order_by('date', 'start_time')
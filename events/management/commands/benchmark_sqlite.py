@@ -0,0 +1,126 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks concurrent SQLite reader/writer throughput with default and tuned connection settings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help='Number of reader threads')
+        parser.add_argument('--writers', type=int, default=2, help='Number of writer threads')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run')
+        parser.add_argument('--rows', type=int, default=20000, help='Rows to seed before each run')
+
+    def handle(self, *args, **options):
+        # The baseline mirrors Django's stock SQLite connection: rollback
+        # journal, deferred transactions and Python's 5 second busy timeout.
+        profiles = [
+            ('default', [], 'BEGIN', 5.0),
+            ('tuned', self.tuned_pragmas(), 'BEGIN IMMEDIATE', settings.SQLITE_PRAGMAS.get('busy_timeout', 5000) / 1000),
+        ]
+
+        results = []
+        for name, pragmas, begin, timeout in profiles:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.sqlite3')
+                self.seed(path, options['rows'])
+                result = self.run_profile(path, pragmas, begin, timeout, options)
+                results.append((name, result))
+
+        self.stdout.write(f"{'profile':<10}{'reads/s':>12}{'writes/s':>12}{'locked':>10}")
+        for name, result in results:
+            duration = options['seconds']
+            self.stdout.write(
+                f"{name:<10}{result['reads'] / duration:>12.1f}{result['writes'] / duration:>12.1f}{result['locked']:>10}"
+            )
+
+        baseline, tuned = results[0][1], results[1][1]
+        if baseline['writes']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Write throughput changed by {tuned['writes'] / baseline['writes']:.2f}x, "
+                f"read throughput by {tuned['reads'] / max(baseline['reads'], 1):.2f}x."
+            ))
+
+    def tuned_pragmas(self):
+        return [f'PRAGMA {name}={value}' for name, value in settings.SQLITE_PRAGMAS.items()]
+
+    def connect(self, path, pragmas, timeout):
+        conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        for pragma in pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def seed(self, path, rows):
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute(
+            'CREATE TABLE rsvp (id INTEGER PRIMARY KEY, event_id INTEGER NOT NULL, '
+            'status TEXT NOT NULL, timestamp REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX rsvp_event_status ON rsvp (event_id, status)')
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO rsvp (event_id, status, timestamp) VALUES (?, ?, ?)',
+            ((i % 500, 'confirmed', time.time()) for i in range(rows)),
+        )
+        conn.execute('COMMIT')
+        conn.close()
+
+    def run_profile(self, path, pragmas, begin, timeout, options):
+        counters = {'reads': 0, 'writes': 0, 'locked': 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def bump(key):
+            with lock:
+                counters[key] += 1
+
+        def reader(seed):
+            conn = self.connect(path, pragmas, timeout)
+            event_id = seed
+            while not stop.is_set():
+                try:
+                    conn.execute(
+                        'SELECT COUNT(*) FROM rsvp WHERE event_id = ? AND status = ?',
+                        (event_id % 500, 'confirmed'),
+                    ).fetchone()
+                    bump('reads')
+                except sqlite3.OperationalError:
+                    bump('locked')
+                event_id += 1
+            conn.close()
+
+        def writer(seed):
+            conn = self.connect(path, pragmas, timeout)
+            event_id = seed
+            while not stop.is_set():
+                try:
+                    # Read-then-write mirrors the RSVP path: count, then insert.
+                    conn.execute(begin)
+                    conn.execute('SELECT COUNT(*) FROM rsvp WHERE event_id = ?', (event_id % 500,)).fetchone()
+                    conn.execute(
+                        'INSERT INTO rsvp (event_id, status, timestamp) VALUES (?, ?, ?)',
+                        (event_id % 500, 'confirmed', time.time()),
+                    )
+                    conn.execute('COMMIT')
+                    bump('writes')
+                except sqlite3.OperationalError:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    bump('locked')
+                event_id += 1
+            conn.close()
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return counters
@@ -0,0 +1,114 @@
+from django.core.management.base import BaseCommand, CommandError
+import os
+from django.core.management.color import no_style
+from django.conf import settings
+from django.apps import apps
+from django.db import connections, transaction
+from django.contrib.auth.models import Permission, User
+from django.contrib.contenttypes.models import ContentType
+from fursvp.routers import WorkloadRouter
+from events.utils import copy_model_rows
+
+
+class Command(BaseCommand):
+    help = 'Streams all data from the SQLite database files into the configured PostgreSQL database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source-dir',
+            default=str(settings.BASE_DIR),
+            help='Directory holding db.sqlite3 and the per-workload SQLite files',
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows read and written per batch')
+
+    def handle(self, *args, **options):
+        target = connections['default']
+        if target.vendor != 'postgresql':
+            raise CommandError('Set DATABASE_ENGINE=postgres so the default database points at PostgreSQL.')
+        if User.objects.using('default').exists():
+            raise CommandError('The target database already contains users. Run this against a freshly migrated database.')
+
+        sources = self.register_sources(options['source_dir'])
+
+        # migrate has already created content types and permissions with its
+        # own ids; replace them with the source rows so references line up.
+        Permission.objects.using('default').all().delete()
+        ContentType.objects.using('default').all().delete()
+        ContentType.objects.clear_cache()
+
+        copied_models = []
+        for model in self.models_in_dependency_order():
+            source = self.source_for(model, sources)
+            if source is None:
+                self.stdout.write(f'  Skipping {model._meta.label}: no source table')
+                continue
+            with transaction.atomic(using='default'):
+                copied = copy_model_rows(model, source, 'default', chunk_size=options['chunk_size'])
+            copied_models.append(model)
+            self.stdout.write(f'  {model._meta.label}: {copied} rows')
+
+        # Explicit primary keys were inserted, so move each sequence past them
+        with target.cursor() as cursor:
+            for sql in target.ops.sequence_reset_sql(no_style(), copied_models):
+                cursor.execute(sql)
+
+        for alias in sources:
+            connections[alias].close()
+        self.stdout.write(self.style.SUCCESS(f'Copied {len(copied_models)} tables into PostgreSQL.'))
+
+    def register_sources(self, source_dir):
+        """Add a temporary connection alias for each SQLite file that exists"""
+        sources = {}
+        files = {'default': 'db.sqlite3'}
+        files.update({alias: f'{alias}.sqlite3' for alias in settings.SQLITE_WORKLOADS})
+        for workload, filename in files.items():
+            path = os.path.join(source_dir, filename)
+            if not os.path.exists(path):
+                continue
+            alias = f'sqlite_{workload}'
+            connections.databases[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': path,
+            }
+            try:
+                tables = set(connections[alias].introspection.table_names())
+            except Exception:
+                del connections.databases[alias]
+                continue
+            sources[alias] = tables
+        if 'sqlite_default' not in sources:
+            raise CommandError(f'No db.sqlite3 found in {source_dir}')
+        return sources
+
+    def source_for(self, model, sources):
+        """Pick the workload file that holds the model's table, falling back to db.sqlite3"""
+        router = WorkloadRouter(settings.SQLITE_WORKLOADS)
+        preferred = f'sqlite_{router.alias_for(model._meta.app_label, model._meta.model_name)}'
+        for alias in (preferred, 'sqlite_default'):
+            if model._meta.db_table in sources.get(alias, ()):
+                return alias
+        return None
+
+    def models_in_dependency_order(self):
+        """Concrete, managed models ordered so referenced tables are filled first"""
+        models = [
+            model for model in apps.get_models(include_auto_created=True)
+            if model._meta.managed and not model._meta.proxy
+        ]
+        ordered, visiting, done = [], set(), set()
+
+        def visit(model):
+            if model in done or model in visiting:
+                return
+            visiting.add(model)
+            for field in model._meta.concrete_fields:
+                related = field.related_model
+                if field.is_relation and related is not model and getattr(field, 'db_constraint', False):
+                    visit(related._meta.concrete_model)
+            visiting.discard(model)
+            done.add(model)
+            ordered.append(model)
+
+        for model in models:
+            visit(model)
+        return ordered
@@ -0,0 +1,87 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.apps import apps
+from django.db import connections, router, transaction
+from events.utils import copy_model_rows
+
+
+class Command(BaseCommand):
+    help = 'Applies migrations to every configured database and creates the cache table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--copy-from-default',
+            action='store_true',
+            help='Move rows of routed models that still live in the default database into their own database',
+        )
+        parser.add_argument(
+            '--keep-default',
+            action='store_true',
+            help='With --copy-from-default, leave the copied rows in the default database',
+        )
+
+    def handle(self, *args, **options):
+        for alias in settings.DATABASES:
+            self.stdout.write(f'Migrating database "{alias}"...')
+            call_command('migrate', database=alias, interactive=False, verbosity=options['verbosity'])
+            # No-op unless the router places the cache table on this alias
+            call_command('createcachetable', database=alias)
+
+        if options['copy_from_default']:
+            self.copy_from_default(keep=options['keep_default'])
+
+        self.stdout.write(self.style.SUCCESS('All databases are up to date.'))
+
+    def copy_from_default(self, keep=False):
+        """
+        Move operational rows left behind in db.sqlite3 before the split.
+        Rows are removed from the default database only once every one of them
+        is found in its new database; otherwise they stay and a warning says so.
+        """
+        legacy_tables = set(connections['default'].introspection.table_names())
+        for model in apps.get_models():
+            alias = router.db_for_write(model)
+            if alias == 'default' or model._meta.db_table not in legacy_tables:
+                continue
+            copied = copy_model_rows(model, 'default', alias)
+            self.stdout.write(f'  Copied {copied} {model._meta.label} rows into "{alias}"')
+            if keep or not copied:
+                continue
+            missing = self.missing_rows(model, 'default', alias)
+            if missing:
+                self.stdout.write(self.style.WARNING(
+                    f'  {missing} {model._meta.label} rows are not in "{alias}"; '
+                    f'left {model._meta.db_table} in the default database for manual cleanup'
+                ))
+                continue
+            removed = self.delete_rows(model, 'default')
+            self.stdout.write(f'  Removed {removed} {model._meta.label} rows from "default"')
+        if keep:
+            self.stdout.write(self.style.WARNING(
+                'Copied rows were left in the default database; delete them by hand once verified.'
+            ))
+
+    @staticmethod
+    def missing_rows(model, source, target, chunk_size=1000):
+        """Number of source rows whose primary key is absent from target"""
+        missing = 0
+        pks = model._base_manager.using(source).order_by('pk').values_list('pk', flat=True)
+        chunk = []
+        for pk in pks.iterator(chunk_size=chunk_size):
+            chunk.append(pk)
+            if len(chunk) >= chunk_size:
+                missing += len(chunk) - model._base_manager.using(target).filter(pk__in=chunk).count()
+                chunk = []
+        if chunk:
+            missing += len(chunk) - model._base_manager.using(target).filter(pk__in=chunk).count()
+        return missing
+
+    @staticmethod
+    def delete_rows(model, alias):
+        # Plain DELETE: the rows' relations were copied along with them, so
+        # Django's cascade collector must not follow them here
+        connection = connections[alias]
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+            return cursor.rowcount
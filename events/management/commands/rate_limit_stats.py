@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from events.ratelimit import counters
+
+
+class Command(BaseCommand):
+    help = 'Shows how many requests each rate limit scope has allowed and turned away.'
+
+    def handle(self, *args, **options):
+        if not settings.RATE_LIMIT_ENABLED:
+            self.stdout.write(self.style.WARNING('Rate limiting is disabled (RATE_LIMIT_ENABLED).'))
+        self.stdout.write(f"{'scope':<18}{'budget':>14}{'allowed':>12}{'limited':>12}")
+        for scope, totals in counters().items():
+            rate, per, capacity = settings.RATE_LIMITS[scope]
+            budget = f'{rate}/{per}s+{capacity}'
+            self.stdout.write(f"{scope:<18}{budget:>14}{totals['allowed']:>12}{totals['limited']:>12}")
@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+import signal
+import time
+from events import telegram_bot
+from events.telegram import call_api, TelegramError, TelegramRetryAfter
+
+
+class Command(BaseCommand):
+    help = 'Runs the Telegram bot by long-polling getUpdates instead of receiving webhooks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-timeout', type=int, default=30, help='Seconds Telegram holds each getUpdates request open')
+        parser.add_argument('--limit', type=int, default=100, help='Maximum updates fetched per batch')
+        parser.add_argument('--delete-webhook', action='store_true', help='Remove the webhook first; getUpdates is refused while one is set')
+        parser.add_argument('--once', action='store_true', help='Handle a single batch and exit')
+
+    def handle(self, *args, **options):
+        self.running = True
+        previous = {sig: signal.signal(sig, self.stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            self.poll(options)
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+
+    def poll(self, options):
+        if options['delete_webhook']:
+            call_api('deleteWebhook', {'drop_pending_updates': False})
+            self.stdout.write('Webhook removed.')
+
+        offset = None
+        handled = 0
+        self.stdout.write(self.style.SUCCESS('Polling Telegram for updates...'))
+        while self.running:
+            payload = {'timeout': options['poll_timeout'], 'limit': options['limit']}
+            if offset is not None:
+                payload['offset'] = offset
+            try:
+                updates = call_api('getUpdates', payload, timeout=options['poll_timeout'] + 10)
+            except TelegramError as e:
+                if options['once']:
+                    raise CommandError(f'getUpdates failed: {e}')
+                self.stderr.write(f'getUpdates failed: {e}')
+                time.sleep(getattr(e, 'retry_after', 5))
+                continue
+
+            for update in updates:
+                # Asking for offset past this id confirms it, so Telegram won't resend it
+                offset = update['update_id'] + 1
+                if not telegram_bot.claim_update(update):
+                    continue
+                close_old_connections()
+                try:
+                    self.send(telegram_bot.handle_update(update))
+                    handled += 1
+                except Exception as e:
+                    telegram_bot.release_update(update)
+                    self.stderr.write(f'Update {update["update_id"]} failed: {e}')
+
+            if options['once']:
+                break
+
+        if offset is not None:
+            # Confirm the last batch so a restart doesn't fetch it again
+            try:
+                call_api('getUpdates', {'offset': offset, 'limit': 1, 'timeout': 0})
+            except TelegramError:
+                pass
+        self.stdout.write(f'Handled {handled} updates.')
+
+    def send(self, response):
+        """Deliver a handler's reply directly, waiting out a 429 once"""
+        if not response:
+            return
+        payload = dict(response)
+        method = payload.pop('method')
+        try:
+            call_api(method, payload)
+        except TelegramRetryAfter as e:
+            time.sleep(e.retry_after)
+            call_api(method, payload)
+
+    def stop(self, signum, frame):
+        self.stdout.write('Stopping after the current batch...')
+        self.running = False
@@ -1,15 +1,35 @@
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 from datetime import time
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import strip_tags
 import re
+import secrets
+from django.core.serializers.json import DjangoJSONEncoder
+from events.utils import html_to_text
+
+def sync_description_text(instance, save_kwargs):
+    """Refresh the stored plain-text description before a save, including partial saves"""
+    instance.description_text = html_to_text(instance.description)
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and 'description' in update_fields:
+        save_kwargs['update_fields'] = {*update_fields, 'description_text'}
+
+def touch(instance, save_kwargs):
+    """Stamp updated_at before a save, including partial saves"""
+    instance.updated_at = timezone.now()
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None:
+        save_kwargs['update_fields'] = {*update_fields, 'updated_at'}
 
 class Group(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, help_text="Description of the group and its activities")
+    description_text = models.TextField(blank=True, editable=False, help_text="Plain-text description, kept in sync on save")
     logo_base64 = models.TextField(blank=True, null=True, help_text="Group logo as base64 string")
     website = models.URLField(blank=True, null=True, help_text="Group's website URL")
     contact_email = models.EmailField(blank=True, null=True, help_text="Primary contact email for the group")
@@ -17,12 +37,25 @@ class Group(models.Model):
     telegram_webhook_channel = models.CharField(
         max_length=100,
         blank=True, null=True,
+        db_index=True,  # looked up on every Telegram webhook call
         help_text="Telegram channel name for webhook posting (without @)",
         verbose_name="Telegram Webhook Channel (without @)"
     )
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # home sorts by Lower('group__name')
+            models.Index(Lower('name'), name='events_group_name_lower_idx'),
+        ]
     
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        sync_description_text(self, kwargs)
+        touch(self, kwargs)
+        super().save(*args, **kwargs)
     
     def get_absolute_url(self):
         return reverse('group_detail', args=[str(self.id)])
@@ -41,15 +74,10 @@ class Group(models.Model):
             status='active'
         ).order_by('date', 'start_time')
     
-    def get_past_events(self):
-        from django.utils import timezone
-        from datetime import datetime
-        now = timezone.now()
-        return self.event_set.filter(
-            models.Q(date__lt=now.date()) | 
-            (models.Q(date=now.date()) & models.Q(end_time__lt=now.time())),
-            status='active'
-        ).order_by('-date', '-start_time')
+    def get_past_events(self, limit=None):
+        """Ended events, newest first, including those moved to the archive (see events.archive)"""
+        from events.archive import past_events
+        return past_events(self, limit)
 
 class Event(models.Model):
     title = models.CharField(max_length=200)
@@ -58,6 +86,7 @@ class Event(models.Model):
     start_time = models.TimeField(null=True, blank=True, default=time(0, 0, 0))
     end_time = models.TimeField(null=True, blank=True, default=time(0, 0, 0))
     description = models.TextField(blank=True)
+    description_text = models.TextField(blank=True, editable=False, help_text="Plain-text description, kept in sync on save")
     address = models.CharField(max_length=255, blank=True, null=True)
     city = models.CharField(max_length=50, blank=True, null=True)
     state = models.CharField(max_length=50, blank=True, null=True)
@@ -120,6 +149,16 @@ class Event(models.Model):
         blank=True,
         help_text="Describe how this event is accessible. If left blank, event is not marked as accessible."
     )
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # Upcoming/past listings filter on status and order by date, start_time
+            models.Index(fields=['status', 'date', 'start_time'], name='events_event_status_date_idx'),
+            models.Index(fields=['group', 'status', 'date'], name='events_event_group_status_idx'),
+            # home sorts by Lower('title')
+            models.Index(Lower('title'), name='events_event_title_lower_idx'),
+        ]
     
     def clean(self):
         if self.waitlist_enabled and self.capacity is None:
@@ -131,6 +170,11 @@ class Event(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        sync_description_text(self, kwargs)
+        touch(self, kwargs)
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('event_detail', args=[str(self.id)])
 
@@ -150,16 +194,26 @@ class RSVP(models.Model):
     question1 = models.CharField(max_length=255, null=True, blank=True, help_text="Organizer-only question 1 (visible only to event organizers)")
     question2 = models.CharField(max_length=255, null=True, blank=True, help_text="Organizer-only question 2 (visible only to event organizers)")
     question3 = models.CharField(max_length=255, null=True, blank=True, help_text="Organizer-only question 3 (visible only to event organizers)")
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         unique_together = ['event', 'user']
         ordering = ['timestamp'] # Order by timestamp for waitlist purposes
+        indexes = [
+            # Attendee/waitlist lists and capacity counts per status.
+            # RSVP(user) lookups use the index Django creates for the foreign key.
+            models.Index(fields=['event', 'status', 'timestamp'], name='events_rsvp_event_status_idx'),
+        ]
 
     def __str__(self):
         if self.user:
             return f"{self.user.username} - {self.event.title}"
         return f"{self.name} - {self.event.title}"
 
+    def save(self, *args, **kwargs):
+        touch(self, kwargs)
+        super().save(*args, **kwargs)
+
     def remove(self):
         self.delete()
 
@@ -275,3 +329,236 @@ class PlatformStats(models.Model):
         
         stats.save()
         return stats
+
+
+class OutboundMessage(models.Model):
+    """A Telegram message waiting for the background sender in events.telegram"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    chat_id = models.CharField(max_length=100, help_text="Telegram chat ID or @channel name")
+    text = models.TextField()
+    parse_mode = models.CharField(max_length=20, blank=True)
+    reply_markup = models.JSONField(null=True, blank=True)
+    coalesce_key = models.CharField(max_length=150, blank=True, help_text="Pending messages sharing a key are sent as one")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='events_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_status_display()} message to {self.chat_id}'
+
+
+class RateLimitBucket(models.Model):
+    """
+    Stored state of an events.ratelimit.TokenBucket. Buckets are spent with
+    one conditional UPDATE, so parallel requests can't take the same token;
+    a missing row is a full bucket.
+    """
+    key = models.CharField(max_length=200, primary_key=True)
+    tokens = models.FloatField()
+    updated = models.FloatField(help_text="Unix time of the last refill")
+    expires = models.FloatField(db_index=True, help_text="Unix time after which the bucket is full again and can be dropped")
+
+    def __str__(self):
+        return self.key
+
+
+class Change(models.Model):
+    """
+    Entry in the /api/changes/ feed. Each group, event and RSVP has at most
+    one entry: saving or deleting it replaces the entry with a new one at the
+    end of the feed, so the feed only ever holds the latest state of each.
+    """
+    KIND_CHOICES = [
+        ('group', 'Group'),
+        ('event', 'Event'),
+        ('rsvp', 'RSVP'),
+    ]
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False, help_text="Tombstone: the object was deleted, or the event cancelled")
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # The id is the feed cursor; Django creates SQLite ids with AUTOINCREMENT, so they are never reused
+        ordering = ['id']
+        unique_together = ['kind', 'object_id']
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id} {"deleted" if self.deleted else "changed"}'
+
+    @classmethod
+    def record(cls, kind, object_id, deleted=False):
+        """Move the object's entry to the end of the feed"""
+        return cls.record_many(kind, [object_id], deleted)[0]
+
+    @classmethod
+    def record_many(cls, kind, object_ids, deleted=False):
+        """record() for many objects of one kind at once, e.g. after a bulk delete"""
+        using = router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            try:
+                with transaction.atomic(using=using):
+                    return cls._replace(kind, object_ids, deleted)
+            except IntegrityError:
+                # A concurrent save of the same object committed its entry
+                # after our delete ran; it is visible now, so replace it too
+                return cls._replace(kind, object_ids, deleted)
+
+    @classmethod
+    def _replace(cls, kind, object_ids, deleted):
+        cls.objects.filter(kind=kind, object_id__in=object_ids).delete()
+        return cls.objects.bulk_create([cls(kind=kind, object_id=object_id, deleted=deleted) for object_id in object_ids])
+
+
+def webhook_secret():
+    return secrets.token_hex(32)
+
+
+class WebhookEndpoint(models.Model):
+    """An integration's URL that receives signed event and RSVP notifications (see events.webhooks)"""
+    EVENT_TYPE_CHOICES = [
+        ('event.created', 'Event created'),
+        ('event.updated', 'Event updated'),
+        ('event.cancelled', 'Event cancelled'),
+        ('rsvp.changed', 'RSVP changed'),
+    ]
+    url = models.URLField(max_length=500)
+    group = models.ForeignKey(
+        Group, on_delete=models.CASCADE, null=True, blank=True, related_name='webhooks',
+        help_text="Leave blank to receive changes from every group (staff only)"
+    )
+    event_types = models.JSONField(default=list, blank=True, help_text="Notification types to send; empty for all of them")
+    secret = models.CharField(max_length=64, default=webhook_secret, help_text="Key for the HMAC in the X-FURsvp-Signature header")
+    max_concurrency = models.PositiveSmallIntegerField(
+        default=2, validators=[MinValueValidator(1)], help_text="Most requests in flight to this URL at once"
+    )
+    is_active = models.BooleanField(default=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='webhooks')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.url} ({self.group or "all groups"})'
+
+    def clean(self):
+        known = {event_type for event_type, _ in self.EVENT_TYPE_CHOICES}
+        if not isinstance(self.event_types, list) or not set(self.event_types) <= known:
+            raise ValidationError({'event_types': f'Choose from: {", ".join(sorted(known))}'})
+
+    def wants(self, event_type, group_id):
+        return (
+            self.is_active
+            and (self.group_id is None or self.group_id == group_id)
+            and (not self.event_types or event_type in self.event_types)
+        )
+
+
+class WebhookDelivery(models.Model):
+    """A notification queued for a webhook endpoint"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    # Lives in the queue database, so the endpoint is a reference without a constraint
+    endpoint = models.ForeignKey(WebhookEndpoint, on_delete=models.DO_NOTHING, db_constraint=False, related_name='deliveries')
+    event_type = models.CharField(max_length=30)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    lease = models.CharField(max_length=32, blank=True, help_text="Claim token of the sender working on it")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        verbose_name_plural = 'webhook deliveries'
+        indexes = [
+            models.Index(fields=['endpoint', 'status', 'next_attempt_at'], name='events_webhook_due_idx'),
+            models.Index(fields=['status', 'next_attempt_at'], name='events_webhook_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_status_display()} {self.event_type} to endpoint {self.endpoint_id}'
+
+
+class ArchivedEvent(models.Model):
+    """
+    An event moved out of the Event table some time after it ended (see
+    events.archive). It keeps its original id, so links to it still work,
+    and only the columns history needs; the HTML description is dropped in
+    favour of the stored plain text.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    # Lives in the archive database, so these are references without constraints
+    group = models.ForeignKey(Group, on_delete=models.DO_NOTHING, db_constraint=False, related_name='archived_events')
+    organizer = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='archived_events')
+    title = models.CharField(max_length=200)
+    date = models.DateField()
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
+    description_text = models.TextField(blank=True)
+    address = models.CharField(max_length=255, blank=True, null=True)
+    city = models.CharField(max_length=50, blank=True, null=True)
+    state = models.CharField(max_length=50, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=Event.STATUS_CHOICES, default='active')
+    age_restriction = models.CharField(max_length=10, choices=Event.AGE_CHOICES, default='none')
+    capacity = models.IntegerField(null=True, blank=True)
+    question1_text = models.CharField(max_length=255, blank=True, default="")
+    question2_text = models.CharField(max_length=255, blank=True, default="")
+    question3_text = models.CharField(max_length=255, blank=True, default="")
+    confirmed_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-date', '-start_time']
+        indexes = [
+            models.Index(fields=['group', 'status', 'date'], name='events_archive_group_idx'),
+            models.Index(fields=['organizer', 'date'], name='events_archive_organizer_idx'),
+            models.Index(fields=['date'], name='events_archive_date_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    def get_absolute_url(self):
+        return reverse('event_detail', args=[str(self.id)])
+
+
+class ArchivedRSVP(models.Model):
+    """An RSVP to an archived event, with the event's date copied in for per-user history"""
+    id = models.BigIntegerField(primary_key=True)
+    event = models.ForeignKey(ArchivedEvent, on_delete=models.CASCADE, related_name='rsvps')
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='archived_rsvps')
+    name = models.CharField(max_length=100, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=RSVP._meta.get_field('status').choices, null=True, blank=True)
+    timestamp = models.DateTimeField()
+    event_date = models.DateField()
+    question1 = models.CharField(max_length=255, null=True, blank=True)
+    question2 = models.CharField(max_length=255, null=True, blank=True)
+    question3 = models.CharField(max_length=255, null=True, blank=True)
+
+    class Meta:
+        ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['event', 'status'], name='events_archive_rsvp_event_idx'),
+            # Profile history: a user's RSVPs, newest event first
+            models.Index(fields=['user', '-event_date'], name='events_archive_rsvp_user_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id or self.name} - {self.event_id}'
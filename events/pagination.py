@@ -0,0 +1,171 @@
+"""
+Keyset (cursor) pagination for the API. Instead of OFFSET, each page seeks
+past the ordering key of the previous page's last row, so deep pages cost the
+same as the first one and no COUNT(*) is needed.
+"""
+import base64
+import json
+from collections import namedtuple
+from functools import reduce
+from operator import or_
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# One column of the ordering: the lookup path, the model field it ends on,
+# its direction and whether it can be NULL
+Key = namedtuple('Key', ['path', 'field', 'descending', 'null'])
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination keyed on the queryset's own ordering, with the primary
+    key appended so the order is total; related fields such as 'event__date'
+    may be part of it. Works on model instances and on .values() rows alike.
+    Cursors are opaque base64 tokens holding the key of the row to continue
+    from; NULLs sort before every other value.
+    """
+    ordering = None
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.keys = self.get_keys(queryset)
+        position, self.reverse = self.decode_cursor(request)
+
+        keys = [key._replace(descending=not key.descending) for key in self.keys] if self.reverse else self.keys
+        queryset = queryset.order_by(*(self.order_by(key) for key in keys))
+        if position is not None:
+            condition = self.seek(keys, position)
+            queryset = queryset.filter(condition) if condition is not None else queryset.none()
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    def get_keys(self, queryset):
+        """Keys the queryset is ordered by, ending with the primary key"""
+        opts = queryset.model._meta
+        keys = []
+        for name in queryset.query.order_by or opts.ordering:
+            if not isinstance(name, str) or name == '?':
+                raise TypeError(f'{type(self).__name__} can only order by field names, not {name!r}')
+            descending = name.startswith('-')
+            path = name.lstrip('-')
+            if path == 'pk':
+                path = opts.pk.name
+            # Follow relations, e.g. 'event__date'
+            model_opts, nullable = opts, False
+            for part in path.split('__'):
+                field = model_opts.get_field(part)
+                nullable = nullable or field.null
+                if field.related_model and part != path.split('__')[-1]:
+                    model_opts = field.related_model._meta
+            keys.append(Key(path, field, descending, nullable))
+            if field.primary_key and '__' not in path:
+                return keys
+        keys.append(Key(opts.pk.name, opts.pk, keys[-1].descending if keys else False, False))
+        return keys
+
+    def order_by(self, key):
+        if not key.null:
+            return F(key.path).desc() if key.descending else F(key.path).asc()
+        return F(key.path).desc(nulls_last=True) if key.descending else F(key.path).asc(nulls_first=True)
+
+    def seek(self, keys, position):
+        """
+        Condition for rows strictly after position, expanded column by column:
+        (a > x) OR (a = x AND b > y) OR ...
+        Returns:
+            Q: The condition, or None if no row can follow position
+        """
+        terms = []
+        prefix = Q()
+        for key, value in zip(keys, position):
+            path = key.path
+            if value is None:
+                after = None if key.descending else Q(**{f'{path}__isnull': False})
+            elif key.descending:
+                after = Q(**{f'{path}__lt': value})
+                if key.null:
+                    after |= Q(**{f'{path}__isnull': True})
+            else:
+                after = Q(**{f'{path}__gt': value})
+            if after is not None:
+                terms.append(prefix & after)
+            prefix &= Q(**{f'{path}__isnull': True}) if value is None else Q(**{path: value})
+        if not terms:
+            return None
+
+        condition = reduce(or_, terms)
+        # Repeat the leading column as a plain range so the index can seek on it
+        key, value = keys[0], position[0]
+        if value is not None and not key.descending:
+            condition &= Q(**{f'{key.path}__gte': value})
+        elif value is not None and not key.null:
+            condition &= Q(**{f'{key.path}__lte': value})
+        return condition
+
+    def get_position(self, row):
+        if isinstance(row, dict):
+            return [row[key.path] if key.path in row else row[key.field.attname] for key in self.keys]
+        position = []
+        for key in self.keys:
+            *relations, name = key.path.split('__')
+            value = row
+            for relation in relations:
+                value = getattr(value, relation)
+            position.append(getattr(value, key.field.attname if name == key.field.name else name))
+        return position
+
+    def decode_cursor(self, request):
+        """
+        Returns:
+            tuple: (position, reverse), with position None on the first page
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            values = data['p']
+            if len(values) != len(self.keys):
+                raise ValueError('Cursor does not match the ordering')
+            position = [key.field.to_python(value) for key, value in zip(self.keys, values)]
+            return position, bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in self.get_position(row)]
+        data = {'p': values, 'r': 1} if reverse else {'p': values}
+        encoded = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_html_context(self):
+        return {'previous_url': self.get_previous_link(), 'next_url': self.get_next_link()}
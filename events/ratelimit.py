@@ -0,0 +1,184 @@
+import math
+import time
+from functools import wraps
+from django.conf import settings
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Least
+from django.http import HttpResponse
+from rest_framework.throttling import BaseThrottle
+
+from events.caching import state_cache
+
+
+class TokenBucket:
+    """
+    Database-backed token bucket (see events.models.RateLimitBucket).
+    Args:
+        key (str): Identifies the bucket.
+        rate (int): Tokens added per `per` seconds.
+        per (float): Refill period in seconds.
+        capacity (int, optional): Burst size; defaults to `rate`.
+    """
+
+    def __init__(self, key, rate, per, capacity=None):
+        self.key = f'tokenbucket:{key}'
+        self.capacity = capacity or rate
+        self.fill_rate = rate / per
+        # Idle buckets are full again after this long, so they can be dropped
+        self.ttl = int(self.capacity / self.fill_rate) + 1
+
+    def _refilled(self, now):
+        """SQL for the bucket's tokens at time now"""
+        return Least(
+            Value(float(self.capacity)),
+            F('tokens') + (Value(now) - F('updated')) * Value(self.fill_rate),
+            output_field=FloatField(),
+        )
+
+    def _take(self, now, tokens):
+        """Spend tokens in one statement if the bucket exists and holds enough"""
+        from events.models import RateLimitBucket
+        refilled = self._refilled(now)
+        return RateLimitBucket.objects.filter(key=self.key).alias(available=refilled).filter(available__gte=tokens).update(
+            tokens=refilled - Value(float(tokens)), updated=now, expires=now + self.ttl,
+        )
+
+    def consume(self, tokens=1):
+        """
+        Take tokens from the bucket.
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds until they will be available
+        """
+        from events.models import RateLimitBucket
+        now = time.time()
+        if self._take(now, tokens):
+            return 0.0
+        state = RateLimitBucket.objects.filter(key=self.key).values_list('tokens', 'updated').first()
+        if state is None:
+            # First use, or dropped while idle: start full; another request may get there first
+            RateLimitBucket.objects.bulk_create(
+                [RateLimitBucket(key=self.key, tokens=self.capacity, updated=now, expires=now + self.ttl)],
+                ignore_conflicts=True,
+            )
+            if self._take(now, tokens):
+                return 0.0
+            state = RateLimitBucket.objects.filter(key=self.key).values_list('tokens', 'updated').get()
+        available = min(self.capacity, state[0] + (now - state[1]) * self.fill_rate)
+        # The UPDATE found too few tokens; never report 0, which means "go ahead"
+        return max(tokens - available, 1e-3) / self.fill_rate
+
+    def drain(self):
+        """Empty the bucket, e.g. after the remote side told us to back off"""
+        from events.models import RateLimitBucket
+        now = time.time()
+        RateLimitBucket.objects.update_or_create(key=self.key, defaults={'tokens': 0, 'updated': now, 'expires': now + self.ttl})
+
+
+def purge_idle_buckets():
+    """
+    Drop buckets that have refilled completely; runs from the django-q scheduler.
+    Returns:
+        int: Buckets dropped
+    """
+    from events.models import RateLimitBucket
+    deleted, _ = RateLimitBucket.objects.filter(expires__lt=time.time()).delete()
+    return deleted
+
+
+# Request rate limiting. Each client gets a bucket per scope (see
+# settings.RATE_LIMITS); requests that find it empty are answered with 429
+# and a Retry-After header instead of occupying a worker.
+
+def client_ident(request, per_user=True):
+    """
+    Who a request's budget belongs to: the logged-in user, or the client IP.
+    Behind the local nginx proxy REMOTE_ADDR is the proxy, so the address it
+    passes on in X-Real-IP is used instead.
+    """
+    user = getattr(request, 'user', None)
+    if per_user and user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    addr = request.META.get('REMOTE_ADDR', '')
+    if addr in settings.RATE_LIMIT_TRUSTED_PROXIES:
+        addr = request.META.get('HTTP_X_REAL_IP') or addr
+    return f'ip:{addr}'
+
+
+def check_rate(scope, ident):
+    """
+    Take a token from ident's bucket for scope and count the outcome.
+    Returns:
+        float: 0 if the request may go ahead, otherwise seconds until it may
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return 0.0
+    rate, per, capacity = settings.RATE_LIMITS[scope]
+    wait = TokenBucket(f'ratelimit:{scope}:{ident}', rate, per, capacity).consume()
+    count(scope, 'limited' if wait else 'allowed')
+    return wait
+
+
+def count(scope, outcome):
+    # Monitoring only: DatabaseCache.incr() is a read and a write, so
+    # simultaneous requests can undercount
+    key = f'ratelimit:count:{scope}:{outcome}'
+    # add() seeds the counter so incr() has something to increment
+    if not state_cache.add(key, 1, None):
+        try:
+            state_cache.incr(key)
+        except ValueError:
+            state_cache.set(key, 1, None)
+
+
+def counters():
+    """
+    Allowed and limited request counts per scope since the state cache was last cleared.
+    Returns:
+        dict: {scope: {'allowed': int, 'limited': int}}
+    """
+    keys = {(scope, outcome): f'ratelimit:count:{scope}:{outcome}' for scope in settings.RATE_LIMITS for outcome in ('allowed', 'limited')}
+    found = state_cache.get_many(keys.values())
+    totals = {scope: {'allowed': 0, 'limited': 0} for scope in settings.RATE_LIMITS}
+    for (scope, outcome), key in keys.items():
+        totals[scope][outcome] = found.get(key, 0)
+    return totals
+
+
+def too_many_requests(wait):
+    response = HttpResponse('Too many requests. Please slow down.', status=429, content_type='text/plain')
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def rate_limit(scope, anonymous_only=False, exempt=None):
+    """
+    Decorate a view so each client may only call it at the rate configured
+    for scope.
+    Args:
+        anonymous_only (bool): Let logged-in users through without a budget,
+            so crawlers can't lock members out of public pages.
+        exempt (callable, optional): Called with the request; requests it
+            returns True for are let through without a budget.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not (anonymous_only and request.user.is_authenticated) and not (exempt and exempt(request)):
+                wait = check_rate(scope, client_ident(request))
+                if wait:
+                    return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """DRF throttle drawing on the 'api' budget for anonymous clients and 'api_user' for members"""
+
+    def allow_request(self, request, view):
+        scope = 'api_user' if request.user and request.user.is_authenticated else 'api'
+        self.wait_seconds = check_rate(scope, client_ident(request))
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,210 @@
+"""
+Full-text search over events and groups, behind the home page, the event
+index, the groups list and /api/events/search/.
+
+On SQLite, FTS5 tables hold each event's title, group name, city, state and
+plain-text description, and each group's name and description. The signal
+receivers in events.signals and the bulk deletion hooks keep them current
+one row at a time. Every word of a search matches as a word prefix, so
+partial input works for type-ahead, and results can be ranked with bm25,
+weighted towards titles and names.
+
+PostgreSQL uses GIN indexes over to_tsvector() of the same columns instead,
+which need no upkeep; events match on their own columns or their group's
+name, ranked with ts_rank. Other databases fall back to icontains.
+"""
+import re
+from functools import reduce
+from operator import and_, or_
+
+from django.db import connections, router
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+
+from events.models import Event, Group
+
+EVENT_TABLE = 'events_event_search'
+GROUP_TABLE = 'events_group_search'
+# bm25 weights, in column order: matches in titles and names count most
+EVENT_WEIGHTS = (10.0, 5.0, 3.0, 2.0, 1.0)
+GROUP_WEIGHTS = (10.0, 1.0)
+
+SQLITE_INDEX = [
+    # prefix='2 3' keeps short type-ahead prefixes from scanning the whole vocabulary
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {EVENT_TABLE} USING fts5("
+    "title, group_name, city, state, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {GROUP_TABLE} USING fts5("
+    "name, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+]
+# {table} is empty for the index expressions, or a qualifying "table." prefix
+EVENT_VECTOR = (
+    "to_tsvector('simple', coalesce({table}title, '') || ' ' || coalesce({table}city, '') || ' ' || "
+    "coalesce({table}state, '') || ' ' || coalesce({table}description_text, ''))"
+)
+GROUP_VECTOR = "to_tsvector('simple', coalesce({table}name, '') || ' ' || coalesce({table}description_text, ''))"
+POSTGRES_INDEX = [
+    f"CREATE INDEX IF NOT EXISTS events_event_search_gin ON events_event USING gin (({EVENT_VECTOR.format(table='')}))",
+    f"CREATE INDEX IF NOT EXISTS events_group_search_gin ON events_group USING gin (({GROUP_VECTOR.format(table='')}))",
+]
+
+
+def vendor():
+    return connections[router.db_for_read(Event)].vendor
+
+
+def words(term):
+    return re.findall(r'[^\W_]+', term)
+
+
+def match_query(term):
+    """FTS5 MATCH expression: every word, each as a prefix"""
+    return ' '.join(f'"{word}"*' for word in words(term))
+
+
+def ts_query(term):
+    return ' & '.join(f'{word}:*' for word in words(term))
+
+
+def search_events(queryset, term, ranked=False):
+    """
+    Narrow an Event queryset to the events matching term.
+    Args:
+        ranked (bool): Order by relevance, best first, instead of keeping
+            the queryset's ordering.
+    """
+    if not words(term):
+        return queryset.none()
+    table = Event._meta.db_table
+    if vendor() == 'sqlite':
+        query = match_query(term)
+        queryset = queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {EVENT_TABLE} WHERE {EVENT_TABLE} MATCH %s', [query]))
+        if not ranked:
+            return queryset
+        # bm25 is lower for better matches
+        rank = RawSQL(
+            f'(SELECT bm25({EVENT_TABLE}, {", ".join(map(str, EVENT_WEIGHTS))}) FROM {EVENT_TABLE} '
+            f'WHERE {EVENT_TABLE} MATCH %s AND rowid = "{table}"."id")', [query],
+        )
+        return queryset.annotate(search_rank=rank).order_by('search_rank', 'date', 'pk')
+    if vendor() == 'postgresql':
+        query = ts_query(term)
+        groups = RawSQL(f"SELECT id FROM events_group WHERE {GROUP_VECTOR.format(table='')} @@ to_tsquery('simple', %s)", [query])
+        own = RawSQL(f"SELECT id FROM {table} WHERE {EVENT_VECTOR.format(table='')} @@ to_tsquery('simple', %s)", [query])
+        queryset = queryset.filter(Q(pk__in=own) | Q(group_id__in=groups))
+        if not ranked:
+            return queryset
+        rank = RawSQL(f"ts_rank({EVENT_VECTOR.format(table=f'{table}.')}, to_tsquery('simple', %s))", [query])
+        return queryset.annotate(search_rank=rank).order_by(F('search_rank').desc(), 'date', 'pk')
+    fields = ['title', 'description_text', 'city', 'state', 'group__name']
+    return queryset.filter(reduce(and_, (
+        reduce(or_, (Q(**{f'{field}__icontains': word}) for field in fields)) for word in words(term)
+    )))
+
+
+def search_groups(queryset, term, ranked=False):
+    """Narrow a Group queryset to the groups matching term; see search_events()"""
+    if not words(term):
+        return queryset.none()
+    table = Group._meta.db_table
+    if vendor() == 'sqlite':
+        query = match_query(term)
+        queryset = queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {GROUP_TABLE} WHERE {GROUP_TABLE} MATCH %s', [query]))
+        if not ranked:
+            return queryset
+        rank = RawSQL(
+            f'(SELECT bm25({GROUP_TABLE}, {", ".join(map(str, GROUP_WEIGHTS))}) FROM {GROUP_TABLE} '
+            f'WHERE {GROUP_TABLE} MATCH %s AND rowid = "{table}"."id")', [query],
+        )
+        return queryset.annotate(search_rank=rank).order_by('search_rank', 'name', 'pk')
+    if vendor() == 'postgresql':
+        query = ts_query(term)
+        queryset = queryset.filter(pk__in=RawSQL(f"SELECT id FROM {table} WHERE {GROUP_VECTOR.format(table='')} @@ to_tsquery('simple', %s)", [query]))
+        if not ranked:
+            return queryset
+        rank = RawSQL(f"ts_rank({GROUP_VECTOR.format(table=f'{table}.')}, to_tsquery('simple', %s))", [query])
+        return queryset.annotate(search_rank=rank).order_by(F('search_rank').desc(), 'name', 'pk')
+    return queryset.filter(reduce(and_, (
+        Q(name__icontains=word) | Q(description_text__icontains=word) for word in words(term)
+    )))
+
+
+def maintained():
+    """Whether the index is kept by this module (SQLite) rather than by the database"""
+    return vendor() == 'sqlite'
+
+
+def index_events(ids):
+    """(Re)index the events with these ids, dropping any that no longer exist"""
+    ids = list(ids)
+    if not ids or not maintained():
+        return
+    rows = Event.objects.filter(pk__in=ids).values_list('id', 'title', 'group__name', 'city', 'state', 'description_text')
+    with connections[router.db_for_write(Event)].cursor() as cursor:
+        remove(cursor, EVENT_TABLE, ids)
+        cursor.executemany(
+            f'INSERT INTO {EVENT_TABLE}(rowid, title, group_name, city, state, description) VALUES (%s, %s, %s, %s, %s, %s)',
+            list(rows),
+        )
+
+
+def index_groups(ids):
+    """(Re)index the groups with these ids, and their events too where a name changed"""
+    ids = list(ids)
+    if not ids or not maintained():
+        return
+    rows = list(Group.objects.filter(pk__in=ids).values_list('id', 'name', 'description_text'))
+    with connections[router.db_for_write(Group)].cursor() as cursor:
+        cursor.execute(f'SELECT rowid, name FROM {GROUP_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(ids))})', ids)
+        indexed = dict(cursor.fetchall())
+        remove(cursor, GROUP_TABLE, ids)
+        cursor.executemany(f'INSERT INTO {GROUP_TABLE}(rowid, name, description) VALUES (%s, %s, %s)', rows)
+    renamed = [group_id for group_id, name, _ in rows if group_id in indexed and indexed[group_id] != name]
+    if renamed:
+        from events.deletion import batches
+        for event_ids in batches(Event.objects.filter(group_id__in=renamed)):
+            index_events(event_ids)
+
+
+def remove_events(ids):
+    if ids and maintained():
+        with connections[router.db_for_write(Event)].cursor() as cursor:
+            remove(cursor, EVENT_TABLE, ids)
+
+
+def remove_groups(ids):
+    if ids and maintained():
+        with connections[router.db_for_write(Group)].cursor() as cursor:
+            remove(cursor, GROUP_TABLE, ids)
+
+
+def remove(cursor, table, ids):
+    ids = list(ids)
+    cursor.execute(f'DELETE FROM {table} WHERE rowid IN ({", ".join(["%s"] * len(ids))})', ids)
+
+
+def create_index(using):
+    """Create the search tables or indexes, filling the tables the first time"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for statement in POSTGRES_INDEX:
+                cursor.execute(statement)
+        return
+    if connection.vendor != 'sqlite':
+        return
+    created = EVENT_TABLE not in connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        for statement in SQLITE_INDEX:
+            cursor.execute(statement)
+    if created:
+        rebuild()
+
+
+def rebuild():
+    """Reindex every event and group"""
+    from events.deletion import batches
+
+    for ids in batches(Group.objects.all()):
+        index_groups(ids)
+    for ids in batches(Event.objects.all()):
+        index_events(ids)
@@ -3,7 +3,8 @@ from .models import Group, Event, RSVP
 from django.contrib.auth.models import User
 from datetime import datetime
 from django.utils import timezone
-from django.utils.html import strip_tags
+from django.conf import settings
+from .utils import html_to_text
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -51,8 +52,10 @@ class GroupSerializer(serializers.ModelSerializer):
         ]
 
     def get_description(self, obj):
-        text = strip_tags(obj.description) if obj.description else ""
-        return text.replace("&nbsp;", "\n")
+        # Rows saved before description_text existed fall back to converting here
+        if obj.description_text or not obj.description:
+            return obj.description_text
+        return html_to_text(obj.description)
 
 
 class EventSerializer(serializers.ModelSerializer):
@@ -92,8 +95,10 @@ class EventSerializer(serializers.ModelSerializer):
         return None
 
     def get_description(self, obj):
-        text = strip_tags(obj.description) if obj.description else ""
-        return text.replace("&nbsp;", "\n")
+        # Rows saved before description_text existed fall back to converting here
+        if obj.description_text or not obj.description:
+            return obj.description_text
+        return html_to_text(obj.description)
 
 
 class EventDetailSerializer(serializers.ModelSerializer):
@@ -116,11 +121,15 @@ class EventDetailSerializer(serializers.ModelSerializer):
         ]
     
     def get_attendee_count(self, obj):
-        """Get count of confirmed attendees"""
+        """Get count of confirmed attendees, annotated by EventViewSet when available"""
+        if hasattr(obj, 'attendee_count'):
+            return obj.attendee_count
         return obj.rsvps.filter(status='confirmed').count()
     
     def get_waitlist_count(self, obj):
-        """Get count of waitlisted attendees"""
+        """Get count of waitlisted attendees, annotated by EventViewSet when available"""
+        if hasattr(obj, 'waitlist_count'):
+            return obj.waitlist_count
         return obj.rsvps.filter(status='waitlisted').count()
     
     def get_start_timestamp(self, obj):
@@ -144,8 +153,10 @@ class EventDetailSerializer(serializers.ModelSerializer):
         return None
 
     def get_description(self, obj):
-        text = strip_tags(obj.description) if obj.description else ""
-        return text.replace("&nbsp;", "\n")
+        # Rows saved before description_text existed fall back to converting here
+        if obj.description_text or not obj.description:
+            return obj.description_text
+        return html_to_text(obj.description)
 
 
 class RSVPSerializer(serializers.ModelSerializer):
@@ -158,4 +169,157 @@ class RSVPSerializer(serializers.ModelSerializer):
             'id', 'user', 'name', 'timestamp', 'status',
             'question1', 'question2', 'question3'
         ]
-        read_only_fields = ['timestamp'] 
\ No newline at end of file
+        read_only_fields = ['timestamp'] 
+
+class EventRows:
+    """
+    Fast equivalent of EventSerializer(many=True) for list endpoints. It works
+    on .values() rows instead of model instances, reads the stored plain-text
+    descriptions (converting only rows saved before they existed) and looks
+    each UTC offset up once per date and hour rather than making every
+    timestamp aware.
+
+    A subset of the output fields can be asked for; only the columns those
+    fields are built from are selected, and the group is only joined when it
+    is expanded.
+    """
+    group_fields = ['id', 'name', 'description', 'description_text', 'website', 'contact_email', 'telegram_channel', 'telegram_webhook_channel']
+    # Output field -> the columns it is built from
+    sources = {
+        'id': ['id'],
+        'title': ['title'],
+        'group': ['group'],
+        'date': ['date'],
+        'start_time': ['start_time'],
+        'end_time': ['end_time'],
+        'start_timestamp': ['date', 'start_time'],
+        'end_timestamp': ['date', 'end_time'],
+        # description for rows saved before description_text existed
+        'description': ['description_text', 'description'],
+        'address': ['address'],
+        'city': ['city'],
+        'state': ['state'],
+        'status': ['status'],
+        'age_restriction': ['age_restriction'],
+        'capacity': ['capacity'],
+        'waitlist_enabled': ['waitlist_enabled'],
+        'attendee_list_public': ['attendee_list_public'],
+        'enable_rsvp_questions': ['enable_rsvp_questions'],
+    }
+    expandable = {'group': [f'group__{field}' for field in group_fields]}
+
+    def __init__(self, fields=None, expand=None):
+        """
+        Args:
+            fields (list, optional): Output fields to include, all of them by default.
+            expand (list, optional): Relations to nest in full instead of as an id.
+                When fields isn't given the group is always expanded, as in EventSerializer.
+        Raises:
+            ValidationError: For unknown field or relation names
+        """
+        unknown = [name for name in fields or [] if name not in self.sources]
+        unknown += [name for name in expand or [] if name not in self.expandable]
+        if unknown:
+            raise serializers.ValidationError({'fields': [f'Unknown field: {name}' for name in unknown]})
+        self.complete = not fields
+        self.fields = list(fields) if fields else list(self.sources)
+        self.expand = set(expand or []) | (set() if fields else set(self.expandable))
+        self.tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        self.offsets = {}
+
+    @classmethod
+    def from_request(cls, request):
+        """Build from the comma-separated ?fields= and ?expand= query parameters"""
+        def names(param):
+            return [name.strip() for name in request.query_params.get(param, '').split(',') if name.strip()]
+        return cls(fields=names('fields'), expand=names('expand'))
+
+    @property
+    def columns(self):
+        columns = {'id'}
+        for name in self.fields:
+            if name in self.expand:
+                columns.update(self.expandable[name])
+            else:
+                columns.update(self.sources[name])
+        return columns
+
+    def values(self, queryset):
+        # The ordering columns are selected too, for the keyset paginator
+        ordering = {name.lstrip('-') for name in queryset.query.order_by if isinstance(name, str)}
+        return queryset.values(*sorted(self.columns | ordering))
+
+    def offset(self, date, time):
+        key = (date, time.hour)
+        if key not in self.offsets:
+            # Offsets only change on the hour (DST transitions)
+            aware = timezone.make_aware(datetime.combine(date, time.replace(minute=0, second=0, microsecond=0)), self.tz)
+            self.offsets[key] = aware.isoformat()[19:]
+        return self.offsets[key]
+
+    def timestamp(self, date, time):
+        if not date or not time:
+            return None
+        stamp = f'{date.isoformat()}T{time.isoformat()}'
+        return stamp + self.offset(date, time) if self.tz else stamp
+
+    @staticmethod
+    def description(text, html):
+        # Same fallback as the serializers for rows not yet given a description_text
+        if text or not html:
+            return text
+        return html_to_text(html)
+
+    def serialize(self, rows):
+        if self.complete:
+            return [self.to_representation(row) for row in rows]
+        builders = [(name, self.builder(name)) for name in self.fields]
+        return [{name: build(row) for name, build in builders} for row in rows]
+
+    def group_representation(self, row):
+        return {
+            'id': row['group__id'],
+            'name': row['group__name'],
+            'description': self.description(row['group__description_text'], row['group__description']),
+            'website': row['group__website'],
+            'contact_email': row['group__contact_email'],
+            'telegram_channel': row['group__telegram_channel'],
+            'telegram_webhook_channel': row['group__telegram_webhook_channel'],
+        }
+
+    def builder(self, name):
+        """Function turning a row into the value of one output field"""
+        if name == 'group':
+            return self.group_representation if 'group' in self.expand else lambda row: row['group']
+        if name in ('date', 'start_time', 'end_time'):
+            return lambda row: row[name].isoformat() if row[name] else None
+        if name in ('start_timestamp', 'end_timestamp'):
+            column = self.sources[name][1]
+            return lambda row: self.timestamp(row['date'], row[column])
+        if name == 'description':
+            return lambda row: self.description(row['description_text'], row['description'])
+        column = self.sources[name][0]
+        return lambda row: row[column]
+
+    def to_representation(self, row):
+        date, start_time, end_time = row['date'], row['start_time'], row['end_time']
+        return {
+            'id': row['id'],
+            'title': row['title'],
+            'group': self.group_representation(row),
+            'date': date.isoformat() if date else None,
+            'start_time': start_time.isoformat() if start_time else None,
+            'end_time': end_time.isoformat() if end_time else None,
+            'start_timestamp': self.timestamp(date, start_time),
+            'end_timestamp': self.timestamp(date, end_time),
+            'description': self.description(row['description_text'], row['description']),
+            'address': row['address'],
+            'city': row['city'],
+            'state': row['state'],
+            'status': row['status'],
+            'age_restriction': row['age_restriction'],
+            'capacity': row['capacity'],
+            'waitlist_enabled': row['waitlist_enabled'],
+            'attendee_list_public': row['attendee_list_public'],
+            'enable_rsvp_questions': row['enable_rsvp_questions'],
+        }
@@ -1,9 +1,15 @@
+import logging
+
 from django.db.models.signals import post_save, post_delete, post_migrate
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from django.db import connection
+from django.db import connection, router
 from django.apps import apps
-from .models import Event, RSVP, Group, PlatformStats
+from .models import Event, RSVP, Group, PlatformStats, Change, WebhookEndpoint, WebhookDelivery, ArchivedEvent, ArchivedRSVP
+from .caching import bump_version
+from . import search
+
+logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=Event)
 def increment_event_stats(sender, instance, created, **kwargs):
@@ -54,6 +60,146 @@ def decrement_group_stats(sender, instance, **kwargs):
         pass
 
 
+# Cached read models (see events.caching) are keyed by these version stamps
+@receiver([post_save, post_delete], sender=Event)
+def invalidate_event_caches(sender, instance, **kwargs):
+    bump_version('events', f'event:{instance.pk}')
+
+@receiver([post_save, post_delete], sender=Group)
+def invalidate_group_caches(sender, instance, **kwargs):
+    bump_version('groups')
+
+@receiver([post_save, post_delete], sender=RSVP)
+def invalidate_rsvp_caches(sender, instance, **kwargs):
+    bump_version(f'event:{instance.event_id}:rsvps')
+    if instance.user_id:
+        bump_version(f'user:{instance.user_id}:rsvps')
+
+@receiver([post_save, post_delete], sender='users.Profile')
+def invalidate_profile_name_caches(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'display_name' in update_fields:
+        bump_version('names')
+
+@receiver(post_save, sender=User)
+def invalidate_user_name_caches(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login; don't throw away every attendee list for those
+    if update_fields is None or 'username' in update_fields:
+        bump_version('names')
+
+# Entries for the /api/changes/ feed; cancelled events are tombstones like deleted ones
+@receiver(post_save, sender=Event)
+def record_event_change(sender, instance, **kwargs):
+    Change.record('event', instance.pk, deleted=instance.status != 'active')
+
+@receiver(post_save, sender=Group)
+def record_group_change(sender, instance, **kwargs):
+    Change.record('group', instance.pk)
+
+@receiver(post_save, sender=RSVP)
+def record_rsvp_change(sender, instance, **kwargs):
+    Change.record('rsvp', instance.pk)
+
+@receiver(post_delete, sender=Event)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=RSVP)
+def record_deletion(sender, instance, **kwargs):
+    Change.record(sender._meta.model_name, instance.pk, deleted=True)
+
+# Outbound notifications (see events.webhooks)
+@receiver(post_save, sender=Event)
+def notify_event_change(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        from events import webhooks
+        webhooks.event_changed(instance, created)
+
+@receiver(post_save, sender=RSVP)
+def notify_rsvp_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        from events import webhooks
+        webhooks.rsvp_changed(instance)
+
+@receiver(post_delete, sender=RSVP)
+def notify_rsvp_deletion(sender, instance, **kwargs):
+    from events import webhooks
+    webhooks.rsvp_changed(instance, deleted=True)
+
+@receiver([post_save, post_delete], sender=WebhookEndpoint)
+def invalidate_webhook_caches(sender, instance, **kwargs):
+    bump_version('webhooks')
+
+@receiver(post_delete, sender=WebhookEndpoint)
+def delete_webhook_deliveries(sender, instance, **kwargs):
+    # Deliveries live in the queue database, out of reach of the cascade
+    WebhookDelivery.objects.filter(endpoint_id=instance.pk).delete()
+
+# Archived events live in the archive database, out of reach of the cascades
+@receiver(post_delete, sender=Group)
+def delete_archived_group_events(sender, instance, **kwargs):
+    ArchivedEvent.objects.filter(group_id=instance.pk).delete()
+
+@receiver(post_delete, sender=User)
+def clear_archived_user_references(sender, instance, **kwargs):
+    ArchivedRSVP.objects.filter(user_id=instance.pk).delete()
+    ArchivedEvent.objects.filter(organizer_id=instance.pk).update(organizer=None)
+
+# Full-text search index (see events.search)
+@receiver(post_save, sender=Event)
+def index_event(sender, instance, **kwargs):
+    search.index_events([instance.pk])
+
+@receiver(post_delete, sender=Event)
+def unindex_event(sender, instance, **kwargs):
+    search.remove_events([instance.pk])
+
+@receiver(post_save, sender=Group)
+def index_group(sender, instance, **kwargs):
+    search.index_groups([instance.pk])
+
+@receiver(post_delete, sender=Group)
+def unindex_group(sender, instance, **kwargs):
+    search.remove_groups([instance.pk])
+
+@receiver(post_migrate)
+def create_search_index(sender, using='default', **kwargs):
+    if sender.name == 'events' and router.allow_migrate_model(using, Event):
+        search.create_index(using)
+
+# (app_label, model_name, field) columns searched with icontains. On Postgres
+# icontains compiles to UPPER(col::text) LIKE UPPER(...), which a trigram GIN
+# index over the same expression can serve.
+TRIGRAM_SEARCH_COLUMNS = [
+    ('events', 'event', 'title'),
+    ('events', 'event', 'description'),
+    ('events', 'event', 'city'),
+    ('events', 'group', 'name'),
+    ('events', 'group', 'description'),
+    ('auth', 'user', 'username'),
+    ('users', 'profile', 'display_name'),
+]
+
+@receiver(post_migrate)
+def create_trigram_indexes(sender, using='default', **kwargs):
+    """Create pg_trgm indexes for the icontains searches after migrating on PostgreSQL"""
+    from django.db import connections
+    connection = connections[using]
+    if connection.vendor != 'postgresql' or sender.name != 'events':
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for app_label, model_name, field_name in TRIGRAM_SEARCH_COLUMNS:
+                model = apps.get_model(app_label, model_name)
+                table = model._meta.db_table
+                column = model._meta.get_field(field_name).column
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{table}_{column}_trgm" '
+                    f'ON "{table}" USING gin ((UPPER("{column}"::text)) gin_trgm_ops)'
+                )
+    except Exception:
+        # Creating the extension needs elevated privileges on some hosts
+        logger.warning('Could not create trigram indexes', exc_info=True)
+
+
 def initialize_platform_stats():
     """Initialize platform stats when the app starts"""
     try:
@@ -0,0 +1,245 @@
+"""
+Telegram Bot API client and the outbox sender that delivers queued messages
+from a django-q worker instead of the request/response cycle
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django_q.models import Schedule
+from django_q.tasks import async_task
+
+from events.caching import state_cache
+from events.models import OutboundMessage
+from events.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096
+DRAIN_TASK = 'events.telegram.drain_outbox'
+DRAIN_LOCK_SECONDS = 120
+
+
+class TelegramError(Exception):
+    pass
+
+
+class TelegramRetryAfter(TelegramError):
+    """Raised on HTTP 429; retry_after is the number of seconds Telegram asked us to wait"""
+
+    def __init__(self, retry_after, description=''):
+        super().__init__(description or f'Too Many Requests: retry after {retry_after}')
+        self.retry_after = retry_after
+
+
+_local = threading.local()
+
+
+def get_session():
+    """Per-thread pooled session so repeated calls reuse the TLS connection to the Bot API"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _local.session = session
+    return session
+
+
+def call_api(method, payload, timeout=None):
+    """
+    Call a Bot API method.
+    Returns:
+        The "result" field of the response
+    Raises:
+        TelegramRetryAfter: Telegram is rate limiting us.
+        TelegramError: Any other transport or API failure.
+    """
+    url = f'{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_BOT_TOKEN}/{method}'
+    try:
+        response = get_session().post(url, json=payload, timeout=timeout or settings.TELEGRAM_API_TIMEOUT)
+        body = response.json()
+    except requests.RequestException as e:
+        raise TelegramError(str(e)) from e
+    except ValueError:
+        raise TelegramError(f'{method}: HTTP {response.status_code} with a non-JSON body')
+    if response.status_code == 429 or body.get('error_code') == 429:
+        retry_after = (body.get('parameters') or {}).get('retry_after', 1)
+        raise TelegramRetryAfter(retry_after, body.get('description', ''))
+    if not body.get('ok'):
+        raise TelegramError(body.get('description') or f'{method}: HTTP {response.status_code}')
+    return body.get('result')
+
+
+def global_bucket():
+    rate, per = settings.TELEGRAM_GLOBAL_RATE
+    return TokenBucket('telegram:global', rate, per)
+
+
+def chat_bucket(chat_id):
+    chat_id = str(chat_id)
+    # Private chats have positive numeric ids; groups are negative, channels may be @names
+    if chat_id.isdigit():
+        rate, per = settings.TELEGRAM_PRIVATE_CHAT_RATE
+    else:
+        rate, per = settings.TELEGRAM_GROUP_CHAT_RATE
+    return TokenBucket(f'telegram:chat:{chat_id}', rate, per)
+
+
+def enqueue_message(chat_id, text, parse_mode=None, reply_markup=None, coalesce=False):
+    """
+    Queue a message for the background sender.
+    Args:
+        chat_id (str): Telegram chat ID or @channel name.
+        text (str): Message text.
+        parse_mode (str, optional): Telegram parse mode (e.g., 'Markdown').
+        reply_markup (dict, optional): Inline keyboard or other markup.
+        coalesce (bool): Hold the message for TELEGRAM_COALESCE_SECONDS and send
+            it together with other coalesced messages for the same chat.
+    Returns:
+        OutboundMessage: The queued row, or None if there was nothing to send
+    """
+    if not chat_id or not text:
+        return None
+    send_at = timezone.now()
+    coalesce_key = ''
+    if coalesce:
+        coalesce_key = f'{chat_id}:{parse_mode or ""}'
+        send_at = coalesce_window_end(coalesce_key)
+    message = OutboundMessage.objects.create(
+        chat_id=str(chat_id),
+        text=text,
+        parse_mode=parse_mode or '',
+        reply_markup=reply_markup,
+        coalesce_key=coalesce_key,
+        next_attempt_at=send_at,
+    )
+    schedule_drain(send_at)
+    return message
+
+
+def coalesce_window_end(coalesce_key):
+    """Every message in a burst shares the send time set by the first one"""
+    window = settings.TELEGRAM_COALESCE_SECONDS
+    key = f'telegram:coalesce:{coalesce_key}'
+    window_end = timezone.now() + timedelta(seconds=window)
+    if state_cache.add(key, window_end, window):
+        return window_end
+    return state_cache.get(key) or window_end
+
+
+def schedule_drain(at=None):
+    """Make sure a drain_outbox task will run at (or shortly after) the given time"""
+    if at is None or at <= timezone.now():
+        # Collapse a burst of enqueues into one pending task
+        if state_cache.add('telegram:drain_queued', 1, 30):
+            async_task(DRAIN_TASK)
+        return
+    if state_cache.add(f'telegram:drain_at:{int(at.timestamp())}', 1, int((at - timezone.now()).total_seconds()) + 60):
+        Schedule.objects.create(func=DRAIN_TASK, schedule_type=Schedule.ONCE, repeats=1, next_run=at)
+
+
+def batch_messages(messages):
+    """
+    Group due messages into sends. Messages sharing a coalesce key are joined
+    into as few messages as fit under Telegram's length limit.
+    """
+    batches = []
+    open_batches = {}
+    for message in messages:
+        if not message.coalesce_key:
+            batches.append([message])
+            continue
+        batch = open_batches.get(message.coalesce_key)
+        if batch and len(joined_text(batch + [message])) <= MAX_MESSAGE_LENGTH:
+            batch.append(message)
+        else:
+            batch = [message]
+            open_batches[message.coalesce_key] = batch
+            batches.append(batch)
+    return batches
+
+
+def joined_text(batch):
+    return '\n\n'.join(message.text for message in batch)
+
+
+def send_batch(batch):
+    """
+    Send one batch, respecting the per-chat and global token buckets.
+    Returns:
+        bool: True if the batch was sent
+    """
+    head = batch[0]
+    ids = [message.id for message in batch]
+    pending = OutboundMessage.objects.filter(id__in=ids)
+
+    wait = chat_bucket(head.chat_id).consume()
+    if wait:
+        pending.update(next_attempt_at=timezone.now() + timedelta(seconds=wait))
+        return False
+    bucket = global_bucket()
+    while wait := bucket.consume():
+        # The global limit refills within a second, so just wait for it
+        time.sleep(wait)
+
+    payload = {'chat_id': head.chat_id, 'text': joined_text(batch)}
+    if head.parse_mode:
+        payload['parse_mode'] = head.parse_mode
+    if head.reply_markup and len(batch) == 1:
+        payload['reply_markup'] = head.reply_markup
+    try:
+        call_api('sendMessage', payload)
+    except TelegramRetryAfter as e:
+        # Not the message's fault, so it doesn't count towards the attempt limit
+        chat_bucket(head.chat_id).drain()
+        pending.update(next_attempt_at=timezone.now() + timedelta(seconds=e.retry_after), last_error=str(e))
+        return False
+    except TelegramError as e:
+        attempts = head.attempts + 1
+        logger.warning('Telegram send to %s failed (attempt %s): %s', head.chat_id, attempts, e)
+        if attempts >= settings.TELEGRAM_MAX_ATTEMPTS:
+            pending.update(status='failed', attempts=F('attempts') + 1, last_error=str(e))
+        else:
+            backoff = timedelta(seconds=5 * 2 ** attempts)
+            pending.update(next_attempt_at=timezone.now() + backoff, attempts=F('attempts') + 1, last_error=str(e))
+        return False
+    pending.update(status='sent', sent_at=timezone.now(), attempts=F('attempts') + 1, last_error='')
+    return True
+
+
+def drain_outbox(limit=100):
+    """
+    Send every due outbox message. Runs as a django-q task; only one drain
+    works the outbox at a time.
+    Returns:
+        int: Number of messages delivered
+    """
+    state_cache.delete('telegram:drain_queued')
+    if not state_cache.add('telegram:drain_lock', 1, DRAIN_LOCK_SECONDS):
+        # Another drain is running; look again once it has had time to finish
+        schedule_drain(timezone.now() + timedelta(seconds=5))
+        return 0
+    delivered = 0
+    try:
+        while True:
+            due = list(OutboundMessage.objects.filter(status='pending', next_attempt_at__lte=timezone.now())[:limit])
+            if not due:
+                break
+            for batch in batch_messages(due):
+                if send_batch(batch):
+                    delivered += len(batch)
+    finally:
+        state_cache.delete('telegram:drain_lock')
+
+    next_due = OutboundMessage.objects.filter(status='pending').values_list('next_attempt_at', flat=True).first()
+    if next_due:
+        schedule_drain(next_due)
+    return delivered
@@ -0,0 +1,264 @@
+"""
+Telegram bot commands and callbacks, shared by the webhook view and the
+long-polling worker. Handlers don't talk to Telegram themselves: they return
+the Bot API call to answer with, e.g. {'method': 'sendMessage', ...}, which
+the webhook can put straight into its HTTP response.
+"""
+import logging
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from django_q.tasks import async_task
+
+from events.caching import cached, state_cache
+from events.models import Event, Group, RSVP
+from events.telegram import call_api, enqueue_message, TelegramError
+from users.models import Profile
+
+logger = logging.getLogger(__name__)
+
+# Telegram retries an update until it gets a 200, so remember ids a while longer than that
+UPDATE_DEDUPE_SECONDS = 3600
+
+RSVP_ACTIONS = {
+    'confirm': 'confirmed',
+    'maybe': 'maybe',
+    'no': 'not_attending',
+    'waitlist': 'waitlisted',
+}
+
+
+def reply(chat_id, text, parse_mode=None, reply_markup=None):
+    payload = {'method': 'sendMessage', 'chat_id': chat_id, 'text': text}
+    if parse_mode:
+        payload['parse_mode'] = parse_mode
+    if reply_markup:
+        payload['reply_markup'] = reply_markup
+    return payload
+
+
+def claim_update(update):
+    """False if this update_id has already been handled, or is being handled"""
+    update_id = update.get('update_id')
+    if update_id is None:
+        return True
+    return state_cache.add(f'telegram:update:{update_id}', 1, UPDATE_DEDUPE_SECONDS)
+
+
+def release_update(update):
+    """Drop a claim whose handling failed, so Telegram's redelivery gets handled"""
+    update_id = update.get('update_id')
+    if update_id is not None:
+        state_cache.delete(f'telegram:update:{update_id}')
+
+
+def is_slow(update):
+    """RSVP changes write to the database, so they are handled off the request path"""
+    data = update.get('callback_query', {}).get('data', '')
+    return data.startswith('rsvp_') and not data.startswith('rsvp_menu_')
+
+
+def acknowledge(update):
+    """Answer a callback query straight away so the client stops its spinner"""
+    return {
+        'method': 'answerCallbackQuery',
+        'callback_query_id': update['callback_query']['id'],
+        'text': 'Updating your RSVP…',
+    }
+
+
+def deliver(response):
+    """Send a handler's reply when there is no webhook response to carry it"""
+    if not response:
+        return
+    payload = dict(response)
+    method = payload.pop('method')
+    if method == 'sendMessage':
+        enqueue_message(payload['chat_id'], payload['text'], parse_mode=payload.get('parse_mode'), reply_markup=payload.get('reply_markup'))
+        return
+    try:
+        call_api(method, payload)
+    except TelegramError as e:
+        logger.warning('Telegram %s failed: %s', method, e)
+
+
+def process_update(update, base_url=None):
+    """django-q task for deferred updates; also used by the polling worker"""
+    deliver(handle_update(update, base_url))
+
+
+def defer_update(update, base_url=None):
+    async_task('events.telegram_bot.process_update', update, base_url)
+
+
+def event_list(events, base_url):
+    keyboard = []
+    lines = []
+    for event in events:
+        url = f"{base_url}{reverse('event_detail', args=[str(event['id'])])}"
+        keyboard.append([
+            {"text": event['title'], "callback_data": f"rsvplist_{event['id']}"},
+            {"text": "RSVP", "callback_data": f"rsvp_menu_{event['id']}"}
+        ])
+        lines.append(f"• <a href='{url}'>{event['title']}</a> — <code>{event['date'].strftime('%m/%d/%Y')}</code>\n")
+    return lines, keyboard
+
+
+def upcoming_events(today, group_id=None):
+    """Next ten events from today, for one group or all of them; cached until any event changes"""
+    def build():
+        events = Event.objects.filter(date__gte=today)
+        if group_id:
+            events = events.filter(group_id=group_id)
+        return list(events.order_by('date').values('id', 'title', 'date')[:10])
+    return cached(f'bot:upcoming:{group_id or "all"}:{today.isoformat()}', ['events'], build)
+
+
+def confirmed_attendee_names(event_id):
+    """Display names of an event's confirmed attendees; cached until its RSVPs or any name changes"""
+    def build():
+        rows = RSVP.objects.filter(event_id=event_id, status='confirmed').order_by('timestamp').values_list(
+            'user_id', 'user__username', 'user__profile__display_name', 'name'
+        )
+        return [
+            (display_name or username) if user_id else (name or 'Anonymous')
+            for user_id, username, display_name, name in rows
+        ]
+    return cached(f'bot:attendees:{event_id}', [f'event:{event_id}:rsvps', 'names'], build)
+
+
+def upcoming_event(event_id, today, group=None):
+    if not event_id.isdigit():
+        return None
+    events = Event.objects.filter(id=event_id, date__gte=today)
+    if group:
+        events = events.filter(group=group)
+    return events.first()
+
+
+def handle_update(update, base_url=None):
+    """
+    Work out the bot's answer to one update.
+    Args:
+        update (dict): A Telegram Update object.
+        base_url (str, optional): Scheme and host for links; defaults to settings.SITE_URL.
+    Returns:
+        dict: A Bot API call with its 'method', or None if there is nothing to say
+    """
+    base_url = base_url or settings.SITE_URL
+    today = timezone.now().date()
+
+    callback = update.get('callback_query')
+    message = update.get('message') or (callback or {}).get('message') or {}
+    chat_id = message.get('chat', {}).get('id')
+
+    # Identify the sender; the numeric id is stable, the username can change
+    sender = (callback or message).get('from') or {}
+    telegram_id = sender.get('id')
+    username = sender.get('username')
+
+    # Try to find a group for this chat
+    group = Group.objects.filter(telegram_webhook_channel=str(chat_id)).first() if chat_id else None
+
+    if callback:
+        return handle_callback(callback.get('data', ''), chat_id, group, telegram_id, username, today, base_url)
+
+    text = message.get('text', '')
+    if text.startswith('/event'):
+        return handle_event_command(text.split(), chat_id, group, today, base_url)
+    return None
+
+
+def handle_callback(data_str, chat_id, group, telegram_id, username, today, base_url):
+    # Show all groups
+    if data_str == "show_all_groups":
+        msg = "<b>Upcoming Events (All Groups)</b>\n\n"
+        lines, keyboard = event_list(upcoming_events(today), base_url)
+        msg += ''.join(lines) if lines else "No events found."
+        return reply(chat_id, msg, parse_mode="HTML", reply_markup={"inline_keyboard": keyboard})
+
+    # RSVP menu
+    if data_str.startswith("rsvp_menu_"):
+        event = upcoming_event(data_str.split("_", 2)[2], today)
+        if not event:
+            return reply(chat_id, "Event not found.")
+        profile = Profile.find_by_telegram(telegram_id, username)
+        user = profile.user if profile else None
+        # Check if user already RSVP'd
+        existing_rsvp = RSVP.objects.filter(event=event, user=user).exists() if user else False
+        # Check if event is full
+        confirmed_count = len(confirmed_attendee_names(event.id))
+        is_full = event.capacity is not None and confirmed_count >= event.capacity
+        keyboard = [[
+            {"text": "✅ Confirm", "callback_data": f"rsvp_confirm_{event.id}"},
+            {"text": "❔ Maybe", "callback_data": f"rsvp_maybe_{event.id}"},
+            {"text": "🚫 Not Attending", "callback_data": f"rsvp_no_{event.id}"}
+        ]]
+        if is_full and event.waitlist_enabled:
+            keyboard.append([{"text": "⏳ Waitlist", "callback_data": f"rsvp_waitlist_{event.id}"}])
+        if existing_rsvp:
+            keyboard.append([{"text": "Remove RSVP", "callback_data": f"rsvp_remove_{event.id}"}])
+        return reply(chat_id, f"<b>Choose your RSVP status for</b> <i>{event.title}</i>", parse_mode="HTML", reply_markup={"inline_keyboard": keyboard})
+
+    # RSVP actions
+    for action in [*RSVP_ACTIONS, "remove"]:
+        if data_str.startswith(f"rsvp_{action}_"):
+            event_id = data_str.split("_", 2)[2]
+            return handle_rsvp_action(action, event_id, chat_id, telegram_id, username, today)
+
+    # RSVP list
+    if data_str.startswith("rsvplist_"):
+        event = upcoming_event(data_str.split("_", 1)[1], today, group)
+        if not event:
+            return reply(chat_id, "Event not found.")
+        if not group and not event.attendee_list_public:
+            return reply(chat_id, "The group organizer has hidden RSVPs from the public view.")
+        names = confirmed_attendee_names(event.id)
+        if names:
+            msg = f"<b>RSVP'd Users for</b> <i>{event.title}</i>\n\n" + "\n".join([f"• {name}" for name in names])
+        else:
+            msg = f"<b>RSVP'd Users for</b> <i>{event.title}</i>\n\n<em>No RSVPs yet.</em>"
+        return reply(chat_id, msg, parse_mode="HTML")
+    return None
+
+
+def handle_rsvp_action(action, event_id, chat_id, telegram_id, username, today):
+    event = upcoming_event(event_id, today)
+    if not event:
+        return reply(chat_id, "Event not found.")
+    profile = Profile.find_by_telegram(telegram_id, username)
+    if not profile:
+        return reply(chat_id, "You must link your Telegram username in your FURsvp profile to RSVP.")
+    user = profile.user
+    if action == "remove":
+        deleted, _ = RSVP.objects.filter(event=event, user=user).delete()
+        if deleted:
+            return reply(chat_id, "Your RSVP has been removed.")
+        return reply(chat_id, "You do not have an RSVP for this event.")
+    status = RSVP_ACTIONS[action]
+    rsvp, created = RSVP.objects.get_or_create(event=event, user=user, defaults={'status': status})
+    if not created and rsvp.status != status:
+        rsvp.status = status
+        rsvp.save()
+    label = 'Waitlisted' if action == 'waitlist' else 'Not Attending' if action == 'no' else action.capitalize()
+    return reply(chat_id, f"Your RSVP status for <b>{event.title}</b> is now <b>{label}</b>.", parse_mode="HTML")
+
+
+def handle_event_command(parts, chat_id, group, today, base_url):
+    if len(parts) == 1:
+        # List upcoming events for this group if found, else all
+        msg = "<b>Upcoming Events</b>\n\n"
+        lines, keyboard = event_list(upcoming_events(today, group.id if group else None), base_url)
+        msg += ''.join(lines) if lines else "No events found for this group."
+        # Always add the Show All Groups button if in a group
+        if group:
+            keyboard.append([{"text": "Show All Groups", "callback_data": "show_all_groups"}])
+        return reply(chat_id, msg, parse_mode="HTML", reply_markup={"inline_keyboard": keyboard})
+
+    event = upcoming_event(parts[1], today, group)
+    if not event:
+        return reply(chat_id, "No event found.")
+    url = f"{base_url}{event.get_absolute_url()}"
+    msg = f"<b>{event.title}</b>\nDate: <code>{event.date.strftime('%m/%d/%Y')}</code>\n<a href='{url}'>View Event</a>\n\n{event.description or ''}"
+    return reply(chat_id, msg, parse_mode="HTML")
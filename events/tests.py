@@ -1,3 +1,1465 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.conf import settings
+from django.db import DatabaseError, connection, connections
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from events import archive, deletion, exports, ical, ratelimit, search, telegram, telegram_bot, webhooks
+from events.caching import state_cache
+from events.models import (
+    ArchivedEvent, ArchivedRSVP, Change, Event, Group, OutboundMessage, RateLimitBucket, RSVP, WebhookDelivery, WebhookEndpoint,
+)
+from events.renderers import ORJSONRenderer
+from events.serializers import EventRows, EventSerializer
+from users import audit
+from users.models import AuditLog, BannedUser, GroupRole, Notification, Profile
+
+
+class QueryPlanTests(TestCase):
+    """
+    Run EXPLAIN QUERY PLAN on the hot queries and fail if any of them falls
+    back to a full table scan.
+    """
+    databases = {'default', 'cache'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner', password='x')
+        cls.group = Group.objects.create(name='Plan Group', telegram_webhook_channel='@plangroup')
+        cls.event = Event.objects.create(
+            group=cls.group,
+            organizer=cls.user,
+            title='Plan Event',
+            date=date(2030, 1, 1),
+            start_time=time(18, 0),
+            end_time=time(20, 0),
+            address='1 Plan St',
+            description='',
+        )
+
+    def assertIndexed(self, queryset, table):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plan assertions are written for SQLite')
+        plan = queryset.explain()
+        # SQLite reports "SCAN <table>" for a full scan and
+        # "SCAN <table> USING [COVERING] INDEX ..." when walking an index;
+        # before 3.36 it says "SCAN TABLE <table>" instead
+        full_scan = re.search(rf'SCAN (TABLE )?{table}\b(?! USING (COVERING )?INDEX)', plan)
+        self.assertIsNone(full_scan, f'Full scan of {table}:\n{plan}')
+
+    def test_upcoming_events(self):
+        qs = Event.objects.filter(status='active', date__gte=timezone.now().date()).order_by('date', 'start_time')
+        self.assertIndexed(qs, 'events_event')
+
+    def test_group_events(self):
+        qs = Event.objects.filter(group=self.group, status='active').order_by('date')
+        self.assertIndexed(qs, 'events_event')
+
+    def test_event_title_sort(self):
+        self.assertIndexed(Event.objects.order_by(Lower('title')), 'events_event')
+
+    def test_group_name_sort(self):
+        self.assertIndexed(Group.objects.order_by(Lower('name')), 'events_group')
+
+    def test_group_by_webhook_channel(self):
+        qs = Group.objects.filter(telegram_webhook_channel='@plangroup')
+        self.assertIndexed(qs, 'events_group')
+
+    def test_rsvps_by_event_and_status(self):
+        qs = RSVP.objects.filter(event=self.event, status='confirmed').order_by('timestamp')
+        self.assertIndexed(qs, 'events_rsvp')
+
+    def test_rsvps_by_user(self):
+        self.assertIndexed(RSVP.objects.filter(user=self.user), 'events_rsvp')
+
+    def test_profile_by_telegram_identity(self):
+        qs = Profile.objects.filter(Q(telegram_id=12345) | Q(telegram_handle='planner'))
+        self.assertIndexed(qs, 'users_profile')
+
+    def test_unread_notifications(self):
+        qs = Notification.objects.filter(user=self.user, is_read=False).order_by('-timestamp')
+        self.assertIndexed(qs, 'users_notification')
+
+    def test_banned_user_by_organizer(self):
+        qs = BannedUser.objects.filter(user=self.user, organizer=self.user)
+        self.assertIndexed(qs, 'users_banneduser')
+
+
+class TelegramIdentityTests(TestCase):
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+
+    def set_telegram(self, user, username, telegram_id=None):
+        profile = user.profile
+        profile.telegram_username = username
+        profile.telegram_id = telegram_id
+        profile.save()
+        return profile
+
+    def test_handle_is_normalized_on_save(self):
+        profile = self.set_telegram(self.alice, ' @Alice_Fox ')
+        self.assertEqual(profile.telegram_handle, 'alice_fox')
+        profile.telegram_username = ''
+        profile.save()
+        self.assertIsNone(profile.telegram_handle)
+
+    def test_lookup_is_case_insensitive_single_query(self):
+        self.set_telegram(self.alice, 'Alice_Fox')
+        with CaptureQueriesContext(connection) as queries:
+            profile = Profile.find_by_telegram(username='@ALICE_fox')
+            self.assertEqual(profile.user, self.alice)
+        self.assertEqual(len(queries), 1)
+
+    def test_telegram_id_wins_over_username(self):
+        self.set_telegram(self.alice, 'alice_fox')
+        self.set_telegram(self.bob, 'bob_wolf', telegram_id=42)
+        # Bob renamed himself on Telegram to a handle Alice typed in her profile
+        self.assertEqual(Profile.find_by_telegram(42, 'alice_fox').user, self.bob)
+        self.assertEqual(Profile.find_by_telegram(None, 'alice_fox').user, self.alice)
+
+    def test_verified_account_claims_handle(self):
+        self.set_telegram(self.alice, 'shared')
+        self.set_telegram(self.bob, 'Shared', telegram_id=7)
+        self.alice.profile.refresh_from_db()
+        self.assertIsNone(self.alice.profile.telegram_handle)
+        self.assertEqual(Profile.find_by_telegram(username='shared').user, self.bob)
+        # Saving the unverified profile again must not fight over the handle
+        self.alice.profile.save()
+        self.assertIsNone(self.alice.profile.telegram_handle)
+
+    def test_backfill_command(self):
+        self.set_telegram(self.alice, 'Alice_Fox')
+        Profile.objects.update(telegram_handle=None)
+        call_command('backfill_telegram_handles', stdout=StringIO())
+        self.assertEqual(Profile.objects.get(user=self.alice).telegram_handle, 'alice_fox')
+
+
+class TelegramOutboxTests(TestCase):
+    databases = {'default', 'queue', 'cache'}
+
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+        self.responses = []
+        session = mock.Mock()
+        session.post.side_effect = self.fake_post
+        patcher = mock.patch('events.telegram.get_session', return_value=session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_post(self, url, json=None, timeout=None):
+        self.calls.append(json)
+        status, body = self.responses.pop(0) if self.responses else (200, {'ok': True, 'result': {}})
+        return mock.Mock(status_code=status, json=mock.Mock(return_value=body))
+
+    def make_due(self):
+        OutboundMessage.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+    def test_rsvp_announcements_are_coalesced(self):
+        for name in ('alice', 'bob', 'carol'):
+            telegram.enqueue_message('@furs', f'{name} RSVP\'d', parse_mode='Markdown', coalesce=True)
+        # All three share the window opened by the first
+        self.assertEqual(OutboundMessage.objects.values('next_attempt_at').distinct().count(), 1)
+        self.assertEqual(telegram.drain_outbox(), 0)
+        self.make_due()
+        self.assertEqual(telegram.drain_outbox(), 3)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.calls[0]['text'], "alice RSVP'd\n\nbob RSVP'd\n\ncarol RSVP'd")
+        self.assertFalse(OutboundMessage.objects.filter(status='pending').exists())
+
+    def test_retry_after_defers_without_using_an_attempt(self):
+        telegram.enqueue_message('-100123', 'hello')
+        self.responses.append((429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': 30}}))
+        self.assertEqual(telegram.drain_outbox(), 0)
+        message = OutboundMessage.objects.get()
+        self.assertEqual(message.status, 'pending')
+        self.assertEqual(message.attempts, 0)
+        self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=25))
+
+    def test_private_chat_bucket_spaces_out_messages(self):
+        telegram.enqueue_message('123', 'first')
+        telegram.enqueue_message('123', 'second')
+        self.assertEqual(telegram.drain_outbox(), 1)
+        self.assertEqual(OutboundMessage.objects.get(status='pending').text, 'second')
+
+    def test_errors_give_up_after_max_attempts(self):
+        telegram.enqueue_message('-100123', 'hello')
+        for _ in range(settings.TELEGRAM_MAX_ATTEMPTS):
+            self.responses.append((400, {'ok': False, 'description': 'Bad Request: chat not found'}))
+            RateLimitBucket.objects.all().delete()
+            self.make_due()
+            telegram.drain_outbox()
+        message = OutboundMessage.objects.get()
+        self.assertEqual(message.status, 'failed')
+        self.assertEqual(message.last_error, 'Bad Request: chat not found')
+
+
+class TelegramWebhookTests(TestCase):
+    databases = {'default', 'queue', 'cache'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('fox', password='x')
+        profile = self.user.profile
+        profile.telegram_id = 555
+        profile.save()
+        self.group = Group.objects.create(name='Webhook Group')
+        self.event = Event.objects.create(
+            group=self.group,
+            organizer=self.user,
+            title='Webhook Event',
+            date=timezone.now().date() + timedelta(days=3),
+            description='',
+        )
+
+    def post(self, update):
+        return self.client.post(reverse('telegram_bot_webhook'), update, content_type='application/json')
+
+    def test_command_is_answered_in_the_response(self):
+        update = {'update_id': 1, 'message': {'chat': {'id': 99}, 'from': {'id': 555}, 'text': '/event'}}
+        body = self.post(update).json()
+        self.assertEqual(body['method'], 'sendMessage')
+        self.assertEqual(body['chat_id'], 99)
+        self.assertIn('Webhook Event', body['text'])
+        self.assertFalse(OutboundMessage.objects.exists())
+
+    def test_listings_are_served_from_cache_until_data_changes(self):
+        update = {'message': {'chat': {'id': 99}, 'text': '/event'}}
+        telegram_bot.handle_update(update)
+        with CaptureQueriesContext(connection) as queries:
+            telegram_bot.handle_update(update)
+        # Only the chat's group lookup reaches the main database
+        self.assertEqual(len(queries), 1)
+
+        self.event.title = 'Renamed Event'
+        self.event.save()
+        self.assertIn('Renamed Event', telegram_bot.handle_update(update)['text'])
+
+    def test_attendee_names_follow_rsvp_and_profile_changes(self):
+        update = {'callback_query': {'id': 'cb', 'from': {'id': 1}, 'message': {'chat': {'id': 99}}, 'data': f'rsvplist_{self.event.id}'}}
+        self.event.attendee_list_public = True
+        self.event.save()
+        self.assertIn('No RSVPs yet', telegram_bot.handle_update(update)['text'])
+        RSVP.objects.create(event=self.event, user=self.user, status='confirmed')
+        self.assertIn('• fox', telegram_bot.handle_update(update)['text'])
+        self.user.profile.display_name = 'Foxy'
+        self.user.profile.save()
+        self.assertIn('• Foxy', telegram_bot.handle_update(update)['text'])
+
+    def test_login_keeps_attendee_names_cached(self):
+        from django.contrib.auth.models import update_last_login
+        from events.caching import get_versions
+        before = get_versions('names')
+        update_last_login(None, self.user)
+        self.assertEqual(get_versions('names'), before)
+
+    def test_redelivered_update_is_ignored(self):
+        update = {'update_id': 2, 'message': {'chat': {'id': 99}, 'text': '/event'}}
+        self.assertEqual(self.post(update).json()['method'], 'sendMessage')
+        self.assertEqual(self.post(update).json(), {'ok': True})
+
+    def test_failed_update_is_handled_on_redelivery(self):
+        update = {'update_id': 4, 'message': {'chat': {'id': 99}, 'text': '/event'}}
+        self.client.raise_request_exception = False
+        with mock.patch('events.telegram_bot.handle_update', side_effect=RuntimeError):
+            self.assertEqual(self.post(update).status_code, 500)
+        self.assertEqual(self.post(update).json()['method'], 'sendMessage')
+
+    def test_rsvp_callback_is_acknowledged_and_deferred(self):
+        update = {'update_id': 3, 'callback_query': {
+            'id': 'cb1',
+            'from': {'id': 555, 'username': 'renamed'},
+            'message': {'chat': {'id': 555}},
+            'data': f'rsvp_confirm_{self.event.id}',
+        }}
+        with mock.patch('events.telegram_bot.defer_update') as defer:
+            body = self.post(update).json()
+        self.assertEqual(body['method'], 'answerCallbackQuery')
+        self.assertFalse(RSVP.objects.exists())
+
+        # What the django-q worker then runs
+        telegram_bot.process_update(*defer.call_args.args)
+        self.assertEqual(RSVP.objects.get(event=self.event, user=self.user).status, 'confirmed')
+        self.assertIn('Confirm', OutboundMessage.objects.get(chat_id='555').text)
+
+
+class FakeBotAPI(BaseHTTPRequestHandler):
+    """Minimal Bot API: serves queued updates from getUpdates and records every call"""
+    updates = []
+    calls = []
+
+    def do_POST(self):
+        method = self.path.rsplit('/', 1)[-1]
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])) or b'{}')
+        FakeBotAPI.calls.append((method, payload))
+        result = True
+        if method == 'getUpdates':
+            offset = payload.get('offset', 0)
+            result = [u for u in FakeBotAPI.updates if u['update_id'] >= offset]
+        body = json.dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TelegramWorkerTests(TestCase):
+    databases = {'default', 'queue', 'cache'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBotAPI)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        FakeBotAPI.calls = []
+        FakeBotAPI.updates = [
+            {'update_id': 10, 'message': {'chat': {'id': 7}, 'text': '/event'}},
+            {'update_id': 11, 'message': {'chat': {'id': 7}, 'text': 'hello'}},
+        ]
+        settings_override = override_settings(
+            TELEGRAM_API_URL=f'http://127.0.0.1:{self.server.server_address[1]}',
+            TELEGRAM_BOT_TOKEN='test',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_worker_replies_and_confirms_offset(self):
+        call_command('telegram_worker', once=True, poll_timeout=0, stdout=StringIO())
+        methods = [method for method, _ in FakeBotAPI.calls]
+        self.assertEqual(methods, ['getUpdates', 'sendMessage', 'getUpdates'])
+        self.assertEqual(FakeBotAPI.calls[1][1]['chat_id'], 7)
+        self.assertEqual(FakeBotAPI.calls[2][1]['offset'], 12)
+
+    def test_worker_skips_updates_already_handled(self):
+        telegram_bot.claim_update({'update_id': 10})
+        call_command('telegram_worker', once=True, poll_timeout=0, stdout=StringIO())
+        self.assertNotIn('sendMessage', [method for method, _ in FakeBotAPI.calls])
+
+
+class APIQueryCountTests(TestCase):
+    """Each endpoint runs the same number of queries however many rows it returns"""
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        self.organizer = User.objects.create_user('organizer', password='x')
+        self.group = Group.objects.create(name='API Group')
+        self.event = self.add_event()
+
+    def add_event(self):
+        return Event.objects.create(
+            group=Group.objects.create(name=f'Group {Group.objects.count()}'),
+            organizer=self.organizer,
+            title='API Event',
+            date=timezone.now().date() + timedelta(days=1),
+            start_time=time(23, 58),
+            end_time=time(23, 59),
+            description='<p>Hello</p>',
+            attendee_list_public=True,
+        )
+
+    def add_rows(self):
+        for i in range(3):
+            event = self.add_event()
+            user = User.objects.create_user(f'attendee{User.objects.count()}', password='x')
+            RSVP.objects.create(event=self.event, user=user, status='confirmed')
+            RSVP.objects.create(event=event, user=user, status='waitlisted')
+            RSVP.objects.create(event=self.event, name=f'Guest {i}', status='waitlisted')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries)
+
+    def test_query_counts_are_constant(self):
+        urls = [
+            '/api/events/',
+            f'/api/events/{self.event.id}/',
+            '/api/events/upcoming/',
+            '/api/events/today/',
+            f'/api/events/{self.event.id}/attendees/',
+            f'/api/events/{self.event.id}/waitlist/',
+            '/api/groups/',
+            f'/api/groups/{self.group.id}/events/',
+            '/api/users/',
+            f'/api/users/events/?user_id={self.organizer.id}',
+        ]
+        before = {url: self.count_queries(url) for url in urls}
+        self.add_rows()
+        after = {url: self.count_queries(url) for url in urls}
+        self.assertEqual(before, after)
+
+    def test_detail_counts_are_annotated(self):
+        self.add_rows()
+        data = self.client.get(f'/api/events/{self.event.id}/').json()
+        self.assertEqual((data['attendee_count'], data['waitlist_count']), (3, 3))
+
+
+class EventRowsTests(TestCase):
+    databases = {'default', 'cache'}
+
+    def test_fast_path_matches_serializer(self):
+        organizer = User.objects.create_user('rows', password='x')
+        group = Group.objects.create(name='Rows', description='<p>Group&nbsp;text</p>')
+        # Includes both DST transition days in America/New_York and missing times
+        for day, start, end in [
+            (date(2030, 3, 10), time(1, 30), time(3, 30)),
+            (date(2030, 11, 3), time(1, 15), time(23, 0)),
+            (date(2030, 7, 4), time(18, 0, 0, 500), None),
+            (date(2030, 1, 1), None, time(12, 0)),
+        ]:
+            Event.objects.create(
+                group=group, organizer=organizer, title=f'Event {day}', date=day,
+                start_time=start, end_time=end, description='<b>Bold</b>&nbsp;move', capacity=5,
+            )
+        # Rows saved before description_text existed
+        Event.objects.filter(date=date(2030, 1, 1)).update(description_text='')
+        Group.objects.update(description_text='')
+        events = Event.objects.select_related('group').order_by('date')
+        rows = EventRows()
+        expected = [dict(item, group=dict(item['group'])) for item in EventSerializer(events, many=True).data]
+        self.assertEqual(rows.serialize(rows.values(events)), expected)
+        self.assertIn('move', expected[0]['description'])
+        sparse = EventRows(fields=['description'])
+        self.assertEqual(sparse.serialize(sparse.values(events))[0], {'description': expected[0]['description']})
+
+    def test_renderer_matches_drf_formatting(self):
+        moment = datetime(2030, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc)
+        data = {'when': moment, 'day': moment.date(), 'text': 'fürry', 'items': [1, None, True]}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class APIConditionalCacheTests(TestCase):
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        self.organizer = User.objects.create_user('etag', password='x')
+        self.event = Event.objects.create(
+            group=Group.objects.create(name='ETag Group'),
+            organizer=self.organizer,
+            title='ETag Event',
+            date=timezone.now().date() + timedelta(days=2),
+            description='',
+        )
+        self.url = f'/api/events/{self.event.id}/attendees/'
+
+    def test_matching_etag_gets_304_without_querying(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(len(queries), 0)
+
+    def test_cached_body_is_shared_until_a_write(self):
+        first = self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            again = self.client.get(self.url)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(again.content, first.content)
+
+        RSVP.objects.create(event=self.event, user=self.organizer, status='confirmed')
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        self.assertEqual(len(changed.json()['results']), 1)
+
+    def test_query_parameter_order_does_not_matter(self):
+        first = self.client.get('/api/events/?city=x&state=y')
+        second = self.client.get('/api/events/?state=y&city=x')
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_etag_survives_losing_cached_responses(self):
+        first = self.client.get(self.url)
+        # As if the response cache had been culled
+        cache.clear()
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+
+class KeysetPaginationTests(TestCase):
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        self.organizer = User.objects.create_user('pages', password='x')
+        self.group = Group.objects.create(name='Pages')
+        today = timezone.now().date()
+        # Shared dates and missing start times make the tie-breaking matter
+        for i, (days, start) in enumerate([(3, time(18)), (3, None), (3, time(18)), (5, time(9)), (3, None), (-2, time(20)), (-2, None)]):
+            Event.objects.create(
+                group=self.group, organizer=self.organizer, title=f'Page {i}',
+                date=today + timedelta(days=days), start_time=start, end_time=time(23, 59), description='',
+            )
+
+    def walk(self, url, direction='next'):
+        ids = []
+        while url:
+            body = self.client.get(url).json()
+            self.assertNotIn('count', body)
+            page = [item['id'] for item in body['results']]
+            ids = ids + page if direction == 'next' else page + ids
+            url = body[direction]
+        return ids
+
+    def expected(self, events, descending=False):
+        key = lambda e: (e.date, e.start_time is not None, e.start_time or time.min, e.id)
+        return [e.id for e in sorted(events, key=key, reverse=descending)]
+
+    def test_pages_cover_every_row_once_in_order(self):
+        expected = self.expected(Event.objects.all())
+        self.assertEqual(self.walk('/api/events/?page_size=2'), expected)
+
+        # Walk back from the last page
+        last = self.client.get('/api/events/?page_size=2')
+        while last.json()['next']:
+            last = self.client.get(last.json()['next'])
+        self.assertEqual(self.walk(last.json()['previous'], 'previous'), expected[:-len(last.json()['results'])])
+
+    def test_descending_action_and_no_count_query(self):
+        past = Event.objects.filter(date__lt=timezone.now().date())
+        url = f'/api/groups/{self.group.id}/events/?type=past&page_size=1'
+        self.assertEqual(self.walk(url), self.expected(past, descending=True))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/api/events/upcoming/?page_size=2')
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql'].upper()])
+
+    def test_attendees_are_paginated(self):
+        event = Event.objects.first()
+        for i in range(5):
+            RSVP.objects.create(event=event, name=f'Guest {i}', status='confirmed')
+        ids = list(event.rsvps.order_by('timestamp', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk(f'/api/events/{event.id}/attendees/?page_size=2'), ids)
+
+    def test_bad_cursor_is_not_found(self):
+        for cursor in ['garbage', 'eyJwIjpbMV19', 'eyJwIjpbIngiLCJ5IiwieiIsMV19']:
+            self.assertEqual(self.client.get(f'/api/events/?cursor={cursor}').status_code, 404, cursor)
+
+
+class SparseFieldsTests(TestCase):
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        organizer = User.objects.create_user('sparse', password='x')
+        group = Group.objects.create(name='Sparse')
+        self.events = [
+            Event.objects.create(
+                group=group, organizer=organizer, title=f'Sparse {i}', description='<p>Long</p>',
+                date=timezone.now().date() + timedelta(days=i + 1), start_time=time(19),
+            )
+            for i in range(3)
+        ]
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [q['sql'] for q in queries if 'events_event' in q['sql']]
+
+    def test_only_requested_columns_are_selected(self):
+        response, queries = self.get('/api/events/?fields=id,title,start_timestamp')
+        item = response.json()['results'][0]
+        self.assertEqual(set(item), {'id', 'title', 'start_timestamp'})
+        self.assertTrue(item['start_timestamp'].startswith(self.events[0].date.isoformat()))
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('JOIN', queries[0])
+        self.assertNotIn('description', queries[0])
+
+    def test_group_is_an_id_unless_expanded(self):
+        response, _ = self.get('/api/events/?fields=id,group')
+        self.assertEqual(response.json()['results'][0]['group'], self.events[0].group_id)
+        response, queries = self.get('/api/events/upcoming/?fields=id,group&expand=group')
+        self.assertEqual(response.json()['results'][0]['group']['name'], 'Sparse')
+        self.assertIn('JOIN', queries[0])
+
+    def test_full_output_is_unchanged_without_fields(self):
+        item = self.client.get('/api/events/').json()['results'][0]
+        self.assertEqual(list(item), EventSerializer.Meta.fields)
+
+    def test_batch_fetch_by_ids(self):
+        wanted = [self.events[2].id, self.events[0].id]
+        response, queries = self.get(f'/api/events/?ids={wanted[0]},{wanted[1]}&fields=id')
+        self.assertEqual(response.json(), {'next': None, 'previous': None, 'results': [{'id': i} for i in sorted(wanted)]})
+        self.assertEqual(len(queries), 1)
+
+    def test_bad_parameters_are_rejected(self):
+        for url in ['/api/events/?fields=id,secret', '/api/events/?expand=organizer', '/api/events/?ids=1,x',
+                    '/api/events/?ids=' + ','.join(map(str, range(101)))]:
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+
+class UserEventsPrivacyTests(TestCase):
+    """UserViewSet.events shows the same RSVPs as before it moved into SQL"""
+    databases = {'default', 'cache', 'sessions'}
+
+    def setUp(self):
+        self.attendee = User.objects.create_user('attendee', password='x')
+        self.organizer = User.objects.create_user('host', password='x')
+        self.stranger = User.objects.create_user('stranger', password='x')
+        self.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        someone = User.objects.create_user('someone', password='x')
+        group = Group.objects.create(name='Privacy')
+        self.events = {}
+        for days, (name, organizer, public, event_status) in enumerate([
+            ('public', someone, True, 'active'),
+            ('hosted', self.organizer, False, 'active'),
+            ('private', someone, False, 'active'),
+            ('cancelled', self.organizer, True, 'cancelled'),
+        ]):
+            event = Event.objects.create(
+                group=group, organizer=organizer, title=name, date=date(2030, 1, 1) + timedelta(days=days),
+                description='', attendee_list_public=public, status=event_status,
+            )
+            RSVP.objects.create(event=event, user=self.attendee, status='confirmed')
+            self.events[name] = event
+
+    def visible(self, viewer=None, **params):
+        if viewer:
+            self.client.force_login(viewer)
+        else:
+            self.client.logout()
+        response = self.client.get('/api/users/events/', {'user_id': self.attendee.id, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_visibility_matrix(self):
+        matrix = [
+            (None, ['public']),
+            (self.stranger, ['public']),
+            (self.organizer, ['hosted', 'public']),
+            (self.staff, ['private', 'hosted', 'public']),
+            (self.attendee, ['private', 'hosted', 'public']),
+        ]
+        for viewer, expected in matrix:
+            with self.subTest(viewer=viewer and viewer.username):
+                titles = [item['event_title'] for item in self.visible(viewer)['events']]
+                self.assertEqual(titles, expected)
+
+    def test_pages_are_ordered_by_date_descending(self):
+        first = self.visible(self.attendee, page_size=2)
+        self.assertEqual([item['event_title'] for item in first['events']], ['private', 'hosted'])
+        self.assertEqual(first['count'], 2)
+        second = self.client.get(first['next']).json()
+        self.assertEqual([item['event_title'] for item in second['events']], ['public'])
+        self.assertEqual(second['count'], 1)
+        self.assertIsNone(second['next'])
+
+    def test_unknown_user_is_not_found(self):
+        for user_id in ['999999', 'abc']:
+            self.assertEqual(self.client.get('/api/users/events/', {'user_id': user_id}).status_code, 404)
+
+
+class ChangesFeedTests(TestCase):
+    databases = {'default', 'cache', 'sessions'}
+
+    def setUp(self):
+        self.organizer = User.objects.create_user('changes', password='x')
+        self.group = Group.objects.create(name='Feed')
+        self.event = Event.objects.create(
+            group=self.group, organizer=self.organizer, title='Feed Event',
+            date=date(2030, 5, 1), description='', attendee_list_public=False,
+        )
+        self.rsvp = RSVP.objects.create(event=self.event, name='Guest', status='confirmed')
+
+    def feed(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        response = self.client.get('/api/changes/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_feed_starts_with_every_object(self):
+        body = self.feed()
+        self.assertEqual([(c['type'], c['id']) for c in body['changes']], [
+            ('group', self.group.id), ('event', self.event.id), ('rsvp', self.rsvp.id),
+        ])
+        self.assertEqual(body['changes'][1]['data']['title'], 'Feed Event')
+        # The attendee list is private, so anonymous clients get a tombstone for the RSVP
+        self.assertTrue(body['changes'][2]['deleted'])
+        self.client.force_login(self.organizer)
+        self.assertEqual(self.feed()['changes'][2]['data']['name'], 'Guest')
+
+    def test_only_later_changes_and_tombstones_follow_the_cursor(self):
+        cursor = self.feed()['cursor']
+        self.assertEqual(self.feed(cursor)['changes'], [])
+
+        before = self.event.updated_at
+        self.event.title = 'Renamed'
+        self.event.save(update_fields=['title'])
+        self.event.refresh_from_db()
+        self.assertGreater(self.event.updated_at, before)
+        self.rsvp.delete()
+        body = self.feed(cursor)
+        self.assertEqual([(c['type'], c['deleted']) for c in body['changes']], [('event', False), ('rsvp', True)])
+        self.assertEqual(body['changes'][0]['data']['title'], 'Renamed')
+
+        self.event.status = 'cancelled'
+        self.event.save()
+        body = self.feed(body['cursor'])
+        self.assertEqual([(c['type'], c['id'], c['deleted']) for c in body['changes']], [('event', self.event.id, True)])
+        self.assertNotIn('data', body['changes'][0])
+
+    def test_each_object_appears_once_and_pages_are_bounded(self):
+        cursor = self.feed()['cursor']
+        for i in range(3):
+            self.group.name = f'Feed {i}'
+            self.group.save()
+        Group.objects.create(name='Another')
+        body = self.feed(cursor, limit=1)
+        self.assertEqual([c['id'] for c in body['changes']], [self.group.id])
+        self.assertTrue(body['has_more'])
+        rest = self.feed(body['cursor'])
+        self.assertEqual([c['data']['name'] for c in rest['changes']], ['Another'])
+        self.assertFalse(rest['has_more'])
+
+    def test_backfill_adds_missing_entries(self):
+        Change.objects.all().delete()
+        call_command('backfill_changes', stdout=StringIO())
+        self.assertEqual(
+            list(Change.objects.values_list('kind', 'object_id', 'deleted')),
+            [('group', self.group.id, False), ('event', self.event.id, False), ('rsvp', self.rsvp.id, False)],
+        )
+
+    def test_bad_cursor_is_rejected(self):
+        self.assertEqual(self.client.get('/api/changes/', {'since': 'abc'}).status_code, 400)
+
+    def test_concurrent_save_of_the_same_object_is_replaced(self):
+        replace = Change._replace
+        raced = []
+
+        def racing(kind, object_ids, deleted):
+            if raced:
+                return replace(kind, object_ids, deleted)
+            raced.append(True)
+            # Another request commits its entry between our delete and insert
+            Change.objects.filter(kind=kind, object_id__in=object_ids).delete()
+            Change.objects.create(kind=kind, object_id=object_ids[0])
+            return Change.objects.bulk_create([Change(kind=kind, object_id=object_ids[0], deleted=deleted)])
+
+        with mock.patch.object(Change, '_replace', racing):
+            self.group.save()
+        self.assertTrue(raced)
+        self.assertEqual(Change.objects.filter(kind='group', object_id=self.group.id).count(), 1)
+
+
+class CalendarFeedTests(TestCase):
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        self.attendee = User.objects.create_user('ical', password='x')
+        self.group = Group.objects.create(name='Calendar; Group')
+        self.event = self.add_event('Moonlight, Howl', time(22), time(1))
+        self.all_day = self.add_event('All day', None, None)
+        self.add_event('Old', time(18), time(19), days=-3)
+        RSVP.objects.create(event=self.event, user=self.attendee, status='confirmed')
+
+    def add_event(self, title, start, end, days=2):
+        return Event.objects.create(
+            group=self.group, organizer=self.attendee, title=title, date=timezone.localdate() + timedelta(days=days),
+            start_time=start, end_time=end, description='<p>' + 'Long description. ' * 10 + '</p>', city='Albany', state='NY',
+        )
+
+    def test_feeds_list_the_right_events(self):
+        site = self.client.get('/calendar/events.ics')
+        self.assertEqual(site['Content-Type'], 'text/calendar; charset=utf-8')
+        body = site.content.decode()
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+        self.assertIn('SUMMARY:Moonlight\\, Howl', body)
+        self.assertIn(f'DTSTART;VALUE=DATE:{self.all_day.date:%Y%m%d}', body)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split('\r\n')))
+
+        group = self.client.get(reverse('group_calendar', args=[self.group.id])).content.decode()
+        self.assertIn('X-WR-CALNAME:Calendar\\; Group (FURsvp)', group)
+
+        url = reverse('user_calendar', args=[ical.user_feed_token(self.attendee)])
+        mine = self.client.get(url).content.decode()
+        self.assertEqual(mine.count('BEGIN:VEVENT'), 1)
+        self.assertEqual(self.client.get('/calendar/1:forged/events.ics').status_code, 404)
+
+    def test_overnight_event_ends_next_day_in_utc(self):
+        block = ical.render_event(Event.objects.filter(pk=self.event.pk).values(*ical.EVENT_COLUMNS).get())
+        start = timezone.make_aware(datetime.combine(self.event.date, time(22)))
+        self.assertIn(f"DTSTART:{ical.utc_stamp(start)}", block)
+        self.assertIn(f"DTEND:{ical.utc_stamp(start + timedelta(hours=3))}", block)
+
+    def test_etag_revalidation_and_incremental_rebuild(self):
+        first = self.client.get('/calendar/events.ics')
+        with CaptureQueriesContext(connection) as queries:
+            again = self.client.get('/calendar/events.ics', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(len(queries), 0)
+
+        self.all_day.title = 'Renamed'
+        self.all_day.save()
+        with mock.patch('events.ical.render_event', wraps=ical.render_event) as render:
+            changed = self.client.get('/calendar/events.ics', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn('SUMMARY:Renamed', changed.content.decode())
+        # Only the changed event was rendered again
+        self.assertEqual(render.call_count, 1)
+
+    def test_rsvp_updates_the_user_feed(self):
+        url = reverse('user_calendar', args=[ical.user_feed_token(self.attendee)])
+        first = self.client.get(url)
+        RSVP.objects.create(event=self.all_day, user=self.attendee, status='maybe')
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.content.decode().count('BEGIN:VEVENT'), 2)
+
+
+class FakeReceiver(BaseHTTPRequestHandler):
+    """Webhook receiver: records every request and answers with the queued statuses (200 once they run out)"""
+    requests = []
+    statuses = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        FakeReceiver.requests.append((dict(self.headers), body))
+        status = FakeReceiver.statuses.pop(0) if FakeReceiver.statuses else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class WebhookTests(TestCase):
+    databases = {'default', 'queue', 'cache', 'sessions', 'audit'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeReceiver)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        FakeReceiver.requests = []
+        FakeReceiver.statuses = []
+        self.tasks = []
+        patcher = mock.patch('events.webhooks.async_task', side_effect=lambda *args: self.tasks.append(args))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.organizer = User.objects.create_user('hooked', password='x')
+        self.group = Group.objects.create(name='Hooked Group', telegram_webhook_channel='@hooked')
+        self.other = Group.objects.create(name='Other Group')
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/hook'
+        self.endpoint = WebhookEndpoint.objects.create(url=self.url, group=self.group)
+
+    def add_event(self, group=None, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Event.objects.create(
+                group=group or self.group, organizer=self.organizer, title='Hooked Event',
+                date=timezone.localdate() + timedelta(days=3), **kwargs
+            )
+
+    def make_due(self):
+        WebhookDelivery.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+    def test_changes_are_signed_and_sent_in_one_batch(self):
+        event = self.add_event()
+        with self.captureOnCommitCallbacks(execute=True):
+            RSVP.objects.create(event=event, user=self.organizer, status='confirmed')
+            event.status = 'cancelled'
+            event.save()
+        self.assertEqual(webhooks.deliver_to_endpoint(self.endpoint.id), 3)
+
+        self.assertEqual(len(FakeReceiver.requests), 1)
+        headers, body = FakeReceiver.requests[0]
+        self.assertTrue(webhooks.verify_signature(
+            self.endpoint.secret, headers['X-FURsvp-Timestamp'], body, headers['X-FURsvp-Signature']
+        ))
+        self.assertFalse(webhooks.verify_signature('wrong', headers['X-FURsvp-Timestamp'], body, headers['X-FURsvp-Signature']))
+        deliveries = json.loads(body)['deliveries']
+        self.assertEqual([d['type'] for d in deliveries], ['event.created', 'rsvp.changed', 'event.cancelled'])
+        self.assertEqual(deliveries[1]['data']['event'], event.id)
+        self.assertFalse(WebhookDelivery.objects.exclude(status='sent').exists())
+
+    def test_endpoints_only_get_what_they_subscribed_to(self):
+        WebhookEndpoint.objects.create(url=self.url, group=self.other, event_types=['event.cancelled'])
+        self.add_event(group=self.other)
+        self.assertFalse(WebhookDelivery.objects.exists())
+        staff_wide = WebhookEndpoint.objects.create(url=self.url, event_types=['event.created'])
+        self.add_event(group=self.other)
+        self.assertEqual(list(WebhookDelivery.objects.values_list('endpoint_id', flat=True)), [staff_wide.id])
+
+    def test_failed_batches_back_off_then_succeed(self):
+        self.add_event()
+        FakeReceiver.statuses = [500]
+        self.assertEqual(webhooks.deliver_to_endpoint(self.endpoint.id), 0)
+        delivery = WebhookDelivery.objects.get()
+        self.assertEqual((delivery.status, delivery.attempts, delivery.last_error), ('pending', 1, 'HTTP 500'))
+        self.assertGreater(delivery.next_attempt_at, timezone.now() + timedelta(seconds=settings.WEBHOOK_BACKOFF_SECONDS - 5))
+        # Not due yet
+        self.assertEqual(webhooks.deliver_to_endpoint(self.endpoint.id), 0)
+        self.make_due()
+        self.assertEqual(webhooks.deliver_to_endpoint(self.endpoint.id), 1)
+        self.assertEqual(WebhookDelivery.objects.get().attempts, 2)
+
+    def test_gone_disables_the_endpoint(self):
+        self.add_event()
+        FakeReceiver.statuses = [410]
+        webhooks.deliver_to_endpoint(self.endpoint.id)
+        self.endpoint.refresh_from_db()
+        self.assertFalse(self.endpoint.is_active)
+        self.assertEqual(WebhookDelivery.objects.get().status, 'failed')
+        self.add_event()
+        self.assertEqual(WebhookDelivery.objects.count(), 1)
+
+    @override_settings(WEBHOOK_BATCH_SIZE=2)
+    def test_senders_are_limited_per_endpoint(self):
+        for _ in range(5):
+            self.add_event()
+        self.tasks.clear()
+        self.assertEqual(webhooks.drain_webhooks(), 2)
+        self.assertEqual(self.tasks, [(webhooks.SEND_TASK, self.endpoint.id)] * 2)
+        slots = [webhooks.acquire_slot(self.endpoint) for _ in range(3)]
+        self.assertIsNone(slots[2])
+        self.assertEqual(webhooks.deliver_to_endpoint(self.endpoint.id), 0)
+        state_cache.delete(slots[0])
+        self.assertEqual(webhooks.deliver_to_endpoint(self.endpoint.id), 5)
+        self.assertEqual(len(FakeReceiver.requests), 3)
+
+    def test_new_events_are_announced_on_telegram(self):
+        event = self.add_event()
+        message = OutboundMessage.objects.get()
+        self.assertEqual(message.chat_id, '@hooked')
+        self.assertIn(event.get_absolute_url(), message.text)
+
+    def test_only_the_members_own_rsvp_is_announced(self):
+        event = self.add_event()
+        OutboundMessage.objects.all().delete()
+        member = User.objects.create_user('rsvper', password='x')
+        with self.captureOnCommitCallbacks(execute=True):
+            rsvp = RSVP.objects.create(event=event, user=member, status='waitlisted')
+            rsvp.status = 'confirmed'
+            rsvp.save()
+        self.assertFalse(OutboundMessage.objects.exists())
+
+        self.client.force_login(member)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('event_detail', args=[event.id]), {'status': 'maybe'})
+        self.assertIn("rsvper RSVP'd as *Maybe*", OutboundMessage.objects.get().text)
+
+
+@override_settings(RATE_LIMITS={'html': (2, 60, 2), 'api': (3, 60, 3), 'api_user': (5, 60, 5), 'telegram_webhook': (1, 60, 1)})
+class RateLimitTests(TestCase):
+    databases = {'default', 'cache', 'sessions'}
+
+    def setUp(self):
+        cache.clear()
+        self.member = User.objects.create_user('limited', password='x')
+
+    def test_anonymous_pages_get_retry_after(self):
+        self.assertEqual(self.client.get('/group/').status_code, 200)
+        self.assertEqual(self.client.get('/events/').status_code, 200)
+        limited = self.client.get('/group/')
+        self.assertEqual(limited.status_code, 429)
+        self.assertGreaterEqual(int(limited['Retry-After']), 1)
+        # Another client still has its own budget, and members aren't limited
+        self.assertEqual(self.client.get('/group/', REMOTE_ADDR='10.0.0.2').status_code, 200)
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.get('/group/').status_code, 200)
+        self.assertEqual(ratelimit.counters()['html'], {'allowed': 3, 'limited': 1})
+
+    def test_proxied_clients_are_told_apart(self):
+        for _ in range(2):
+            self.client.get('/group/', REMOTE_ADDR='127.0.0.1', HTTP_X_REAL_IP='203.0.113.1')
+        self.assertEqual(self.client.get('/group/', REMOTE_ADDR='127.0.0.1', HTTP_X_REAL_IP='203.0.113.1').status_code, 429)
+        self.assertEqual(self.client.get('/group/', REMOTE_ADDR='127.0.0.1', HTTP_X_REAL_IP='203.0.113.2').status_code, 200)
+
+    def test_api_budgets(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get('/api/events/').status_code, 200)
+        limited = self.client.get('/api/events/')
+        self.assertEqual(limited.status_code, 429)
+        self.assertIn('Retry-After', limited)
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.get('/api/events/').status_code, 200)
+
+    def test_bucket_is_spent_in_one_conditional_update(self):
+        bucket = ratelimit.TokenBucket('test', 2, 60)
+        self.assertEqual([bucket.consume(), bucket.consume()], [0.0, 0.0])
+        with CaptureQueriesContext(connections['cache']) as queries:
+            self.assertGreater(bucket.consume(), 0)
+        # The refused UPDATE changed nothing; the bucket is only read to compute the wait
+        self.assertTrue(queries[0]['sql'].startswith('UPDATE'))
+        self.assertLess(RateLimitBucket.objects.get().tokens, 1)
+        RateLimitBucket.objects.update(expires=0)
+        self.assertEqual(ratelimit.purge_idle_buckets(), 1)
+        self.assertEqual(bucket.consume(), 0.0)
+
+    @override_settings(TELEGRAM_WEBHOOK_SECRET='hook-secret')
+    def test_telegram_webhook_budget(self):
+        # Telegram's own calls come from a shared pool of addresses and are never limited
+        for _ in range(3):
+            self.assertEqual(self.client.get('/telegram/bot/', HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='hook-secret').status_code, 200)
+        self.assertEqual(self.client.get('/telegram/bot/').status_code, 200)
+        self.assertEqual(self.client.get('/telegram/bot/', HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='guess').status_code, 429)
+        out = StringIO()
+        call_command('rate_limit_stats', stdout=out)
+        self.assertRegex(out.getvalue(), r'telegram_webhook\s+1/60s\+1\s+1\s+1')
+
+
+class ExportTests(TestCase):
+    databases = {'default', 'cache', 'sessions', 'audit', 'archive'}
+
+    def setUp(self):
+        self.organizer = User.objects.create_user('exporter', password='x')
+        self.guest = User.objects.create_user('guest', password='x')
+        self.group = Group.objects.create(name='Export Group')
+        GroupRole.objects.create(group=self.group, user=self.organizer, can_post=True)
+        self.event = Event.objects.create(
+            group=self.group, organizer=self.organizer, title='Export Night', date=timezone.localdate() + timedelta(days=4),
+            enable_rsvp_questions=True, question1_text='Dietary needs?',
+        )
+        RSVP.objects.create(event=self.event, user=self.guest, status='confirmed', question1='=HYPERLINK("x")')
+        RSVP.objects.create(event=self.event, user=self.organizer, status='waitlisted', question1='None')
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_rsvp_export_has_answers_and_is_organizer_only(self):
+        url = reverse('export_rsvps', args=[self.event.id])
+        self.client.force_login(self.guest)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.organizer)
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = self.content(response).lstrip('\ufeff').splitlines()
+        self.assertEqual(lines[0], 'name,username,telegram,status,rsvp_at,Dietary needs?')
+        # Answers can't turn into spreadsheet formulas
+        self.assertTrue(lines[1].startswith('guest,guest,,Confirmed,'))
+        self.assertTrue(lines[1].endswith(',"\'=HYPERLINK(""x"")"'))
+
+        rows = [json.loads(line) for line in self.content(self.client.get(url + '?format=jsonl')).splitlines()]
+        self.assertEqual([row['status'] for row in rows], ['Confirmed', 'Waitlisted'])
+        self.assertEqual(rows[0]['answer1'], '=HYPERLINK("x")')
+        self.assertEqual(self.client.get(url + '?format=xml').status_code, 400)
+
+    def test_group_event_export_counts_rsvps(self):
+        Event.objects.create(group=self.group, organizer=self.organizer, title='Quiet Night', date=timezone.localdate())
+        url = reverse('export_group_events', args=[self.group.id])
+        self.client.force_login(self.guest)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.organizer)
+        response = self.client.get(url + '?format=jsonl')
+        with CaptureQueriesContext(connection) as queries:
+            rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([(row['title'], row['confirmed'], row['waitlisted']) for row in rows], [('Export Night', 1, 1), ('Quiet Night', 0, 0)])
+        self.assertTrue(rows[0]['url'].endswith(f'/event/{self.event.id}/'))
+        # One query for the events and one for the counts of the chunk
+        self.assertEqual(len(queries), 2)
+
+    def test_audit_export_resolves_names_and_filters(self):
+        AuditLog.log_action(self.organizer, 'event_created', 'Created Export Night', event=self.event, group=self.group, user_agent='')
+        AuditLog.log_action(self.organizer, 'user_banned', 'Banned guest', target_user=self.guest, user_agent='')
+        url = reverse('export_audit_log')
+        self.client.force_login(self.organizer)
+        self.assertNotEqual(self.client.get(url).status_code, 200)
+
+        admin = User.objects.create_superuser('auditor', password='x')
+        self.client.force_login(admin)
+        rows = [json.loads(line) for line in self.content(self.client.get(url + '?format=jsonl')).splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual((rows[0]['action'], rows[0]['target_user']), ('User Banned', 'guest'))
+        self.assertEqual((rows[1]['group'], rows[1]['event']), ('Export Group', 'Export Night'))
+        filtered = self.content(self.client.get(url + '?audit_action_filter=event_created')).lstrip('\ufeff').splitlines()
+        self.assertEqual(len(filtered), 2)
+        self.assertIn('Created Export Night', filtered[1])
+
+    def test_archived_events_are_exported(self):
+        AuditLog.log_action(self.organizer, 'event_created', 'Created Export Night', event=self.event, group=self.group, user_agent='')
+        archive.archive_events([self.event.id])
+        self.client.force_login(self.organizer)
+        url = reverse('export_rsvps', args=[self.event.id])
+        rows = [json.loads(line) for line in self.content(self.client.get(url + '?format=jsonl')).splitlines()]
+        self.assertEqual([(row['username'], row['status']) for row in rows], [('guest', 'Confirmed'), ('exporter', 'Waitlisted')])
+        self.assertEqual(rows[0]['answer1'], '=HYPERLINK("x")')
+
+        url = reverse('export_group_events', args=[self.group.id])
+        rows = [json.loads(line) for line in self.content(self.client.get(url + '?format=jsonl')).splitlines()]
+        self.assertEqual([(row['title'], row['organizer'], row['confirmed'], row['waitlisted']) for row in rows], [('Export Night', 'exporter', 1, 1)])
+
+        rows = list(exports.audit_rows(AuditLog.objects.all()))
+        self.assertEqual(rows[0]['event'], 'Export Night')
+
+
+@override_settings(DELETION_BATCH_SIZE=2)
+class DeletionTests(TestCase):
+    databases = {'default', 'cache', 'sessions', 'audit', 'queue', 'archive'}
+
+    def setUp(self):
+        cache.clear()
+        self.leader = User.objects.create_user('doomed', password='x')
+        self.guests = [User.objects.create_user(f'guest{i}', password='x') for i in range(5)]
+        self.group = Group.objects.create(name='Doomed Group')
+        GroupRole.objects.create(group=self.group, user=self.leader, can_post=True)
+        self.events = [
+            Event.objects.create(group=self.group, organizer=self.leader, title=f'Doomed {i}', date=timezone.localdate() + timedelta(days=i))
+            for i in range(3)
+        ]
+        for event in self.events:
+            for guest in self.guests:
+                RSVP.objects.create(event=event, user=guest, status='confirmed')
+        self.audit = AuditLog.log_action(self.leader, 'event_created', 'Created', event=self.events[0], group=self.group, user_agent='')
+
+    def test_group_cascade_runs_in_batches(self):
+        rsvp_ids = list(RSVP.objects.values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            job = deletion.start(Group.objects.filter(pk=self.group.pk), 'group', self.leader)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['deleted'], 1 + 3 + 15 + 1)
+        self.assertFalse(Group.objects.exists() or Event.objects.exists() or RSVP.objects.exists() or GroupRole.objects.exists())
+        rsvp_deletes = [q['sql'] for q in queries if q['sql'].startswith('DELETE FROM "events_rsvp"')]
+        # 15 RSVPs two at a time, never all of an event's at once
+        self.assertGreaterEqual(len(rsvp_deletes), 8)
+        # The bulk hooks did what the delete signals would have
+        self.assertEqual(Change.objects.filter(kind='rsvp', deleted=True, object_id__in=rsvp_ids).count(), 15)
+        self.assertEqual(Change.objects.filter(kind='event', deleted=True).count(), 3)
+        self.audit.refresh_from_db()
+        self.assertIsNone(self.audit.event_id)
+        self.assertIsNone(self.audit.group_id)
+
+    def test_bulk_deleted_rsvps_are_sent_to_webhooks(self):
+        WebhookEndpoint.objects.create(url='http://127.0.0.1:9/hook', group=self.group, event_types=['rsvp.changed'])
+        rsvp = RSVP.objects.filter(event=self.events[0]).order_by('pk').first()
+        with mock.patch('events.webhooks.async_task'), self.captureOnCommitCallbacks(execute=True):
+            deletion.start(Event.objects.filter(pk=self.events[0].pk), 'event', self.leader)
+        deliveries = WebhookDelivery.objects.filter(event_type='rsvp.changed')
+        self.assertEqual(deliveries.count(), 5)
+        data = deliveries.order_by('pk').first().payload['data']
+        self.assertEqual((data['id'], data['event'], data['deleted']), (rsvp.id, self.events[0].id, True))
+        self.assertEqual(data['user']['display_name'], rsvp.user.username)
+
+    @override_settings(DELETION_INLINE_LIMIT=5)
+    def test_big_cascades_run_as_jobs_with_progress(self):
+        with mock.patch('events.deletion.async_task') as async_task:
+            job = deletion.start(Event.objects.filter(pk=self.events[0].pk), 'event', self.leader)
+        self.assertEqual(job['status'], 'queued')
+        self.assertTrue(Event.objects.filter(pk=self.events[0].pk).exists())
+        url = reverse('deletion_status', args=[job['id']])
+        self.client.force_login(self.guests[0])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        deletion.run_job(*async_task.call_args.args[1:])
+        self.client.force_login(self.leader)
+        self.assertEqual(self.client.get(url).json(), {
+            'id': job['id'], 'label': 'event', 'status': 'done', 'deleted': 6, 'error': '',
+        })
+        self.assertEqual(RSVP.objects.count(), 10)
+
+    def test_account_deletion(self):
+        victim = self.guests[0]
+        BannedUser.objects.create(user=self.guests[1], group=self.group, banned_by=victim)
+        self.client.force_login(victim)
+        self.client.post(reverse('profile'), {'delete_account': '1'})
+        self.assertFalse(User.objects.filter(pk=victim.pk).exists())
+        self.assertFalse(RSVP.objects.filter(user_id=victim.pk).exists())
+        self.assertFalse(Profile.objects.filter(user_id=victim.pk).exists())
+        self.assertFalse(BannedUser.objects.exists())
+        self.assertEqual(RSVP.objects.count(), 12)
+
+
+class ArchiveTests(TestCase):
+    databases = {'default', 'cache', 'sessions', 'audit', 'archive'}
+
+    def setUp(self):
+        cache.clear()
+        self.leader = User.objects.create_user('archivist', password='x')
+        self.guest = User.objects.create_user('attendee', password='x')
+        self.group = Group.objects.create(name='Archive Group')
+        today = timezone.localdate()
+        self.old = Event.objects.create(group=self.group, organizer=self.leader, title='Long Ago', date=today - timedelta(days=10))
+        self.recent = Event.objects.create(group=self.group, organizer=self.leader, title='Yesterday', date=today - timedelta(days=1))
+        self.upcoming = Event.objects.create(group=self.group, organizer=self.leader, title='Soon', date=today + timedelta(days=3))
+        for event in (self.old, self.recent, self.upcoming):
+            RSVP.objects.create(event=event, user=self.guest, status='confirmed')
+        self.old_rsvp = RSVP.objects.create(event=self.old, name='Walk-in', status='maybe')
+
+    def test_moves_old_events_with_their_rsvps(self):
+        self.assertEqual(archive.archive_old_events(), 1)
+        self.assertFalse(Event.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(RSVP.objects.filter(event_id=self.old.pk).exists())
+        self.assertEqual(set(Event.objects.values_list('pk', flat=True)), {self.recent.pk, self.upcoming.pk})
+        archived = ArchivedEvent.objects.get(pk=self.old.pk)
+        self.assertEqual((archived.title, archived.group_id, archived.confirmed_count), ('Long Ago', self.group.pk, 1))
+        self.assertEqual(archived.rsvps.count(), 2)
+        self.assertTrue(ArchivedRSVP.objects.filter(pk=self.old_rsvp.pk, event_date=self.old.date).exists())
+        self.assertTrue(Change.objects.filter(kind='event', object_id=self.old.pk, deleted=True).exists())
+        # Running again finds nothing left to do
+        self.assertEqual(archive.archive_old_events(), 0)
+
+    def test_history_stays_readable(self):
+        archive.archive_old_events()
+        self.assertEqual([e.title for e in self.group.get_past_events()], ['Yesterday', 'Long Ago'])
+        self.assertEqual([e.title for e in self.group.get_past_events(limit=1)], ['Yesterday'])
+        response = self.client.get(reverse('event_detail', args=[self.old.pk]))
+        self.assertContains(response, 'Long Ago')
+        self.assertTemplateUsed(response, 'events/archived_event_detail.html')
+        self.assertEqual([r.event.title for r in archive.user_history(self.guest)], ['Long Ago'])
+        self.client.force_login(self.guest)
+        self.assertContains(self.client.get(reverse('profile')), 'Long Ago')
+
+    def test_deleting_a_user_or_group_clears_their_archive(self):
+        archive.archive_old_events()
+        guest_id = self.guest.pk
+        self.guest.delete()
+        self.assertFalse(ArchivedRSVP.objects.filter(user_id=guest_id).exists())
+        self.assertEqual(ArchivedRSVP.objects.count(), 1)
+        self.group.delete()
+        self.assertFalse(ArchivedEvent.objects.exists())
+
+
+class AuditWriterTests(TestCase):
+    databases = {'default', 'cache', 'sessions', 'audit', 'queue'}
+
+    def setUp(self):
+        cache.clear()
+        self.organizer = User.objects.create_user('auditee', password='x')
+        self.group = Group.objects.create(name='Audit Group')
+        self.event = Event.objects.create(
+            group=self.group, organizer=self.organizer, title='Audit Night', date=date(2030, 5, 1),
+            start_time=time(18, 0), end_time=time(21, 0), description='<p>' + 'Long description. ' * 40 + '</p>',
+        )
+
+    @override_settings(AUDIT_WRITE_BEHIND=True)
+    def test_entries_are_written_in_batches(self):
+        with mock.patch('users.audit.start_writer'):
+            first = AuditLog.log_action(self.organizer, 'event_created', 'One', user_agent='')
+            AuditLog.log_action(self.organizer, 'event_updated', 'Two', user_agent='')
+        self.assertIsNone(first.pk)
+        self.assertFalse(AuditLog.objects.exists())
+        with CaptureQueriesContext(connections['audit']) as queries:
+            self.assertEqual(audit.flush(), 2)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('INSERT')]), 1)
+        # Stamped when logged, not when written
+        self.assertEqual(AuditLog.objects.get(description='One').timestamp, first.timestamp)
+        self.assertEqual(audit.flush(), 0)
+
+    @override_settings(AUDIT_WRITE_BEHIND=True, AUDIT_MAX_ATTEMPTS=2)
+    def test_entries_that_keep_failing_are_dropped(self):
+        with mock.patch('users.audit.start_writer'):
+            AuditLog.log_action(self.organizer, 'event_created', 'Doomed', user_agent='')
+        with mock.patch('users.audit.write', side_effect=DatabaseError('audit database is gone')):
+            with self.assertRaises(DatabaseError):
+                audit.flush()
+            with self.assertRaises(DatabaseError), self.assertLogs('users.audit', 'ERROR') as logs:
+                audit.flush()
+        self.assertIn("'Doomed'", logs.output[0])
+        self.assertEqual(audit.flush(), 0)
+
+    def test_edit_records_a_compressed_field_diff(self):
+        self.client.force_login(self.organizer)
+        self.client.post(reverse('edit_event', args=[self.event.pk]), {
+            'title': 'Audit Night Renamed', 'group': self.group.pk, 'date': '2030-05-01',
+            'start_time': '18:00', 'end_time': '21:00', 'description': self.event.description + '<p>More.</p>',
+            'address': '', 'city': '', 'state': '', 'age_restriction': self.event.age_restriction,
+        })
+        entry = AuditLog.objects.get(action='event_updated')
+        changes = entry.additional_data['changes']
+        self.assertEqual(changes['title'], ['Audit Night', 'Audit Night Renamed'])
+        self.assertNotIn('date', changes)
+        old, new = changes['description']
+        self.assertEqual(old['length'], len(self.event.description))
+        self.assertNotEqual(old['sha256'], new['sha256'])
+        with connections['audit'].cursor() as cursor:
+            cursor.execute('SELECT additional_data FROM users_auditlog WHERE id = %s', [entry.pk])
+            stored = bytes(cursor.fetchone()[0])
+        self.assertLess(len(stored), len(json.dumps(entry.additional_data)))
+
+    def test_entries_stored_as_json_text_are_still_read(self):
+        entry = AuditLog.log_action(self.organizer, 'event_created', 'Before', user_agent='')
+        with connections['audit'].cursor() as cursor:
+            cursor.execute(
+                'UPDATE users_auditlog SET additional_data = %s WHERE id = %s', ['{"changes": {"title": ["A", "B"]}}', entry.pk],
+            )
+        entry.refresh_from_db()
+        self.assertEqual(entry.additional_data, {'changes': {'title': ['A', 'B']}})
+
+    def test_rotation_moves_old_months_to_files(self):
+        old = AuditLog.log_action(self.organizer, 'event_created', 'Old news', event=self.event, user_agent='')
+        AuditLog.log_action(self.organizer, 'event_created', 'Current', user_agent='')
+        AuditLog.objects.filter(pk=old.pk).update(timestamp=timezone.now() - timedelta(days=500))
+        with tempfile.TemporaryDirectory() as directory, override_settings(AUDIT_ARCHIVE_DIR=directory):
+            paths = audit.rotate()
+            self.assertEqual(len(paths), 1)
+            with gzip.open(paths[0], 'rt') as rotated:
+                rows = [json.loads(line) for line in rotated]
+            self.assertEqual(os.listdir(directory), [os.path.basename(paths[0])])
+        self.assertEqual([(row['description'], row['event']) for row in rows], [('Old news', 'Audit Night')])
+        self.assertEqual(list(AuditLog.objects.values_list('description', flat=True)), ['Current'])
+        self.assertEqual(audit.rotate(), [])
+
+    def test_failed_rotation_is_not_archived_twice(self):
+        for description in ('First', 'Second'):
+            entry = AuditLog.log_action(self.organizer, 'event_created', description, user_agent='')
+            AuditLog.objects.filter(pk=entry.pk).update(timestamp=timezone.now() - timedelta(days=500))
+        purge = deletion.purge
+
+        def purge_then_fail(queryset, **kwargs):
+            purge(queryset, **kwargs)
+            raise DatabaseError('disk I/O error')
+        with tempfile.TemporaryDirectory() as directory, override_settings(AUDIT_ARCHIVE_DIR=directory, DELETION_BATCH_SIZE=1):
+            with mock.patch('events.deletion.purge', purge_then_fail), self.assertRaises(DatabaseError):
+                audit.rotate()
+            self.assertEqual(os.listdir(directory), [])
+            self.assertEqual(AuditLog.objects.count(), 2)
+            [path] = audit.rotate()
+            with gzip.open(path, 'rt') as rotated:
+                self.assertEqual(sorted(json.loads(line)['description'] for line in rotated), ['First', 'Second'])
+
+
+class AuditSearchTests(TestCase):
+    databases = {'default', 'cache', 'sessions', 'audit'}
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('overseer', password='x')
+        self.banned = User.objects.create_user('rowdy_raccoon', password='x')
+        self.group = Group.objects.create(name='Moonlit Foxes')
+        self.event = Event.objects.create(group=self.group, organizer=self.admin, title='Bowling Bash', date=date(2030, 1, 5))
+        AuditLog.log_action(self.admin, 'user_banned', 'Banned for spamming', target_user=self.banned, group=self.group, user_agent='')
+        AuditLog.log_action(self.admin, 'event_created', 'Created new event', event=self.event, group=self.group, user_agent='')
+        AuditLog.log_action(self.admin, 'banner_updated', 'Changed the site banner', user_agent='')
+
+    def search(self, term):
+        return set(AuditLog.objects.filter(AuditLog.search_filter(term)).values_list('description', flat=True))
+
+    def test_full_text_search(self):
+        self.assertEqual(self.search('spam'), {'Banned for spamming'})
+        self.assertEqual(self.search('raccoon'), {'Banned for spamming'})
+        self.assertEqual(self.search('moonlit'), {'Banned for spamming', 'Created new event'})
+        self.assertEqual(self.search('bowl moon'), {'Created new event'})
+        self.assertEqual(self.search('bowl banner'), set())
+        with CaptureQueriesContext(connections['audit']) as queries:
+            self.search('banner')
+        self.assertIn('MATCH', queries[0]['sql'])
+        self.assertNotIn('LIKE', queries[0]['sql'])
+        AuditLog.objects.filter(action='banner_updated').delete()
+        self.assertEqual(self.search('banner'), set())
+
+    def test_administration_pages_by_keyset(self):
+        for i in range(25):
+            AuditLog.log_action(self.admin, 'other', f'Bulk entry {i}', user_agent='')
+        AuditLog.objects.filter(description='Changed the site banner').update(timestamp=timezone.now() - timedelta(days=30))
+        self.client.force_login(self.admin)
+        url = reverse('administration') + '?tab=audit'
+        first = self.client.get(url)
+        self.assertEqual(len(first.context['audit_logs']), 20)
+        self.assertIsNone(first.context['audit_previous_url'])
+        second = self.client.get(first.context['audit_next_url'])
+        seen = [log.pk for log in first.context['audit_logs'] + second.context['audit_logs']]
+        self.assertEqual(seen, list(AuditLog.objects.order_by('-timestamp', '-id').values_list('pk', flat=True)))
+        self.assertIsNone(second.context['audit_next_url'])
+
+        since = (timezone.localdate() - timedelta(days=1)).isoformat()
+        recent = self.client.get(url + f'&audit_date_from={since}&audit_action_filter=other')
+        self.assertEqual(len(recent.context['audit_logs']), 20)
+        old = self.client.get(url + f'&audit_date_to={(timezone.localdate() - timedelta(days=29)).isoformat()}')
+        self.assertEqual([log.description for log in old.context['audit_logs']], ['Changed the site banner'])
+        self.assertEqual(self.client.get(url + '&audit_cursor=garbage').status_code, 200)
+
+
+class SearchTests(TestCase):
+    databases = {'default', 'cache', 'sessions', 'audit', 'archive'}
+
+    def setUp(self):
+        cache.clear()
+        self.organizer = User.objects.create_user('seeker', password='x')
+        self.group = Group.objects.create(name='Moonlit Foxes', description='<p>Howling at the <strong>moon</strong></p>')
+        self.other = Group.objects.create(name='Sunny Otters', description='Swimming mostly')
+        soon = timezone.localdate() + timedelta(days=7)
+        self.bowling = Event.objects.create(
+            group=self.group, organizer=self.organizer, title='Bowling Night', date=soon, city='Richmond',
+            description='<p>Glow <strong>lanes</strong> and pizza</p>',
+        )
+        self.picnic = Event.objects.create(
+            group=self.other, organizer=self.organizer, title='Picnic', date=soon, city='Norfolk',
+            description='<p>Bring snacks; bowling afterwards maybe</p>',
+        )
+
+    def titles(self, term, **kwargs):
+        return [event.title for event in search.search_events(Event.objects.all(), term, **kwargs)]
+
+    def test_matches_prefixes_of_sanitized_text(self):
+        self.assertEqual(self.titles('bowl', ranked=True), ['Bowling Night', 'Picnic'])
+        self.assertEqual(self.titles('moonl'), ['Bowling Night'])
+        self.assertEqual(self.titles('lanes pizz'), ['Bowling Night'])
+        self.assertEqual(self.titles('norf snack'), ['Picnic'])
+        self.assertEqual(self.titles('strong'), [])
+        self.assertEqual(self.titles('!!!'), [])
+        self.assertEqual([g.name for g in search.search_groups(Group.objects.all(), 'how', ranked=True)], ['Moonlit Foxes'])
+
+    def test_index_follows_changes(self):
+        self.picnic.title = 'Beach Picnic'
+        self.picnic.save()
+        self.assertEqual(self.titles('beach'), ['Beach Picnic'])
+        self.group.name = 'Midnight Wolves'
+        self.group.save()
+        self.assertEqual(self.titles('wolves'), ['Bowling Night'])
+        self.assertEqual(self.titles('moonlit'), [])
+        self.bowling.delete()
+        self.assertEqual(self.titles('bowl'), ['Beach Picnic'])
+        deletion.purge(Group.objects.filter(pk=self.other.pk))
+        self.assertEqual(self.titles('picnic'), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {search.EVENT_TABLE}')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_api_and_pages_use_the_index(self):
+        response = self.client.get('/api/events/search/?q=bowl&fields=id,title')
+        self.assertEqual(response.json()['results'], [
+            {'id': self.bowling.id, 'title': 'Bowling Night'}, {'id': self.picnic.id, 'title': 'Picnic'},
+        ])
+        self.assertEqual(len(self.client.get('/api/events/search/?q=bowl&limit=1').json()['results']), 1)
+        self.assertEqual(self.client.get('/api/events/search/').status_code, 400)
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(reverse('groups_list') + '?search=otter')
+        self.assertEqual([g.name for g in page.context['groups']], ['Sunny Otters'])
+        self.assertTrue(any('MATCH' in q['sql'] for q in queries))
+        self.assertFalse(any('LIKE' in q['sql'] for q in queries))
+        index = self.client.get(reverse('event_index') + '?search=richm')
+        self.assertEqual([e.title for e in index.context['events']], ['Bowling Night'])
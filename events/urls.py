@@ -17,9 +17,15 @@ urlpatterns = [
     path('contact/', views.contact, name='contact'),
     path('group/<int:group_id>/leadership/', manage_group_leadership, name='manage_group_leadership'),
     path('group/', views.groups_list, name='groups_list'),
+    path('group/<int:group_id>/events.ics', views.group_calendar, name='group_calendar'),
+    path('calendar/events.ics', views.site_calendar, name='site_calendar'),
+    path('calendar/<str:token>/events.ics', views.user_calendar, name='user_calendar'),
     path('event/<int:event_id>/rsvp_answers/<int:user_id>/', views.rsvp_answers, name='rsvp_answers'),
+    path('event/<int:event_id>/rsvps/export/', views.export_rsvps, name='export_rsvps'),
+    path('group/<int:group_id>/events/export/', views.export_group_events, name='export_group_events'),
     path('telegram/bot/', telegram_bot_webhook, name='telegram_bot_webhook'),
     path('event/<int:event_id>/rsvp_telegram/', rsvp_telegram, name='rsvp_telegram'),
+    path('deletions/<str:job_id>/', views.deletion_status, name='deletion_status'),
     path('save-location/', views.save_user_location, name='save_user_location'),
     path('blog/', blog, name='blog'),
 ] 
\ No newline at end of file
@@ -1,31 +1,57 @@
 import os
-import requests
 import subprocess
+from django.utils.html import strip_tags
 
-def post_to_telegram_channel(channel, message, parse_mode=None):
+def html_to_text(html):
     """
-    Post a message to a Telegram channel using the Telegram Bot API.
+    Plain-text version of a rich-text description, as served by the API.
+    Args:
+        html (str): Description HTML from the editor.
+    Returns:
+        str: The text with tags removed and non-breaking spaces turned into newlines
+    """
+    text = strip_tags(html) if html else ""
+    return text.replace("&nbsp;", "\n")
+
+def post_to_telegram_channel(channel, message, parse_mode=None, coalesce=False):
+    """
+    Queue a message for a Telegram channel; a django-q worker delivers it.
     Args:
         channel (str): The Telegram channel name (without @) or chat ID.
         message (str): The message to send.
         parse_mode (str, optional): Telegram parse mode (e.g., 'Markdown').
+        coalesce (bool): Merge with other coalesced messages for the channel
+            sent within TELEGRAM_COALESCE_SECONDS.
     Returns:
-        response: The response object from requests.post
+        OutboundMessage: The queued message, or None if there was nothing to send
     """
-    if not channel or not message:
-        return None
-    bot_token = os.environ.get('TELEGRAM_BOT_TOKEN', 'YOUR_TELEGRAM_BOT_TOKEN')
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    payload = {"chat_id": channel, "text": message}
-    if parse_mode:
-        payload["parse_mode"] = parse_mode
-    try:
-        response = requests.post(url, json=payload, timeout=5)
-        response.raise_for_status()
-        return response
-    except Exception as e:
-        # Optionally log the error
-        return None
+    from events.telegram import enqueue_message
+    return enqueue_message(channel, message, parse_mode=parse_mode, coalesce=coalesce)
+
+def copy_model_rows(model, source, target, chunk_size=1000):
+    """
+    Copy every row of a model from one database alias to another in chunks.
+    Args:
+        model: The Django model class to copy.
+        source (str): Database alias to read from.
+        target (str): Database alias to write to.
+        chunk_size (int): Rows fetched and inserted per batch.
+    Returns:
+        int: Number of rows copied
+    """
+    copied = 0
+    batch = []
+    rows = model._base_manager.using(source).order_by('pk').iterator(chunk_size=chunk_size)
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            model._base_manager.using(target).bulk_create(batch, ignore_conflicts=True)
+            copied += len(batch)
+            batch = []
+    if batch:
+        model._base_manager.using(target).bulk_create(batch, ignore_conflicts=True)
+        copied += len(batch)
+    return copied
 
 def get_git_version():
     """
@@ -1,5 +1,5 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Event, RSVP, Post, Group
+from .models import ArchivedEvent, Event, RSVP, Post, Group
 from django.utils import timezone
 from datetime import timedelta, datetime
 from django.contrib.auth.decorators import login_required
@@ -18,12 +18,17 @@ from events.forms import GroupRoleForm
 from django.db.models import Q
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 import calendar
+import hmac
 from django.forms.utils import ErrorList
-from events.utils import post_to_telegram_channel
+from events import deletion, exports, ical, telegram_bot, webhooks
+from events.caching import revalidate, validators_to
+from events.ratelimit import rate_limit
+from events.search import search_events, search_groups
+from users import audit
 from django.urls import reverse
+from django.utils.text import slugify
 import os
 import json
-import requests
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.views.decorators.http import require_GET
 from django.contrib.auth.models import User
@@ -34,6 +39,12 @@ from django.conf import settings
 
 # Create your views here.
 
+# Event fields whose edits are recorded in the audit log
+AUDITED_EVENT_FIELDS = [
+    'title', 'group', 'date', 'start_time', 'end_time', 'address', 'city', 'state', 'age_restriction',
+    'description', 'capacity', 'waitlist_enabled', 'attendee_list_public', 'accessibility_details', 'status',
+]
+
 def get_telegram_feed(channel='', limit=5):
     url = f"https://rss.tabithahanegan.com/telegram/channel/{channel}"
     if url == "https://rss.tabithahanegan.com/telegram/channel/None":
@@ -80,6 +91,7 @@ def get_bluesky_feed(profile='fursvp.org', limit=10):
     return entries
 
 
+@rate_limit('html', anonymous_only=True)
 def home(request):
     # Get sort parameters from request
     sort_by = request.GET.get('sort', 'date')  # Default sort by date
@@ -115,12 +127,7 @@ def home(request):
 
     # Apply search filter
     if search_query:
-        events = events.filter(
-            models.Q(title__icontains=search_query) |
-            models.Q(description__icontains=search_query) |
-            models.Q(city__icontains=search_query) |
-            models.Q(group__name__icontains=search_query)
-        )
+        events = search_events(events, search_query)
 
     # Apply state filter
     if state_filter:
@@ -273,8 +280,14 @@ def home(request):
     # For regular requests, render the full page
     return render(request, 'events/home.html', context)
 
+@rate_limit('html', anonymous_only=True)
 def event_detail(request, event_id):
-    event = get_object_or_404(Event, pk=event_id)
+    event = Event.objects.filter(pk=event_id).first()
+    if event is None:
+        # Old links keep working once the event has moved to the archive
+        archived = get_object_or_404(ArchivedEvent, pk=event_id)
+        group = Group.objects.filter(pk=archived.group_id).first()
+        return render(request, 'events/archived_event_detail.html', {'event': archived, 'group': group})
 
     rsvps = event.rsvps.all().select_related('user__profile')
     
@@ -389,8 +402,8 @@ def event_detail(request, event_id):
             event_group = event.group.name if event.group else None
             event_group_obj = event.group  # Store the group object
             
-            # Delete the event
-            event.delete()
+            # Delete the event, in batches and in the background if it has a big cascade
+            job = deletion.start(Event.objects.filter(pk=event.pk), f'event "{event_title}"', request.user)
             
             # Log the deletion
             AuditLog.log_action(
@@ -407,7 +420,10 @@ def event_detail(request, event_id):
                 }
             )
             
-            messages.success(request, 'Event has been deleted successfully.')
+            if job['status'] == 'done':
+                messages.success(request, 'Event has been deleted successfully.')
+            else:
+                messages.success(request, 'Event is being deleted; it will disappear shortly.')
             return redirect('home')
             
         if event.status == 'cancelled':
@@ -416,36 +432,14 @@ def event_detail(request, event_id):
             
         form = RSVPForm(request.POST, instance=user_rsvp, event=event)
         if form.is_valid():
-            new_status = form.cleaned_data['status']
             rsvp = form.save(commit=False)
             rsvp.event = event
             rsvp.user = request.user
             rsvp.save()
             
             create_notification(request.user, f'Your RSVP status has been updated to {rsvp.get_status_display()!s} for {event.title}.', link=event.get_absolute_url())
-            # Telegram webhook for public RSVP (any status)
-            if event.attendee_list_public and event.group and getattr(event.group, 'telegram_webhook_channel', None):
-                telegram_username = None
-                if hasattr(request.user, 'profile') and getattr(request.user.profile, 'telegram_username', None):
-                    telegram_username = request.user.profile.telegram_username
-                if telegram_username:
-                    mention = f'@{telegram_username}'
-                else:
-                    mention = request.user.get_username() if request.user else 'Someone'
-                date_str = event.date.strftime('%m/%d/%Y') if hasattr(event.date, 'strftime') else str(event.date)
-                event_url = request.build_absolute_uri(event.get_absolute_url())
-                status_emoji = {
-                    'confirmed': '✅',
-                    'waitlisted': '⏳',
-                    'maybe': '❔',
-                    'not_attending': '🚫'
-                }.get(new_status, '')
-                msg = (
-                    f'{status_emoji} {mention} RSVP\'d as *{rsvp.get_status_display()}* for [{event.title}]({event_url}).\n'
-                    f'*Date:* {date_str}\n'
-                    f'*Group:* {event.group.name}'
-                )
-                post_to_telegram_channel(event.group.telegram_webhook_channel, msg, parse_mode="Markdown")
+            # Telegram channel post for public RSVP (any status)
+            webhooks.announce_rsvp(rsvp)
             return redirect('event_detail', event_id=event.id)
         else:
             messages.error(request, f'Error updating RSVP: {form.errors}', extra_tags='admin_notification')
@@ -699,18 +693,6 @@ def create_event(request):
                 }
             )
             
-            # Telegram webhook for new event
-            group = event.group
-            if group and getattr(group, 'telegram_webhook_channel', None):
-                date_str = event.date.strftime('%m/%d/%Y') if hasattr(event.date, 'strftime') else str(event.date)
-                event_url = request.build_absolute_uri(event.get_absolute_url())
-                msg = (
-                    "🎉 *New Event Created!*\n"
-                    f"*Title:* [{event.title}]({event_url})\n"
-                    f"*Date:* {date_str}\n"
-                    f"*Group:* {group.name}"
-                )
-                post_to_telegram_channel(group.telegram_webhook_channel, msg, parse_mode="Markdown")
             return redirect('event_detail', event_id=event.id)
         else:
             # Form is invalid - render with errors but preserve the data
@@ -738,6 +720,8 @@ def edit_event(request, event_id):
             return redirect('event_detail', event_id=event.id)
 
     if request.method == 'POST':
+        # Taken before any field is touched, for the audit log's diff
+        before = audit.snapshot(event, AUDITED_EVENT_FIELDS)
         # Handle the form submission manually to avoid TinyMCE validation issues
         try:
             # Get all the form data
@@ -854,16 +838,6 @@ def edit_event(request, event_id):
             event.save()
             print(f"DEBUG: Event saved with description length: {len(event.description)}")  # Debug log
             
-            # Store old data for comparison
-            old_data = {
-                'title': event.title,
-                'date': event.date.isoformat(),
-                'description': event.description,
-                'capacity': event.capacity,
-                'status': event.status,
-                'group': event.group.name if event.group else None
-            }
-            
             # Log the event update
             AuditLog.log_action(
                 user=request.user,
@@ -873,17 +847,7 @@ def edit_event(request, event_id):
                 event=event,
                 ip_address=request.META.get('REMOTE_ADDR'),
                 user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                additional_data={
-                    'old_data': old_data,
-                    'new_data': {
-                        'title': event.title,
-                        'date': event.date.isoformat(),
-                        'description': event.description,
-                        'capacity': event.capacity,
-                        'status': event.status,
-                        'group': event.group.name if event.group else None
-                    }
-                }
+                additional_data={'changes': audit.diff(before, audit.snapshot(event, AUDITED_EVENT_FIELDS))}
             )
             
             create_notification(request.user, f'Event for {event.title} updated successfully!', link=event.get_absolute_url())
@@ -1003,6 +967,7 @@ def clean_html_content(html_content):
         import html
         return html.escape(html_content)
 
+@rate_limit('html', anonymous_only=True)
 def group_detail(request, group_id):
     group = get_object_or_404(Group, pk=group_id)
     
@@ -1016,7 +981,7 @@ def group_detail(request, group_id):
     
     # Get upcoming and past events
     upcoming_events = group.get_upcoming_events()
-    past_events = group.get_past_events()[:10]  # Limit to 10 most recent past events
+    past_events = group.get_past_events(limit=10)  # 10 most recent, archived ones included
     
     # Check if user can edit this group
     can_edit_group = False
@@ -1248,15 +1213,15 @@ def manage_group_leadership(request, group_id):
         form = GroupRoleForm(group=group)
         return render(request, 'events/leadership_editor.html', {'group': group, 'roles': roles, 'form': form, 'can_manage': can_manage})
 
+@rate_limit('html', anonymous_only=True)
 def groups_list(request):
     search_query = request.GET.get('search', '').strip()
     groups = Group.objects.all()
     if search_query:
-        groups = groups.filter(
-            models.Q(name__icontains=search_query) |
-            models.Q(description__icontains=search_query)
-        )
-    groups = groups.order_by('name')
+        # Best matches first
+        groups = search_groups(groups, search_query, ranked=True)
+    else:
+        groups = groups.order_by('name')
     
     # Clean HTML content for all groups
     for group in groups:
@@ -1277,6 +1242,7 @@ def groups_list(request):
     }
     return render(request, 'events/groups_list.html', context)
 
+@rate_limit('html', anonymous_only=True)
 def event_index(request):
     """Calendar view with all events underneath"""
     # Get year and month from request, default to current
@@ -1333,6 +1299,8 @@ def event_index(request):
         (models.Q(date=now.date()) & models.Q(end_time__gt=now.time())),
         status='active'
     )
+    if search_query:
+        all_events = search_events(all_events, search_query)
     
     # Convert to list for filtering
     all_events = list(all_events)
@@ -1350,14 +1318,6 @@ def event_index(request):
         all_events = [e for e in all_events if e.age_restriction in ['adult', 'mature']]
     # If filter_adult is 'true' or empty, show all events (default behavior)
 
-    # Apply search filter
-    if search_query:
-        all_events = [e for e in all_events if 
-                     search_query.lower() in e.title.lower() or
-                     (e.description and search_query.lower() in e.description.lower()) or
-                     (e.city and search_query.lower() in e.city.lower()) or
-                     (e.group and search_query.lower() in e.group.name.lower())]
-
     # Apply state filter
     if state_filter:
         all_events = [e for e in all_events if e.state and e.state.lower() == state_filter.lower()]
@@ -1598,216 +1558,94 @@ def rsvp_answers(request, event_id, user_id):
     except RSVP.DoesNotExist:
         return JsonResponse({'error': 'RSVP not found'}, status=404)
 
+@login_required
+def export_rsvps(request, event_id):
+    """Stream the event's RSVPs, with question answers, as CSV or JSON lines (?format=jsonl)"""
+    event = Event.objects.filter(pk=event_id).first() or get_object_or_404(ArchivedEvent, pk=event_id)
+    # Same audience as rsvp_answers: the answers are organizer-only
+    if not (event.organizer_id == request.user.pk or request.user.is_superuser):
+        return HttpResponseForbidden('Only the organizer can export RSVPs.')
+    fmt = exports.export_format(request)
+    if fmt is None:
+        return HttpResponse('Unknown export format.', status=400)
+    columns, labels = exports.rsvp_columns(event)
+    filename = f'{slugify(event.title) or "event"}-{event.date:%Y%m%d}-rsvps'
+    return exports.stream(fmt, filename, columns, exports.rsvp_rows(event), labels)
+
+@login_required
+def export_group_events(request, group_id):
+    """Stream every event of the group as CSV or JSON lines (?format=jsonl)"""
+    group = get_object_or_404(Group, pk=group_id)
+    is_leader = request.user.is_superuser or GroupRole.objects.filter(user=request.user, group=group).filter(
+        Q(can_post=True) | Q(can_manage_leadership=True)
+    ).exists()
+    if not is_leader:
+        return HttpResponseForbidden('Only group leaders can export events.')
+    fmt = exports.export_format(request)
+    if fmt is None:
+        return HttpResponse('Unknown export format.', status=400)
+    filename = f'{slugify(group.name) or "group"}-events'
+    return exports.stream(fmt, filename, exports.GROUP_EVENT_COLUMNS, exports.group_event_rows(group))
+
+@login_required
+def deletion_status(request, job_id):
+    """Progress of a background deletion started by this user (see events.deletion)"""
+    job = deletion.get_job(job_id)
+    if job is None or not (request.user.is_superuser or job['requested_by'] == request.user.pk):
+        return JsonResponse({'error': 'Not found'}, status=404)
+    return JsonResponse({key: job[key] for key in ('id', 'label', 'status', 'deleted', 'error')})
+
+def from_telegram(request):
+    """
+    Whether a webhook call carries the secret token the webhook was set up
+    with. Telegram calls from a small shared pool of addresses, so limiting
+    them per address would hold back the bot's own updates; without a
+    configured secret there is no telling Telegram from anyone else.
+    """
+    secret = settings.TELEGRAM_WEBHOOK_SECRET
+    if not secret:
+        return True
+    return hmac.compare_digest(request.META.get('HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN', ''), secret)
+
 @csrf_exempt
+@rate_limit('telegram_webhook', exempt=from_telegram)
 def telegram_bot_webhook(request):
     if request.method != 'POST':
         return JsonResponse({'ok': True})
     try:
-        data = json.loads(request.body)
+        update = json.loads(request.body)
     except Exception:
         return JsonResponse({'ok': False, 'error': 'Invalid JSON'})
-    message = data.get('message', {})
-    chat = message.get('chat', {})
-    chat_id = str(chat.get('id'))
-    text = message.get('text', '')
-
-    from django.utils import timezone
-    today = timezone.now().date()
-
-    def send_telegram_message(chat_id, text, parse_mode=None, reply_markup=None):
-        token = os.environ.get('TELEGRAM_BOT_TOKEN')
-        url = f"https://api.telegram.org/bot{token}/sendMessage"
-        payload = {"chat_id": chat_id, "text": text}
-        if parse_mode:
-            payload["parse_mode"] = parse_mode
-        if reply_markup:
-            payload["reply_markup"] = reply_markup
-        resp = requests.post(url, json=payload)
-        print(resp.text)
-
-    # Try to find a group for this chat_id
-    group = Group.objects.filter(telegram_webhook_channel=chat_id).first()
-
-    # Get Telegram username if available
-    username = None
-    if 'from' in message and message['from'].get('username'):
-        username = message['from']['username']
-    elif 'callback_query' in data and data['callback_query']['from'].get('username'):
-        username = data['callback_query']['from']['username']
-
-    # Handle callback queries for RSVP list, show all groups, and RSVP menu/actions
-    if "callback_query" in data:
-        callback = data["callback_query"]
-        chat_id = callback["message"]["chat"]["id"]
-        data_str = callback["data"]
-        from events.models import RSVP
-        from users.models import Profile
-        # Show all groups
-        if data_str == "show_all_groups":
-            events = Event.objects.filter(date__gte=today).order_by('date')[:10]
-            msg = "<b>Upcoming Events (All Groups)</b>\n\n"
-            keyboard = []
-            if events:
-                for event in events:
-                    url = f"https://{request.get_host()}{event.get_absolute_url()}"
-                    keyboard.append([
-                        {"text": event.title, "callback_data": f"rsvplist_{event.id}"},
-                        {"text": "RSVP", "callback_data": f"rsvp_menu_{event.id}"}
-                    ])
-                    msg += f"• <a href='{url}'>{event.title}</a> — <code>{event.date.strftime('%m/%d/%Y')}</code>\n"
-            else:
-                msg += "No events found."
-            send_telegram_message(chat_id, msg, parse_mode="HTML", reply_markup={"inline_keyboard": keyboard})
-            return JsonResponse({'ok': True})
-        # RSVP menu
-        if data_str.startswith("rsvp_menu_"):
-            event_id = data_str.split("_", 2)[2]
-            try:
-                event = Event.objects.get(id=event_id, date__gte=today)
-            except Event.DoesNotExist:
-                send_telegram_message(chat_id, "Event not found.")
-                return JsonResponse({'ok': True})
-            # Find user by Telegram username
-            user = None
-            if username:
-                try:
-                    profile = Profile.objects.get(telegram_username=username)
-                    user = profile.user
-                except Profile.DoesNotExist:
-                    pass
-            # Check if user already RSVP'd
-            existing_rsvp = RSVP.objects.filter(event=event, user=user).first() if user else None
-            # Check if event is full
-            confirmed_count = RSVP.objects.filter(event=event, status='confirmed').count()
-            is_full = event.capacity is not None and confirmed_count >= event.capacity
-            # Build RSVP options
-            keyboard = []
-            keyboard.append([
-                {"text": "✅ Confirm", "callback_data": f"rsvp_confirm_{event.id}"},
-                {"text": "❔ Maybe", "callback_data": f"rsvp_maybe_{event.id}"},
-                {"text": "🚫 Not Attending", "callback_data": f"rsvp_no_{event.id}"}
-            ])
-            if is_full and event.waitlist_enabled:
-                keyboard.append([{"text": "⏳ Waitlist", "callback_data": f"rsvp_waitlist_{event.id}"}])
-            if existing_rsvp:
-                keyboard.append([{"text": "Remove RSVP", "callback_data": f"rsvp_remove_{event.id}"}])
-            send_telegram_message(chat_id, f"<b>Choose your RSVP status for</b> <i>{event.title}</i>", parse_mode="HTML", reply_markup={"inline_keyboard": keyboard})
-            return JsonResponse({'ok': True})
-        # RSVP actions
-        for status in ["confirm", "maybe", "no", "waitlist", "remove"]:
-            if data_str.startswith(f"rsvp_{status}_"):
-                event_id = data_str.split("_", 2)[2]
-                try:
-                    event = Event.objects.get(id=event_id, date__gte=today)
-                except Event.DoesNotExist:
-                    send_telegram_message(chat_id, "Event not found.")
-                    return JsonResponse({'ok': True})
-                # Find user by Telegram username
-                user = None
-                if username:
-                    try:
-                        profile = Profile.objects.get(telegram_username=username)
-                        user = profile.user
-                    except Profile.DoesNotExist:
-                        send_telegram_message(chat_id, "You must link your Telegram username in your FURsvp profile to RSVP.")
-                        return JsonResponse({'ok': True})
-                if not user:
-                    send_telegram_message(chat_id, "You must link your Telegram username in your FURsvp profile to RSVP.")
-                    return JsonResponse({'ok': True})
-                if status == "remove":
-                    deleted, _ = RSVP.objects.filter(event=event, user=user).delete()
-                    if deleted:
-                        send_telegram_message(chat_id, "Your RSVP has been removed.")
-                    else:
-                        send_telegram_message(chat_id, "You do not have an RSVP for this event.")
-                    return JsonResponse({'ok': True})
-                # Set RSVP status
-                rsvp, created = RSVP.objects.get_or_create(event=event, user=user, defaults={'status': status if status != 'no' else 'not_attending'})
-                if not created:
-                    if status == 'waitlist':
-                        rsvp.status = 'waitlisted'
-                    elif status == 'maybe':
-                        rsvp.status = 'maybe'
-                    elif status == 'no':
-                        rsvp.status = 'not_attending'
-                    else:
-                        rsvp.status = 'confirmed'
-                    rsvp.save()
-                send_telegram_message(chat_id, f"Your RSVP status for <b>{event.title}</b> is now <b>{'Waitlisted' if status == 'waitlist' else status.capitalize() if status != 'no' else 'Not Attending'}</b>.", parse_mode="HTML")
-                return JsonResponse({'ok': True})
-        # RSVP list (unchanged)
-        if data_str.startswith("rsvplist_"):
-            event_id = data_str.split("_", 1)[1]
-            if group:
-                event = Event.objects.filter(id=event_id, group=group, date__gte=today).first()
-            else:
-                event = Event.objects.filter(id=event_id, date__gte=today).first()
-            if not event:
-                send_telegram_message(chat_id, "Event not found.")
-            else:
-                show_all = bool(group)
-                if not show_all and not event.attendee_list_public:
-                    send_telegram_message(chat_id, "The group organizer has hidden RSVPs from the public view.")
-                else:
-                    rsvps = RSVP.objects.filter(event=event, status='confirmed')
-                    names = [r.user.profile.get_display_name() if r.user and hasattr(r.user, 'profile') else (r.user.username if r.user else r.name or 'Anonymous') for r in rsvps]
-                    if names:
-                        msg = f"<b>RSVP'd Users for</b> <i>{event.title}</i>\n\n" + "\n".join([f"• {name}" for name in names])
-                    else:
-                        msg = f"<b>RSVP'd Users for</b> <i>{event.title}</i>\n\n<em>No RSVPs yet.</em>"
-                    send_telegram_message(chat_id, msg, parse_mode="HTML")
-            return JsonResponse({'ok': True})
-
-    if text.startswith('/event'):
-        parts = text.split()
-        if len(parts) == 1:
-            # List upcoming events for this group if found, else all
-            if group:
-                events = Event.objects.filter(group=group, date__gte=today).order_by('date')[:10]
-            else:
-                events = Event.objects.filter(date__gte=today).order_by('date')[:10]
-            msg = "<b>Upcoming Events</b>\n\n"
-            keyboard = []
-            if events:
-                for event in events:
-                    url = f"https://{request.get_host()}{event.get_absolute_url()}"
-                    keyboard.append([
-                        {"text": event.title, "callback_data": f"rsvplist_{event.id}"},
-                        {"text": "RSVP", "callback_data": f"rsvp_menu_{event.id}"}
-                    ])
-                    msg += f"• <a href='{url}'>{event.title}</a> — <code>{event.date.strftime('%m/%d/%Y')}</code>\n"
-            else:
-                msg += "No events found for this group."
-            # Always add the Show All Groups button if in a group
-            if group:
-                keyboard.append([{"text": "Show All Groups", "callback_data": "show_all_groups"}])
-            reply_markup = {"inline_keyboard": keyboard}
-            send_telegram_message(chat_id, msg, parse_mode="HTML", reply_markup=reply_markup)
-        else:
-            event_id = parts[1]
-            if group:
-                event = Event.objects.filter(id=event_id, group=group, date__gte=today).first()
-            else:
-                event = Event.objects.filter(id=event_id, date__gte=today).first()
-            if not event:
-                send_telegram_message(chat_id, "No event found.")
-            else:
-                url = f"https://{request.get_host()}{event.get_absolute_url()}"
-                msg = f"<b>{event.title}</b>\nDate: <code>{event.date.strftime('%m/%d/%Y')}</code>\n<a href='{url}'>View Event</a>\n\n{event.description or ''}"
-                send_telegram_message(chat_id, msg, parse_mode="HTML")
 
-    return JsonResponse({'ok': True})
+    # Telegram redelivers updates it thinks we missed; handle each one once
+    if not telegram_bot.claim_update(update):
+        return JsonResponse({'ok': True})
+
+    base_url = f"https://{request.get_host()}"
+    try:
+        if telegram_bot.is_slow(update):
+            # Answer now and let a worker do the write, so a slow database
+            # doesn't turn into Telegram retrying the update
+            telegram_bot.defer_update(update, base_url)
+            return JsonResponse(telegram_bot.acknowledge(update))
+
+        # Returning the Bot API call as the response body saves a request to Telegram
+        response = telegram_bot.handle_update(update, base_url)
+    except Exception:
+        telegram_bot.release_update(update)
+        raise
+    return JsonResponse(response or {'ok': True})
 
 # RSVP by Telegram username endpoint
+@rate_limit('html', anonymous_only=True)
 @require_GET
 @ensure_csrf_cookie
 def rsvp_telegram(request, event_id):
     username = request.GET.get('username')
     if not username:
         return HttpResponse('Missing Telegram username.', status=400)
-    try:
-        profile = Profile.objects.get(telegram_username=username)
-    except Profile.DoesNotExist:
+    profile = Profile.find_by_telegram(username=username)
+    if profile is None:
         return HttpResponse('No user with that Telegram username is registered.', status=404)
     try:
         event = Event.objects.get(id=event_id)
@@ -1819,6 +1657,32 @@ def rsvp_telegram(request, event_id):
         return HttpResponse('You have already RSVP\'d to this event.', status=200)
     return HttpResponse('RSVP successful! You are now confirmed for this event.', status=200)
 
+def calendar_response(request, feed):
+    """Serve a stored .ics feed, or a 304 if the client's copy is current"""
+    if feed is None:
+        return HttpResponse('Calendar not found.', status=404)
+    validators = revalidate(request, feed['etag'], feed['last_modified'])
+    if validators.status_code == 304:
+        return validators
+    return validators_to(HttpResponse(feed['body'], content_type='text/calendar; charset=utf-8'), validators)
+
+@rate_limit('html', anonymous_only=True)
+@require_GET
+def site_calendar(request):
+    return calendar_response(request, ical.site_feed())
+
+@rate_limit('html', anonymous_only=True)
+@require_GET
+def group_calendar(request, group_id):
+    return calendar_response(request, ical.group_feed(group_id))
+
+@rate_limit('html', anonymous_only=True)
+@require_GET
+def user_calendar(request, token):
+    user_id = ical.user_from_feed_token(token)
+    return calendar_response(request, ical.user_feed(user_id) if user_id else None)
+
+@rate_limit('html', anonymous_only=True)
 def blog(request):
     profile = request.GET.get('profile', 'fursvp.org')
     bluesky_feed = get_bluesky_feed(profile=profile, limit=10)
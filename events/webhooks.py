@@ -0,0 +1,365 @@
+"""
+Outbound notifications. Changes to events and RSVPs become notifications
+(event.created, event.updated, event.cancelled, rsvp.changed) that are
+fanned out to two kinds of subscriber: HTTP endpoints registered as
+WebhookEndpoint rows, and each group's Telegram announcement channel.
+
+HTTP notifications are queued as WebhookDelivery rows and sent by django-q
+tasks. The notifications due for an endpoint go out together in one signed
+POST; failed requests are retried with exponential backoff, and at most
+max_concurrency requests are in flight to an endpoint at once.
+
+Each POST carries a JSON body {"deliveries": [{"id", "type", "created_at",
+"data"}, ...]} and the headers
+    X-FURsvp-Timestamp: <unix seconds>
+    X-FURsvp-Signature: sha256=<hex HMAC-SHA256 of "<timestamp>.<body>" keyed with the endpoint secret>
+Receivers should check the signature with verify_signature() or its
+equivalent and treat delivery ids as idempotency keys, since a delivery can
+arrive more than once. Answering 410 Gone disables the endpoint.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from django_q.models import Schedule
+from django_q.tasks import async_task
+
+from events.caching import bump_version, cached, state_cache
+from events.models import Event, RSVP, WebhookDelivery, WebhookEndpoint
+from events.serializers import EventSerializer, RSVPSerializer
+from events.utils import post_to_telegram_channel
+
+logger = logging.getLogger(__name__)
+
+DRAIN_TASK = 'events.webhooks.drain_webhooks'
+SEND_TASK = 'events.webhooks.deliver_to_endpoint'
+SIGNATURE_HEADER = 'X-FURsvp-Signature'
+TIMESTAMP_HEADER = 'X-FURsvp-Timestamp'
+RSVP_STATUS_EMOJI = {
+    'confirmed': '✅',
+    'waitlisted': '⏳',
+    'maybe': '❔',
+    'not_attending': '🚫',
+}
+
+_local = threading.local()
+
+
+def get_session():
+    """Per-thread pooled session, so batches to the same receiver reuse the connection"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _local.session = session
+    return session
+
+
+def sign(secret, timestamp, body):
+    return hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret, timestamp, body, signature, tolerance=300):
+    """
+    Check a received request's signature header, as a receiver would.
+    Args:
+        timestamp (str): The X-FURsvp-Timestamp header.
+        body (bytes): The raw request body.
+        signature (str): The X-FURsvp-Signature header.
+        tolerance (int): Seconds of clock skew (and replay window) to accept.
+    """
+    try:
+        fresh = abs(time.time() - int(timestamp)) <= tolerance
+    except (TypeError, ValueError):
+        return False
+    return fresh and hmac.compare_digest(f'sha256={sign(secret, timestamp, body)}', signature or '')
+
+
+def active_endpoints():
+    """Every active endpoint; cached until one is saved or deleted"""
+    return cached('webhooks:endpoints', ['webhooks'], lambda: list(WebhookEndpoint.objects.filter(is_active=True)))
+
+
+def notify(event_type, group_id, build_data):
+    """
+    Queue a notification for the endpoints subscribed to it. The data is built
+    straight away, while related rows still exist; the deliveries are only
+    written once the current transaction commits.
+    Args:
+        event_type (str): One of WebhookEndpoint.EVENT_TYPE_CHOICES.
+        group_id (int or callable): Group the change belongs to, or a callable
+            returning it, which is only called if any endpoint is active.
+        build_data (callable): Returns the notification's data; only called
+            when some endpoint wants it.
+    """
+    notify_many(event_type, [(group_id, build_data)])
+
+
+def notify_many(event_type, changes):
+    """notify() for many changes of one type, queued with one bulk insert; changes are (group_id, build_data) pairs"""
+    endpoints = active_endpoints()
+    if not endpoints:
+        return
+    created_at = timezone.now()
+    deliveries = []
+    for group_id, build_data in changes:
+        if callable(group_id):
+            group_id = group_id()
+        wanted = [endpoint for endpoint in endpoints if endpoint.wants(event_type, group_id)]
+        if not wanted:
+            continue
+        payload = {'type': event_type, 'created_at': created_at, 'data': build_data()}
+        deliveries += [
+            WebhookDelivery(endpoint_id=endpoint.id, event_type=event_type, payload=payload, next_attempt_at=created_at)
+            for endpoint in wanted
+        ]
+    if not deliveries:
+        return
+
+    def queue():
+        WebhookDelivery.objects.bulk_create(deliveries)
+        schedule_drain()
+    transaction.on_commit(queue)
+
+
+def event_changed(event, created):
+    """Notify subscribers about a saved event"""
+    if created:
+        event_type = 'event.created'
+    elif event.status == 'cancelled':
+        event_type = 'event.cancelled'
+    else:
+        event_type = 'event.updated'
+    notify(event_type, event.group_id, lambda: EventSerializer(event).data)
+    if created:
+        transaction.on_commit(lambda: announce_event(event))
+
+
+def rsvp_changed(rsvp, deleted=False):
+    """Notify subscribers about a saved or deleted RSVP"""
+    def group_id():
+        return Event.objects.filter(pk=rsvp.event_id).values_list('group_id', flat=True).first()
+
+    def build_data():
+        return {**RSVPSerializer(rsvp).data, 'event': rsvp.event_id, 'deleted': deleted}
+    notify('rsvp.changed', group_id, build_data)
+
+
+# Columns events.deletion reads from RSVP rows before deleting them in bulk
+RSVP_ROW_FIELDS = (
+    'event_id', 'event__group_id', 'user_id', 'user__username',
+    'name', 'timestamp', 'status', 'question1', 'question2', 'question3',
+)
+
+
+def rsvps_deleted(rows):
+    """Notify subscribers about RSVPs removed by a batch delete; rows hold 'id' and RSVP_ROW_FIELDS"""
+    def build_data(row):
+        rsvp = RSVP(id=row['id'], **{field: row[field] for field in RSVP_ROW_FIELDS if '__' not in field})
+        if rsvp.user_id:
+            rsvp.user = User(id=rsvp.user_id, username=row['user__username'])
+        return {**RSVPSerializer(rsvp).data, 'event': rsvp.event_id, 'deleted': True}
+    notify_many('rsvp.changed', [(row['event__group_id'], lambda row=row: build_data(row)) for row in rows])
+
+
+def event_url(event):
+    return settings.SITE_URL.rstrip('/') + event.get_absolute_url()
+
+
+def announce_event(event):
+    """Post a new event to its group's Telegram channel"""
+    group = event.group
+    if not group.telegram_webhook_channel:
+        return
+    msg = (
+        "🎉 *New Event Created!*\n"
+        f"*Title:* [{event.title}]({event_url(event)})\n"
+        f"*Date:* {event.date.strftime('%m/%d/%Y')}\n"
+        f"*Group:* {group.name}"
+    )
+    post_to_telegram_channel(group.telegram_webhook_channel, msg, parse_mode="Markdown")
+
+
+def announce_rsvp(rsvp):
+    """
+    Post a member's RSVP on a public attendee list to the group's Telegram
+    channel. Only the member's own RSVP form calls this; waitlist promotions,
+    bot RSVPs and organizer edits aren't announced as if the member had acted.
+    """
+    event = rsvp.event
+    if not rsvp.user_id or not event.attendee_list_public or not event.group.telegram_webhook_channel:
+        return
+    user = rsvp.user
+    profile = getattr(user, 'profile', None)
+    mention = f'@{profile.telegram_username}' if profile and profile.telegram_username else user.get_username()
+    msg = (
+        f'{RSVP_STATUS_EMOJI.get(rsvp.status, "")} {mention} RSVP\'d as *{rsvp.get_status_display()}* for [{event.title}]({event_url(event)}).\n'
+        f'*Date:* {event.date.strftime("%m/%d/%Y")}\n'
+        f'*Group:* {event.group.name}'
+    )
+    # Bursts of RSVPs are merged into one channel message
+    post_to_telegram_channel(event.group.telegram_webhook_channel, msg, parse_mode="Markdown", coalesce=True)
+
+
+def schedule_drain(at=None):
+    """Make sure a drain_webhooks task will run at (or shortly after) the given time"""
+    if at is None or at <= timezone.now():
+        # Collapse a burst of notifications into one pending task
+        if state_cache.add('webhooks:drain_queued', 1, 30):
+            async_task(DRAIN_TASK)
+        return
+    if state_cache.add(f'webhooks:drain_at:{int(at.timestamp())}', 1, int((at - timezone.now()).total_seconds()) + 60):
+        Schedule.objects.create(func=DRAIN_TASK, schedule_type=Schedule.ONCE, repeats=1, next_run=at)
+
+
+def drain_webhooks():
+    """
+    Start senders for every endpoint with due deliveries, as many as its
+    backlog needs up to its concurrency limit. Runs as a django-q task.
+    Returns:
+        int: Number of sender tasks started
+    """
+    state_cache.delete('webhooks:drain_queued')
+    now = timezone.now()
+    endpoints = {endpoint.id: endpoint for endpoint in active_endpoints()}
+    started = 0
+    due = (
+        WebhookDelivery.objects.filter(status='pending', next_attempt_at__lte=now)
+        .values('endpoint_id').annotate(count=Count('id')).order_by()
+    )
+    for row in due:
+        endpoint = endpoints.get(row['endpoint_id'])
+        if endpoint is None:
+            WebhookDelivery.objects.filter(endpoint_id=row['endpoint_id'], status='pending').update(
+                status='failed', last_error='Endpoint disabled or deleted'
+            )
+            continue
+        senders = min(endpoint.max_concurrency, math.ceil(row['count'] / settings.WEBHOOK_BATCH_SIZE))
+        for _ in range(senders):
+            async_task(SEND_TASK, endpoint.id)
+        started += senders
+
+    next_due = (
+        WebhookDelivery.objects.filter(status='pending', next_attempt_at__gt=now)
+        .order_by('next_attempt_at').values_list('next_attempt_at', flat=True).first()
+    )
+    if next_due:
+        schedule_drain(next_due)
+    return started
+
+
+def acquire_slot(endpoint):
+    """One of the endpoint's max_concurrency sender slots, or None if all are taken"""
+    for slot in range(endpoint.max_concurrency):
+        key = f'webhooks:slot:{endpoint.id}:{slot}'
+        if state_cache.add(key, 1, settings.WEBHOOK_LEASE_SECONDS):
+            return key
+    return None
+
+
+def claim_batch(endpoint):
+    """
+    Lease up to WEBHOOK_BATCH_SIZE due deliveries. Leased rows are pushed
+    WEBHOOK_LEASE_SECONDS into the future, so no other sender picks them up,
+    and come due again by themselves if this sender dies.
+    """
+    now = timezone.now()
+    due = WebhookDelivery.objects.filter(endpoint_id=endpoint.id, status='pending', next_attempt_at__lte=now)
+    ids = list(due.values_list('id', flat=True)[:settings.WEBHOOK_BATCH_SIZE])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    due.filter(id__in=ids).update(lease=token, next_attempt_at=now + timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS))
+    return list(WebhookDelivery.objects.filter(lease=token, status='pending'))
+
+
+def deliver_to_endpoint(endpoint_id):
+    """
+    Send an endpoint's due deliveries in batches until none are left or a
+    request fails. Runs as a django-q task; gives up straight away if the
+    endpoint already has max_concurrency senders.
+    Returns:
+        int: Number of deliveries sent
+    """
+    endpoint = next((endpoint for endpoint in active_endpoints() if endpoint.id == endpoint_id), None)
+    if endpoint is None:
+        return 0
+    slot = acquire_slot(endpoint)
+    if slot is None:
+        return 0
+    delivered = 0
+    try:
+        while batch := claim_batch(endpoint):
+            if not send_batch(endpoint, batch):
+                break
+            delivered += len(batch)
+    finally:
+        state_cache.delete(slot)
+    return delivered
+
+
+def send_batch(endpoint, batch):
+    """
+    POST one batch and record the outcome.
+    Returns:
+        bool: True if the receiver accepted it
+    """
+    body = json.dumps(
+        {'deliveries': [{'id': delivery.id, **delivery.payload} for delivery in batch]},
+        cls=DjangoJSONEncoder, separators=(',', ':'),
+    ).encode()
+    timestamp = str(int(time.time()))
+    headers = {
+        'Content-Type': 'application/json',
+        'User-Agent': 'FURsvp-Webhooks',
+        TIMESTAMP_HEADER: timestamp,
+        SIGNATURE_HEADER: f'sha256={sign(endpoint.secret, timestamp, body)}',
+    }
+    response = None
+    try:
+        response = get_session().post(endpoint.url, data=body, headers=headers, timeout=settings.WEBHOOK_TIMEOUT)
+        error = None if 200 <= response.status_code < 300 else f'HTTP {response.status_code}'
+    except requests.RequestException as e:
+        error = str(e)
+
+    now = timezone.now()
+    pending = WebhookDelivery.objects.filter(id__in=[delivery.id for delivery in batch])
+    if error is None:
+        pending.update(status='sent', sent_at=now, attempts=F('attempts') + 1, last_error='', lease='')
+        return True
+
+    logger.warning('Webhook delivery to %s failed: %s', endpoint.url, error)
+    if response is not None and response.status_code == 410:
+        # The receiver asked us to stop
+        WebhookEndpoint.objects.filter(pk=endpoint.pk).update(is_active=False)
+        bump_version('webhooks')
+        pending.update(status='failed', attempts=F('attempts') + 1, last_error=error, lease='')
+        return False
+
+    last_attempt = settings.WEBHOOK_MAX_ATTEMPTS - 1
+    pending.filter(attempts__gte=last_attempt).update(status='failed', attempts=F('attempts') + 1, last_error=error, lease='')
+    attempts = min(delivery.attempts for delivery in batch) + 1
+    try:
+        delay = int(response.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        delay = min(settings.WEBHOOK_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.WEBHOOK_MAX_BACKOFF_SECONDS)
+    retry_at = now + timedelta(seconds=delay)
+    if pending.filter(attempts__lt=last_attempt).update(next_attempt_at=retry_at, attempts=F('attempts') + 1, last_error=error, lease=''):
+        schedule_drain(retry_at)
+    return False
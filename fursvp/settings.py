@@ -104,13 +104,91 @@ WSGI_APPLICATION = 'fursvp.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Connection pragmas applied to every new SQLite connection. WAL lets readers
+# keep going while a writer commits, and the busy timeout makes a blocked
+# writer wait for the lock instead of raising "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 10000)),
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32000,  # negative values are KiB, so ~32MB per connection
+    'temp_store': 'MEMORY',
+}
+
+SQLITE_OPTIONS = {
+    'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+    # Take the write lock when the transaction starts rather than upgrading
+    # a read lock mid-transaction, which SQLite cannot retry.
+    'transaction_mode': 'IMMEDIATE',
+}
+
+
+def sqlite_database(filename):
+    return {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': BASE_DIR / filename,
+        'OPTIONS': SQLITE_OPTIONS,
     }
+
+
+# High-churn operational tables live in their own SQLite files so bursts of
+# queue, cache, session and audit writes don't hold the lock the RSVP path
+# needs. Keys are database aliases; values are app labels or
+# 'app_label.model_name' entries routed there by fursvp.routers.WorkloadRouter.
+SQLITE_WORKLOADS = {
+    'cache': ['django_cache', 'events.ratelimitbucket'],
+    'sessions': ['sessions'],
+    'queue': ['django_q', 'events.outboundmessage', 'events.webhookdelivery'],
+    'audit': ['users.auditlog'],
+    # Past events, written once and read for history (see events.archive)
+    'archive': ['events.archivedevent', 'events.archivedrsvp'],
 }
 
+# DATABASE_ENGINE selects the deployment profile: 'sqlite' (default) or 'postgres'
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite').lower()
+
+if DATABASE_ENGINE == 'postgres':
+    POSTGRES_OPTIONS = {}
+    if os.environ.get('POSTGRES_POOL', 'false').lower() == 'true':
+        # psycopg's built-in pool; Django requires CONN_MAX_AGE = 0 with it
+        POSTGRES_OPTIONS['pool'] = {
+            'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('POSTGRES_POOL_MAX_SIZE', 10)),
+        }
+        POSTGRES_CONN_MAX_AGE = 0
+    else:
+        POSTGRES_CONN_MAX_AGE = int(os.environ.get('POSTGRES_CONN_MAX_AGE', 600))
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'fursvp'),
+            'USER': os.environ.get('POSTGRES_USER', 'fursvp'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': POSTGRES_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # Transaction-mode poolers such as PgBouncer can't hold server-side cursors open
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('POSTGRES_PGBOUNCER', 'false').lower() == 'true',
+            'OPTIONS': POSTGRES_OPTIONS,
+            'TEST': {
+                'NAME': os.environ.get('POSTGRES_TEST_DB', 'test_fursvp'),
+            },
+        }
+    }
+    # Postgres has row-level locking, so everything shares one database
+    DATABASE_WORKLOADS = {}
+else:
+    DATABASE_WORKLOADS = SQLITE_WORKLOADS
+    DATABASES = {
+        'default': sqlite_database('db.sqlite3'),
+        **{alias: sqlite_database(f'{alias}.sqlite3') for alias in DATABASE_WORKLOADS},
+    }
+
+DATABASE_ROUTERS = ['fursvp.routers.WorkloadRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -174,12 +252,32 @@ STATICFILES_FINDERS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# Cache configuration
+# Cache configuration. DatabaseCache culls once a table holds MAX_ENTRIES
+# rows (1/CULL_FREQUENCY of them at a time), so each table is sized for
+# what it holds.
 CACHES = {
+    # Rendered API responses, read models and feeds: rebuilt on a miss
     'default': {
         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
         'LOCATION': 'cache_table',
-    }
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES') or 50000),
+            'CULL_FREQUENCY': 10,
+        },
+    },
+    # Version stamps (see events.caching), plus locks, dedupe markers and
+    # counters. A culled stamp is reseeded and orphans everything built on
+    # it, and a culled lock lets a second worker in, so bulk content can't
+    # evict them here. Rate-limit buckets are rows of their own
+    # (events.models.RateLimitBucket), one per client, so they can't either.
+    'state': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'state_cache_table',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_STATE_MAX_ENTRIES') or 200000),
+            'CULL_FREQUENCY': 10,
+        },
+    },
 }
 
 LOGIN_REDIRECT_URL = '/'
@@ -195,11 +293,13 @@ Q_CLUSTER = {
     'recycle': 500,
     'daemonize_workers': False,
     'queue_limit': 50,
-    'orm': 'default',
+    'orm': 'queue' if 'queue' in DATABASES else 'default',
+    # Claims tasks with SKIP LOCKED where the database supports it
+    'broker_class': 'fursvp.brokers.SkipLockedORM',
     'scheduler': [
         {
-            'name': 'events.management.commands.delete_old_events',
-            'func': 'events.management.commands.delete_old_events.Command.handle',
+            'name': 'events.archive.archive_old_events',
+            'func': 'events.archive.archive_old_events',
             'schedule_type': 'I',
             'minutes': 1,
             'args': '()',
@@ -211,12 +311,94 @@ Q_CLUSTER = {
             'fail_silently': False,
             'repeats': -1,
         },
+        {
+            'name': 'users.audit.rotate',
+            'func': 'users.audit.rotate',
+            'schedule_type': 'D',
+            'args': '()',
+            'kwargs': '{}',
+            'q_options': '{}',
+            'cluster': 'default',
+            'hook': None,
+            'catch_up': False,
+            'fail_silently': False,
+            'repeats': -1,
+        },
+        {
+            'name': 'events.ratelimit.purge_idle_buckets',
+            'func': 'events.ratelimit.purge_idle_buckets',
+            'schedule_type': 'H',
+            'args': '()',
+            'kwargs': '{}',
+            'q_options': '{}',
+            'cluster': 'default',
+            'hook': None,
+            'catch_up': False,
+            'fail_silently': False,
+            'repeats': -1,
+        },
     ]
 }
 
 # Telegram Authentication Settings
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
 TELEGRAM_BOT_USERNAME = os.environ.get('TELEGRAM_BOT_USERNAME', '')
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_API_TIMEOUT = float(os.environ.get('TELEGRAM_API_TIMEOUT', 10))
+# secret_token given to setWebhook; webhook calls carrying it skip the rate limit
+TELEGRAM_WEBHOOK_SECRET = os.environ.get('TELEGRAM_WEBHOOK_SECRET', '')
+# Scheme and host used for links in bot replies built outside a web request
+SITE_URL = os.environ.get('SITE_URL', 'https://fursvp.org')
+
+# Outbound sender limits, matching the Bot API's documented ceilings:
+# ~30 messages/second overall, 1/second per private chat, 20/minute per group
+TELEGRAM_GLOBAL_RATE = (30, 1)
+TELEGRAM_PRIVATE_CHAT_RATE = (1, 1)
+TELEGRAM_GROUP_CHAT_RATE = (20, 60)
+# RSVP announcements for a channel within this window go out as one message
+TELEGRAM_COALESCE_SECONDS = int(os.environ.get('TELEGRAM_COALESCE_SECONDS', 15))
+TELEGRAM_MAX_ATTEMPTS = 5
+
+# Outbound webhooks (events.webhooks): notifications due for an endpoint are
+# POSTed together, up to WEBHOOK_BATCH_SIZE per request. Failed requests are
+# retried after WEBHOOK_BACKOFF_SECONDS, doubling each time up to
+# WEBHOOK_MAX_BACKOFF_SECONDS, until WEBHOOK_MAX_ATTEMPTS is reached.
+WEBHOOK_TIMEOUT = float(os.environ.get('WEBHOOK_TIMEOUT', 10))
+WEBHOOK_BATCH_SIZE = 50
+WEBHOOK_MAX_ATTEMPTS = 8
+WEBHOOK_BACKOFF_SECONDS = 30
+WEBHOOK_MAX_BACKOFF_SECONDS = 6 * 3600
+# A sender that dies mid-request gives its batch back after this long
+WEBHOOK_LEASE_SECONDS = 120
+
+# Cascade deletion (events.deletion): dependents are removed this many rows
+# per transaction, and cascades bigger than DELETION_INLINE_LIMIT rows are
+# handed to a background job instead of running in the request.
+DELETION_BATCH_SIZE = 500
+DELETION_INLINE_LIMIT = 2000
+
+# Events move to the archive database this long after they end, in batches
+# of ARCHIVE_BATCH_SIZE (see events.archive)
+ARCHIVE_AFTER_HOURS = 48
+ARCHIVE_BATCH_SIZE = 200
+
+# Audit log entries are buffered per process and written by a background
+# thread (users.audit) in batches of up to AUDIT_BATCH_SIZE, at least every
+# AUDIT_FLUSH_INTERVAL seconds. Set AUDIT_WRITE_BEHIND=false to write each
+# entry as it is logged.
+AUDIT_WRITE_BEHIND = (os.environ.get('AUDIT_WRITE_BEHIND') or 'true').lower() == 'true'
+# Turns AUDIT_WRITE_BEHIND off for manage.py test
+TEST_RUNNER = 'fursvp.test_runner.TestRunner'
+AUDIT_BATCH_SIZE = 100
+AUDIT_FLUSH_INTERVAL = 2
+# Failed writes of an entry before it is dropped and logged instead
+AUDIT_MAX_ATTEMPTS = 5
+# Longer text values in audit diffs are stored as a hash and a preview
+AUDIT_TEXT_LIMIT = 200
+# Whole months kept in the audit database; older ones are rotated out to
+# gzipped JSON-lines files, one per month
+AUDIT_RETENTION_MONTHS = int(os.environ.get('AUDIT_RETENTION_MONTHS') or 12)
+AUDIT_ARCHIVE_DIR = os.environ.get('AUDIT_ARCHIVE_DIR') or str(BASE_DIR / 'audit_archive')
 
 # Authentication backends
 AUTHENTICATION_BACKENDS = [
@@ -231,13 +413,32 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'events.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'events.renderers.ORJSONRenderer',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'events.ratelimit.TokenBucketThrottle',
     ],
 }
 
+# Request rate limits (events.ratelimit): scope -> (requests, per seconds,
+# burst). Budgets are per client IP, or per user where members are limited.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMITS = {
+    # Public pages for visitors who aren't logged in; members are never limited
+    'html': (60, 60, 30),
+    # API calls, anonymous and logged in
+    'api': (120, 60, 60),
+    'api_user': (600, 60, 120),
+    # Webhook calls without TELEGRAM_WEBHOOK_SECRET, i.e. not from Telegram
+    'telegram_webhook': (1200, 60, 300),
+}
+# REMOTE_ADDR values that are our own reverse proxy; the client address is
+# taken from its X-Real-IP header instead
+RATE_LIMIT_TRUSTED_PROXIES = ['127.0.0.1', '::1']
+
 SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': False,
     'LOGIN_URL': None,
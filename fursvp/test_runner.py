@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the test suite with audit entries written as they are logged: the
+    background writer (users.audit) would write outside each test's
+    transaction and leak entries into later tests.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.AUDIT_WRITE_BEHIND = False
@@ -15,10 +15,10 @@ MANAGE_PY="./manage.py"
 "$PYTHON_PATH" "$MANAGE_PY" makemigrations events
 "$PYTHON_PATH" "$MANAGE_PY" makemigrations users
 "$PYTHON_PATH" "$MANAGE_PY" makemigrations
-"$PYTHON_PATH" "$MANAGE_PY" migrate
-"$PYTHON_PATH" "$MANAGE_PY" migrate users
-"$PYTHON_PATH" "$MANAGE_PY" migrate events
-"$PYTHON_PATH" "$MANAGE_PY" createcachetable
+"$PYTHON_PATH" "$MANAGE_PY" migrate_workloads
+"$PYTHON_PATH" "$MANAGE_PY" backfill_telegram_handles
+"$PYTHON_PATH" "$MANAGE_PY" backfill_description_text
+"$PYTHON_PATH" "$MANAGE_PY" backfill_changes
 
 
 echo "Done!"
\ No newline at end of file
@@ -12,6 +12,6 @@ fi
 PYTHON_PATH="python3"
 MANAGE_PY="./manage.py"
 
-"$PYTHON_PATH" "$MANAGE_PY" delete_old_events
+"$PYTHON_PATH" "$MANAGE_PY" archive_old_events
 
 echo "Done!"
\ No newline at end of file
@@ -138,11 +138,17 @@ admin.site.register(User, UserAdmin)
 class AuditLogAdmin(admin.ModelAdmin):
     list_display = ('user', 'action', 'target_user', 'group', 'event', 'timestamp', 'ip_address')
     list_filter = ('action', 'timestamp', 'group', 'event')
-    search_fields = ('user__username', 'target_user__username', 'description', 'group__name', 'event__title')
+    search_fields = ('description',)
     readonly_fields = ('user', 'action', 'description', 'target_user', 'group', 'event', 'ip_address', 'user_agent', 'timestamp', 'additional_data')
     ordering = ('-timestamp',)
     list_per_page = 50
     
+    def get_search_results(self, request, queryset, search_term):
+        # Related names live in the default database and can't be joined
+        if not search_term:
+            return queryset, False
+        return queryset.filter(AuditLog.search_filter(search_term)), False
+
     def has_add_permission(self, request):
         return False  # Prevent manual creation of audit logs
     
@@ -0,0 +1,301 @@
+"""
+Write-behind audit log. AuditLog.log_action() hands its entry to this
+module, which keeps it in a per-process buffer; a writer thread inserts the
+buffer with one bulk_create every AUDIT_FLUSH_INTERVAL seconds, or as soon
+as AUDIT_BATCH_SIZE entries are waiting, so requests never wait on the
+audit database. Whatever is left is written when the process exits.
+
+Entries that fail to be written AUDIT_MAX_ATTEMPTS times in a row are
+dropped and logged, so an unavailable audit database can't grow the
+buffer without bound.
+
+Payloads record what changed rather than whole objects: snapshot() and
+diff() reduce an edit to the fields that differ, with long text replaced by
+its hash, length and a short preview. The audit database holds
+AUDIT_RETENTION_MONTHS whole months; rotate() moves older months out to
+one gzipped JSON-lines file per month in AUDIT_ARCHIVE_DIR.
+
+Each entry's description and the names it involves, as they were when it
+was logged, are kept in its search_text, which a full-text index covers:
+FTS5 on SQLite, a tsvector GIN index on PostgreSQL. See search_filter().
+"""
+import atexit
+import gzip
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+from functools import reduce
+from operator import and_
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Characters of a long text value kept next to its hash
+PREVIEW_CHARS = 80
+
+SEARCH_TABLE = 'users_auditlog_search'
+SEARCH_INDEX_SQL = {
+    'sqlite': [
+        # External content: the index reads the text from users_auditlog
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+            search_text, content='users_auditlog', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )""",
+        f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON users_auditlog BEGIN
+            INSERT INTO {SEARCH_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON users_auditlog BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update AFTER UPDATE OF search_text ON users_auditlog BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+            INSERT INTO {SEARCH_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+        END""",
+    ],
+    'postgresql': [
+        "CREATE INDEX IF NOT EXISTS users_auditlog_search_gin ON users_auditlog USING gin (to_tsvector('simple', search_text))",
+    ],
+}
+
+_pending = []
+_lock = threading.Lock()
+_wake = threading.Event()
+_writer = None
+
+
+def compact(value):
+    """value, or a hash, length and preview of it if it is a long string"""
+    if isinstance(value, str) and len(value) > settings.AUDIT_TEXT_LIMIT:
+        return {
+            'sha256': hashlib.sha256(value.encode()).hexdigest(),
+            'length': len(value),
+            'preview': value[:PREVIEW_CHARS],
+        }
+    return value
+
+
+def snapshot(instance, fields):
+    """The instance's current values of fields; foreign keys by id"""
+    opts = instance._meta
+    return {name: opts.get_field(name).value_from_object(instance) for name in fields}
+
+
+def diff(before, after):
+    """
+    Field-level difference between two snapshot()s.
+    Returns:
+        dict: field -> [old, new] for each changed field, long text compacted
+    """
+    return {
+        name: [compact(before.get(name)), compact(value)]
+        for name, value in after.items()
+        if before.get(name) != value
+    }
+
+
+def log(entry):
+    """Queue an unsaved AuditLog for the writer, or save it now if write-behind is off"""
+    if not settings.AUDIT_WRITE_BEHIND:
+        write([entry])
+        return
+    with _lock:
+        _pending.append(entry)
+        full = len(_pending) >= settings.AUDIT_BATCH_SIZE
+    start_writer()
+    if full:
+        _wake.set()
+
+
+def fill_search_text(entries):
+    """Set search_text on entries without one, looking the names up in bulk"""
+    from events.models import Event, Group
+
+    entries = [entry for entry in entries if not entry.search_text]
+    if not entries:
+        return
+    users = dict(User.objects.filter(
+        id__in={entry.user_id for entry in entries} | {entry.target_user_id for entry in entries}
+    ).values_list('id', 'username'))
+    groups = dict(Group.objects.filter(id__in={entry.group_id for entry in entries}).values_list('id', 'name'))
+    events = dict(Event.objects.filter(id__in={entry.event_id for entry in entries}).values_list('id', 'title'))
+    for entry in entries:
+        names = [users.get(entry.user_id), users.get(entry.target_user_id), groups.get(entry.group_id), events.get(entry.event_id)]
+        entry.search_text = ' '.join(filter(None, [entry.description, *names]))
+
+
+def write(entries):
+    model = type(entries[0])
+    using = router.db_for_write(model)
+    fill_search_text(entries)
+    with transaction.atomic(using=using):
+        model.objects.using(using).bulk_create(entries, batch_size=settings.AUDIT_BATCH_SIZE)
+
+
+def flush():
+    """
+    Write every queued entry now.
+    Returns:
+        int: Entries written
+    """
+    with _lock:
+        batch = _pending[:]
+        del _pending[:]
+    if not batch:
+        return 0
+    try:
+        write(batch)
+    except Exception:
+        # Put them back for the next attempt, ahead of anything queued since,
+        # unless they have already had AUDIT_MAX_ATTEMPTS
+        for entry in batch:
+            entry._write_attempts = getattr(entry, '_write_attempts', 0) + 1
+        dropped = [entry for entry in batch if entry._write_attempts >= settings.AUDIT_MAX_ATTEMPTS]
+        with _lock:
+            _pending[:0] = [entry for entry in batch if entry._write_attempts < settings.AUDIT_MAX_ATTEMPTS]
+        if dropped:
+            logger.error(
+                'Dropped %d audit log entries after %d failed writes: %s', len(dropped), settings.AUDIT_MAX_ATTEMPTS,
+                '; '.join(f'{entry.action} {entry.description!r}' for entry in dropped),
+            )
+        raise
+    return len(batch)
+
+
+def run_writer():
+    failing = False
+    while True:
+        _wake.wait(settings.AUDIT_FLUSH_INTERVAL)
+        _wake.clear()
+        try:
+            flush()
+            failing = False
+        except Exception:
+            # Once per outage rather than every interval
+            if not failing:
+                logger.exception('Writing %d audit log entries failed', len(_pending))
+            failing = True
+            connections.close_all()
+
+
+def start_writer():
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _lock:
+        # Also after a fork, which keeps the module state but not the thread
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=run_writer, name='audit-writer', daemon=True)
+            _writer.start()
+
+
+@atexit.register
+def flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception('Writing %d audit log entries at exit failed', len(_pending))
+
+
+def search_filter(term):
+    """
+    Q matching entries whose search_text has every word of term, each as a
+    word prefix, through the full-text index where the database has one.
+    """
+    from users.models import AuditLog
+
+    words = re.findall(r'[^\W_]+', term)
+    if not words:
+        return Q(search_text__icontains=term)
+    vendor = connections[router.db_for_read(AuditLog)].vendor
+    if vendor == 'sqlite':
+        query = ' '.join(f'"{word}"*' for word in words)
+        return Q(pk__in=RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [query]))
+    if vendor == 'postgresql':
+        query = ' & '.join(f'{word}:*' for word in words)
+        return Q(pk__in=RawSQL("SELECT id FROM users_auditlog WHERE to_tsvector('simple', search_text) @@ to_tsquery('simple', %s)", [query]))
+    return reduce(and_, (Q(search_text__icontains=word) for word in words))
+
+
+def create_search_index(using):
+    """Create the full-text index, and fill in search_text for entries logged before it existed"""
+    from users.models import AuditLog
+
+    connection = connections[using]
+    statements = SEARCH_INDEX_SQL.get(connection.vendor)
+    if not statements:
+        return
+    created = SEARCH_TABLE not in connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+        if created and connection.vendor == 'sqlite':
+            # Index the rows already there; the update trigger keeps up from here
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+    reindex(AuditLog.objects.using(using).filter(search_text=''))
+
+
+def reindex(queryset):
+    """Fill in search_text for the queryset's entries, in batches"""
+    from events import deletion
+
+    for ids in deletion.batches(queryset, settings.AUDIT_BATCH_SIZE):
+        entries = list(queryset.model.objects.using(queryset.db).filter(pk__in=ids))
+        fill_search_text(entries)
+        queryset.model.objects.using(queryset.db).bulk_update(entries, ['search_text'])
+
+
+def month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def rotate(now=None):
+    """
+    Move whole months older than AUDIT_RETENTION_MONTHS out of the database,
+    each to AUDIT_ARCHIVE_DIR/audit-YYYY-MM.jsonl.gz. Runs from the django-q
+    scheduler; does nothing until a month falls due.
+    Returns:
+        list: Paths of the files written
+    """
+    from events import deletion, exports
+    from users.models import AuditLog
+
+    now = timezone.localtime(now or timezone.now())
+    months_back = now.year * 12 + now.month - 1 - settings.AUDIT_RETENTION_MONTHS
+    cutoff = month_start(now).replace(year=months_back // 12, month=months_back % 12 + 1)
+    written = []
+    while True:
+        oldest = AuditLog.objects.filter(timestamp__lt=cutoff).order_by('timestamp').values_list('timestamp', flat=True).first()
+        if oldest is None:
+            return written
+        start = month_start(timezone.localtime(oldest))
+        end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+        month = AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        path = os.path.join(settings.AUDIT_ARCHIVE_DIR, f'audit-{start:%Y-%m}.jsonl.gz')
+        partial = f'{path}.partial'
+        os.makedirs(settings.AUDIT_ARCHIVE_DIR, exist_ok=True)
+        try:
+            with open(partial, 'wb') as raw:
+                if os.path.exists(path):
+                    # Keep entries an earlier run moved out; the new gzip member
+                    # after them reads as one continuous file
+                    with open(path, 'rb') as earlier:
+                        shutil.copyfileobj(earlier, raw)
+                with gzip.open(raw, 'wt', encoding='utf-8') as archive_file:
+                    archive_file.writelines(exports.jsonl_lines(exports.AUDIT_COLUMNS, exports.audit_rows(month)))
+            # The file only takes the month's entries if they are all deleted,
+            # so a run that fails partway leaves nothing to be archived twice
+            with transaction.atomic(using=router.db_for_write(AuditLog)):
+                deletion.purge(month, root=False)
+                os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        written.append(path)
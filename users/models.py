@@ -1,12 +1,63 @@
-from django.db import models
+import json
+import zlib
+
+from django.db import models, router
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, m2m_changed
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.signals import post_save, post_delete, post_migrate, m2m_changed
+from django.core.exceptions import ValidationError
 from django.dispatch import receiver
-from events.models import Group
+from events.models import Group, Event
 from django.utils import timezone
+from users import audit
 
 # Create your models here.
 
+class CompressedJSONField(models.BinaryField):
+    """
+    JSON value stored zlib-compressed in a binary column. PostgreSQL
+    compresses large jsonb values itself, so there the column stays jsonb,
+    which also keeps the JSONField it replaced from needing a type change.
+    Values written before the switch are still JSON text and are read as such.
+    """
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'jsonb'
+        return super().db_type(connection)
+
+    @staticmethod
+    def decode(value):
+        if isinstance(value, (bytes, memoryview)):
+            return json.loads(zlib.decompress(value))
+        if isinstance(value, str):
+            # Legacy JSONField text, or jsonb as PostgreSQL returns it
+            return json.loads(value)
+        return value
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return self.decode(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return self.decode(value)
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return value
+        return zlib.compress(json.dumps(value, cls=DjangoJSONEncoder, separators=(',', ':')).encode())
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if connection.vendor == 'postgresql':
+            return None if value is None else connection.ops.adapt_json_value(value, DjangoJSONEncoder)
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def value_to_string(self, obj):
+        return json.dumps(self.value_from_object(obj), cls=DjangoJSONEncoder)
+
 class AuditLog(models.Model):
     """Audit log for tracking administrative actions and group event activities"""
     ACTION_CHOICES = [
@@ -48,16 +99,21 @@ class AuditLog(models.Model):
         ('other', 'Other'),
     ]
     
-    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='audit_logs', help_text="User who performed the action")
-    target_user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='targeted_audit_logs', help_text="User who was affected by the action")
+    # Audit entries live in their own database (see DATABASE_WORKLOADS), so
+    # these relations can't be enforced there. The post_delete receivers at
+    # the bottom of this module null them out, like SET_NULL would.
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='audit_logs', help_text="User who performed the action")
+    target_user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='targeted_audit_logs', help_text="User who was affected by the action")
     action = models.CharField(max_length=50, choices=ACTION_CHOICES)
     description = models.TextField(help_text="Detailed description of the action")
-    group = models.ForeignKey(Group, on_delete=models.SET_NULL, null=True, blank=True, help_text="Group involved in the action")
-    event = models.ForeignKey('events.Event', on_delete=models.SET_NULL, null=True, blank=True, help_text="Event involved in the action")
+    group = models.ForeignKey(Group, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, help_text="Group involved in the action")
+    event = models.ForeignKey('events.Event', on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, help_text="Event involved in the action")
     ip_address = models.GenericIPAddressField(null=True, blank=True, help_text="IP address of the user who performed the action")
     user_agent = models.TextField(blank=True, help_text="User agent string")
-    timestamp = models.DateTimeField(auto_now_add=True, help_text="When the action occurred")
-    additional_data = models.JSONField(default=dict, blank=True, help_text="Additional data related to the action")
+    # Set when the action happens, not when the writer gets to the entry
+    timestamp = models.DateTimeField(default=timezone.now, help_text="When the action occurred")
+    additional_data = CompressedJSONField(default=dict, blank=True, help_text="Additional data related to the action")
+    search_text = models.TextField(blank=True, editable=False, help_text="Description and the names involved when logged, as indexed for search")
     
     class Meta:
         ordering = ['-timestamp']
@@ -68,6 +124,8 @@ class AuditLog(models.Model):
             models.Index(fields=['action', 'timestamp']),
             models.Index(fields=['group', 'timestamp']),
             models.Index(fields=['target_user', 'timestamp']),
+            # Date ranges and the unfiltered newest-first listing
+            models.Index(fields=['timestamp'], name='users_audit_ts_idx'),
         ]
     
     def __str__(self):
@@ -75,8 +133,12 @@ class AuditLog(models.Model):
     
     @classmethod
     def log_action(cls, user, action, description, target_user=None, group=None, event=None, ip_address=None, user_agent=None, additional_data=None):
-        """Convenience method to create an audit log entry"""
-        return cls.objects.create(
+        """
+        Record an audit log entry. It is written in the background, in a
+        batch with others (see users.audit), so unless AUDIT_WRITE_BEHIND is
+        off the returned entry has no primary key yet.
+        """
+        entry = cls(
             user=user,
             action=action,
             description=description,
@@ -84,9 +146,23 @@ class AuditLog(models.Model):
             group=group,
             event=event,
             ip_address=ip_address,
-            user_agent=user_agent,
+            user_agent=user_agent or '',
             additional_data=additional_data or {}
         )
+        audit.log(entry)
+        return entry
+
+    @classmethod
+    def user_filter(cls, term):
+        """Q matching entries whose acting or target username contains term"""
+        # Users live in the default database, so resolve ids there instead of joining
+        user_ids = list(User.objects.filter(username__icontains=term).values_list('id', flat=True))
+        return models.Q(user_id__in=user_ids) | models.Q(target_user_id__in=user_ids)
+
+    @classmethod
+    def search_filter(cls, term):
+        """Q matching entries by description, usernames, group name or event title, through the full-text index"""
+        return audit.search_filter(term)
 
 class GroupRole(models.Model):
     """Custom hierarchy system for group leadership roles"""
@@ -117,6 +193,7 @@ class Profile(models.Model):
     discord_username = models.CharField(max_length=50, blank=True, null=True)
     telegram_username = models.CharField(max_length=50, blank=True, null=True)
     telegram_id = models.BigIntegerField(blank=True, null=True, unique=True, help_text="Telegram user ID for authentication")
+    telegram_handle = models.CharField(max_length=50, blank=True, null=True, unique=True, editable=False, help_text="Lowercased telegram_username used for lookups")
     can_post_blog = models.BooleanField(default=False, help_text='Can post blog posts')
     is_verified = models.BooleanField(default=False, help_text='Has the user verified their email?')
     verification_token = models.CharField(max_length=64, blank=True, null=True, help_text='Email verification token')
@@ -130,6 +207,56 @@ class Profile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+    @staticmethod
+    def normalize_telegram_handle(username):
+        """Lowercase a Telegram username and drop the leading @, or None if blank"""
+        if not username:
+            return None
+        handle = username.strip().lstrip('@').lower()
+        return handle or None
+
+    @classmethod
+    def find_by_telegram(cls, telegram_id=None, username=None):
+        """
+        Resolve a profile from Telegram identity in a single indexed query.
+        The immutable telegram_id wins over the username, which users can change.
+        """
+        handle = cls.normalize_telegram_handle(username)
+        condition = models.Q()
+        if telegram_id:
+            condition |= models.Q(telegram_id=telegram_id)
+        if handle:
+            condition |= models.Q(telegram_handle=handle)
+        if not condition:
+            return None
+        matches = list(cls.objects.select_related('user').filter(condition)[:2])
+        for profile in matches:
+            if telegram_id and profile.telegram_id == int(telegram_id):
+                return profile
+        return matches[0] if matches else None
+
+    def clean(self):
+        super().clean()
+        handle = self.normalize_telegram_handle(self.telegram_username)
+        if handle and Profile.objects.filter(telegram_handle=handle).exclude(pk=self.pk).exists():
+            raise ValidationError({'telegram_username': 'This Telegram username is already linked to another account.'})
+
+    def save(self, *args, **kwargs):
+        self.telegram_handle = self.normalize_telegram_handle(self.telegram_username)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'telegram_username' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'telegram_handle'}
+        if self.telegram_handle:
+            holders = Profile.objects.filter(telegram_handle=self.telegram_handle).exclude(pk=self.pk)
+            if self.telegram_id:
+                # A handle confirmed through Telegram login takes precedence
+                # over the same name typed into someone else's profile
+                holders.update(telegram_handle=None)
+            elif holders.exists():
+                # Already claimed; forms report this through clean()
+                self.telegram_handle = None
+        super().save(*args, **kwargs)
+
     def get_display_name(self):
         return self.display_name or self.user.username
 
@@ -181,6 +308,9 @@ class BannedUser(models.Model):
         unique_together = ('user', 'group')
         verbose_name = "Banned User"
         verbose_name_plural = "Banned Users"
+        indexes = [
+            models.Index(fields=['user', 'organizer'], name='users_banned_user_org_idx'),
+        ]
 
     def __str__(self):
         if self.group:
@@ -210,6 +340,11 @@ class Notification(models.Model):
         ordering = ['-timestamp']
         verbose_name = "Notification"
         verbose_name_plural = "Notifications"
+        indexes = [
+            # Django emits is_read=False as NOT "is_read", which SQLite can't seek
+            # on, so index the sort order instead and filter is_read while walking it
+            models.Index(fields=['user', '-timestamp'], name='users_notif_user_ts_idx'),
+        ]
 
     def __str__(self):
         return f'Notification for {self.user.username}: {self.message[:50]}...'
@@ -220,8 +355,29 @@ def create_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
+def save_profile(sender, instance, update_fields=None, **kwargs):
+    # A save limited to some User columns (e.g. last_login on every login)
+    # carries no profile changes along with it
+    if update_fields is None:
+        instance.profile.save()
+
+@receiver(post_delete, sender=User)
+def clear_user_audit_references(sender, instance, **kwargs):
+    AuditLog.objects.filter(user_id=instance.pk).update(user=None)
+    AuditLog.objects.filter(target_user_id=instance.pk).update(target_user=None)
+
+@receiver(post_delete, sender=Group)
+def clear_group_audit_references(sender, instance, **kwargs):
+    AuditLog.objects.filter(group_id=instance.pk).update(group=None)
+
+@receiver(post_delete, sender=Event)
+def clear_event_audit_references(sender, instance, **kwargs):
+    AuditLog.objects.filter(event_id=instance.pk).update(event=None)
+
+@receiver(post_migrate)
+def create_audit_search_index(sender, using='default', **kwargs):
+    if sender.name == 'users' and router.allow_migrate_model(using, AuditLog):
+        audit.create_search_index(using)
 
 # Add method to User model to check if banned
 def user_is_banned(self, group=None):
@@ -12,6 +12,7 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('administration/', views.administration, name='administration'),
     path('administration/toggle_admin/', views.toggle_admin_status, name='toggle_admin_status'),
+    path('administration/audit/export/', views.export_audit_log, name='export_audit_log'),
     path('<int:user_id>/ban/', views.ban_user, name='ban_user'),
     path('user_search_autocomplete/', views.user_search_autocomplete, name='user_search_autocomplete'),
     path('notifications/', views.get_notifications, name='get_notifications'),
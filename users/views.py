@@ -6,9 +6,16 @@ from django.contrib.auth.views import LoginView, PasswordResetView, PasswordRese
 from .forms import UserRegisterForm, UserProfileForm, UserGroupManagementForm, UserPermissionForm, AssistantAssignmentForm, UserPublicProfileForm, UserPasswordChangeForm
 from events.models import Group, RSVP, Event
 from events.forms import GroupForm, RenameGroupForm
+from events import archive, deletion, exports, ical
+from events.pagination import KeysetPagination
 from .models import Profile, GroupDelegation, BannedUser, Notification, GroupRole, AuditLog
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import datetime, time, timedelta
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
 from django.views.decorators.http import require_POST, require_GET
 from django.views.decorators.csrf import csrf_protect, ensure_csrf_cookie
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
@@ -240,17 +247,14 @@ def profile(request):
 
         elif 'delete_account' in request.POST:
             user = request.user
-            with transaction.atomic():
-                RSVP.objects.filter(user=user).delete()
-                GroupRole.objects.filter(user=user).delete()
-                GroupDelegation.objects.filter(organizer=user).delete()
-                GroupDelegation.objects.filter(delegated_user=user).delete()
-                BannedUser.objects.filter(user=user).delete()
-                BannedUser.objects.filter(banned_by=user).delete()
-                BannedUser.objects.filter(organizer=user).delete()
-                Notification.objects.filter(user=user).delete()
-                Profile.objects.filter(user=user).delete()
-                user.delete()
+            # Bans the user issued go with them, rather than being kept unattributed
+            BannedUser.objects.filter(banned_by=user).delete()
+            # Everything else cascades, in batches and in the background for
+            # big accounts; the account can't be used again in the meantime
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+            logout(request)
+            deletion.start(User.objects.filter(pk=user.pk), f'account {user.username}')
             messages.success(request, "Fur-well! May your tail always be fluffy and your conventions drama-free! 🐾")
             return redirect('home')
 
@@ -265,6 +269,8 @@ def profile(request):
         'device': device,
         'telegram_bot_username': settings.TELEGRAM_BOT_USERNAME,
         'telegram_login_enabled': settings.TELEGRAM_LOGIN_ENABLED,
+        'calendar_feed_token': ical.user_feed_token(request.user),
+        'event_history': archive.user_history(request.user),
     }
     return render(request, 'users/profile.html', context)
 
@@ -396,6 +402,34 @@ def ban_user(request, user_id):
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': f'An unexpected error occurred: {str(e)}'}, status=500)
 
+def filter_audit_logs(request, audit_logs):
+    """
+    Apply the administration page's audit filters from the query string.
+    Returns:
+        tuple: (filtered queryset, the filter values by parameter name)
+    """
+    filters = {
+        name: request.GET.get(name, '').strip()
+        for name in ('audit_search', 'audit_user_filter', 'audit_action_filter', 'audit_date_from', 'audit_date_to')
+    }
+    if filters['audit_search']:
+        audit_logs = audit_logs.filter(AuditLog.search_filter(filters['audit_search']))
+    if filters['audit_user_filter']:
+        audit_logs = audit_logs.filter(AuditLog.user_filter(filters['audit_user_filter']))
+    if filters['audit_action_filter']:
+        audit_logs = audit_logs.filter(action=filters['audit_action_filter'])
+    # Whole local days, as plain timestamp ranges the indexes can seek on
+    try:
+        date_from = parse_date(filters['audit_date_from'])
+        date_to = parse_date(filters['audit_date_to'])
+    except ValueError:
+        date_from = date_to = None
+    if date_from:
+        audit_logs = audit_logs.filter(timestamp__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        audit_logs = audit_logs.filter(timestamp__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)))
+    return audit_logs, filters
+
 @login_required
 @user_passes_test(lambda u: u.is_superuser or (hasattr(u, 'profile') and getattr(u.profile, 'can_post_blog', False)))
 def administration(request):
@@ -420,8 +454,8 @@ def administration(request):
             params['group_page'] = page
         elif tab == 'audit':
             if page is None:
-                page = request.GET.get('audit_page', 1)
-            params['audit_page'] = page
+                page = request.GET.get('audit_cursor', '')
+            params['audit_cursor'] = page
         elif tab == 'blog':
             if page is None:
                 page = request.GET.get('blog_page', 1)
@@ -515,45 +549,21 @@ def administration(request):
     user_permission_forms = {user_obj.id: UserPermissionForm(user_obj, prefix=f'permission_{user_obj.id}') for user_obj in all_users}
     all_banned_users = BannedUser.objects.all().select_related('user', 'group', 'banned_by', 'organizer').order_by('-banned_at')
 
-    # Get audit log entries with filtering
-    audit_search = request.GET.get('audit_search', '').strip()
-    audit_user_filter = request.GET.get('audit_user_filter', '').strip()
-    audit_action_filter = request.GET.get('audit_action_filter', '').strip()
-    
-    audit_logs = AuditLog.objects.all().select_related('user', 'target_user', 'group', 'event').order_by('-timestamp')
-    
-    # Apply audit log filters
-    if audit_search:
-        audit_logs = audit_logs.filter(
-            Q(description__icontains=audit_search) |
-            Q(user__username__icontains=audit_search) |
-            Q(target_user__username__icontains=audit_search) |
-            Q(group__name__icontains=audit_search) |
-            Q(event__title__icontains=audit_search)
-        )
-    
-    if audit_user_filter:
-        audit_logs = audit_logs.filter(
-            Q(user__username__icontains=audit_user_filter) |
-            Q(target_user__username__icontains=audit_user_filter)
-        )
-    
-    if audit_action_filter:
-        audit_logs = audit_logs.filter(action=audit_action_filter)
-    
-    # Paginate audit logs
-    audit_paginator = Paginator(audit_logs, 20)
-    audit_page = request.GET.get('audit_page', 1)
+    # Audit entries are stored in a separate database, so related objects are
+    # prefetched rather than joined
+    audit_logs, audit_filters = filter_audit_logs(request, AuditLog.objects.prefetch_related('user__profile', 'target_user', 'group', 'event'))
+    # Keyset pages: each one seeks past the last entry of the one before
+    audit_paginator = KeysetPagination()
+    audit_paginator.page_size = 20
+    audit_paginator.page_size_query_param = None
+    audit_paginator.cursor_query_param = 'audit_cursor'
     try:
-        audit_page = int(audit_page)
-        if audit_page < 1:
-            audit_page = 1
-    except (TypeError, ValueError):
-        audit_page = 1
-    try:
-        paginated_audit_logs = audit_paginator.page(audit_page)
-    except (PageNotAnInteger, EmptyPage):
-        paginated_audit_logs = audit_paginator.page(1)
+        paginated_audit_logs = audit_paginator.paginate_queryset(audit_logs.order_by('-timestamp', '-id'), Request(request))
+    except NotFound:
+        # A stale or mangled cursor starts again from the newest entries
+        request.GET = request.GET.copy()
+        request.GET.pop('audit_cursor')
+        paginated_audit_logs = audit_paginator.paginate_queryset(audit_logs.order_by('-timestamp', '-id'), Request(request))
 
     bluesky_posts = []
     bluesky_posts_page = []
@@ -1371,9 +1381,9 @@ def administration(request):
         'user_search': user_search,
         'group_search': group_search,
         'audit_logs': paginated_audit_logs,
-        'audit_search': audit_search,
-        'audit_user_filter': audit_user_filter,
-        'audit_action_filter': audit_action_filter,
+        'audit_previous_url': audit_paginator.get_previous_link(),
+        'audit_next_url': audit_paginator.get_next_link(),
+        **audit_filters,
         'audit_actions': AuditLog.ACTION_CHOICES,
         'banner_enabled': cache.get('banner_enabled', False),
         'banner_text': cache.get('banner_text', ''),
@@ -1390,6 +1400,17 @@ def administration(request):
     # Return the AJAX template (which contains the full page structure)
     return render(request, 'users/administration.html', context)
 
+@login_required
+@user_passes_test(lambda u: u.is_superuser)
+def export_audit_log(request):
+    """Stream the audit log, with the administration page's filters, as CSV or JSON lines (?format=jsonl)"""
+    fmt = exports.export_format(request)
+    if fmt is None:
+        return HttpResponse('Unknown export format.', status=400)
+    audit_logs, _ = filter_audit_logs(request, AuditLog.objects.all())
+    filename = f'audit-log-{timezone.localdate():%Y%m%d}'
+    return exports.stream(fmt, filename, exports.AUDIT_COLUMNS, exports.audit_rows(audit_logs))
+
 @require_POST
 @login_required
 def delete_bluesky_post(request):
@@ -1914,17 +1935,16 @@ def api_user_by_telegram(request):
     username = request.GET.get('username', '').strip()
     if not username:
         return JsonResponse({'error': 'Missing username parameter'}, status=400)
-    try:
-        profile = Profile.objects.get(telegram_username__iexact=username)
-        return JsonResponse({
-            'id': profile.user.id,
-            'username': profile.user.username,
-            'display_name': profile.get_display_name(),
-            'telegram_username': profile.telegram_username,
-            'telegram_id': profile.telegram_id,
-        })
-    except Profile.DoesNotExist:
+    profile = Profile.find_by_telegram(username=username)
+    if profile is None:
         return JsonResponse({'error': 'User not found'}, status=404)
+    return JsonResponse({
+        'id': profile.user.id,
+        'username': profile.user.username,
+        'display_name': profile.get_display_name(),
+        'telegram_username': profile.telegram_username,
+        'telegram_id': profile.telegram_id,
+    })
 
 def approve_all_logged_in_users():
     users = User.objects.exclude(last_login=None)
@@ -1964,11 +1984,14 @@ def toggle_admin_status(request):
         target_user.save()
         
         # Log the action
-        AuditLog.objects.create(
+        AuditLog.log_action(
             user=request.user,
-            action='TOGGLE_ADMIN',
+            action='user_promoted' if target_user.is_superuser else 'user_demoted',
+            description=f"Changed {target_user.username}'s admin status to: {new_status}",
             target_user=target_user,
-            details=f"Changed admin status to: {new_status}"
+            ip_address=request.META.get('REMOTE_ADDR'),
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+            additional_data={'new_status': new_status}
         )
         
         return JsonResponse({